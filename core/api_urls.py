@@ -0,0 +1,30 @@
+# JSON API routes only; core.urls adds the HTML pages on top
+from django.urls import path
+from . import views
+from .views import GroupCreateView, ExpenseCreateView, ExpenseBatchView, GroupExpenseListView, UserSplitListView, GroupBalanceView, UserBalanceView
+
+urlpatterns = [
+    path('', views.api_overview),
+    path('groups/', GroupCreateView.as_view(), name='create-group'),
+    path('expenses/', ExpenseCreateView.as_view(), name='create-expense'),
+    path('expenses/batch/', ExpenseBatchView.as_view(), name='expense-batch'),
+    path('groups/<int:group_id>/balances/', GroupBalanceView.as_view(), name='group-balances'),
+    path('users/<int:user_id>/balances/', UserBalanceView.as_view(), name='user-balances'),
+    path('groups/<int:group_id>/expenses/', GroupExpenseListView.as_view(), name='group-expenses'),
+    path('groups/<int:group_id>/members/', views.GroupMembersView.as_view(), name='group-members'),
+    path('groups/<int:group_id>/settlements/', views.GroupSettlementView.as_view(), name='group-settlements'),
+    path('groups/<int:group_id>/balances/rebuild/', views.GroupRebuildView.as_view(), name='group-rebuild'),
+    path('groups/<int:group_id>/expenses/export/', views.GroupExportView.as_view(), name='group-export'),
+    path('jobs/<int:job_id>/', views.JobDetailView.as_view(), name='job-detail'),
+    path('jobs/<int:job_id>/download/', views.job_download, name='job-download'),
+    path('groups/<int:group_id>/recurring/', views.GroupRecurringExpenseView.as_view(), name='group-recurring'),
+    path('recurring/<int:recurring_id>/', views.RecurringExpenseDetailView.as_view(), name='recurring-detail'),
+    path('groups/<int:group_id>/settlements/settle-all/', views.SettleAllView.as_view(), name='group-settle-all'),
+    path('users/<int:user_id>/splits/', UserSplitListView.as_view(), name='user-splits'),
+    path('async/groups/<int:group_id>/balances/', views.AsyncGroupBalanceView.as_view(), name='async-group-balances'),
+    path('groups/<int:group_id>/balances/stream/', views.GroupBalanceStreamView.as_view(), name='group-balances-stream'),
+    path('async/users/<int:user_id>/balances/', views.AsyncUserBalanceView.as_view(), name='async-user-balances'),
+    path('cache/stats/', views.balance_cache_stats, name='balance-cache-stats'),
+    path('_metrics', views.metrics, name='metrics'),
+    path('analytics/', views.PlatformAnalyticsView.as_view(), name='platform-analytics'),
+]
@@ -0,0 +1,154 @@
+# core/balance_cache.py
+"""Versioned cache for computed balances.
+
+Every group and user has a version token; cached values are stored under
+the current token, and any committed write touching the group or user
+moves the token on, so an outdated value is never read again. Tokens are
+seeded from the clock, so an evicted token can never come back with an
+old value still stored under it. The same tokens make up the ``ETag`` of
+the balance endpoints, and each committed bump is announced through
+:mod:`core.balance_events`.
+
+The backend is the ``BALANCE_CACHE_ALIAS`` entry of ``CACHES``
+(process-local locmem unless configured otherwise).
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+GROUP = 'group'
+USER = 'user'
+
+_stats = {'hits': 0, 'misses': 0, 'invalidations': 0}
+_stats_lock = threading.Lock()
+
+
+def _cache():
+    return caches[getattr(settings, 'BALANCE_CACHE_ALIAS', 'default')]
+
+
+def _timeout():
+    return getattr(settings, 'BALANCE_CACHE_TIMEOUT', 300)
+
+
+def _count(name, n=1):
+    with _stats_lock:
+        _stats[name] += n
+
+
+def stats():
+    with _stats_lock:
+        return dict(_stats)
+
+
+def reset_stats():
+    with _stats_lock:
+        for name in _stats:
+            _stats[name] = 0
+
+
+def _version_key(scope, pk):
+    return f"balances:{scope}:{pk}:version"
+
+
+def get_version(scope, pk):
+    cache = _cache()
+    key = _version_key(scope, pk)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return version
+
+
+async def aget_version(scope, pk):
+    cache = _cache()
+    key = _version_key(scope, pk)
+    version = await cache.aget(key)
+    if version is None:
+        await cache.aadd(key, time.time_ns(), None)
+        version = await cache.aget(key)
+    return version
+
+
+async def aget_versions(scope, pks):
+    """Current versions of ``pks`` in one cache round trip; pks without a version yet are left out."""
+    keys = {_version_key(scope, pk): pk for pk in pks}
+    found = await _cache().aget_many(keys)
+    return {keys[key]: version for key, version in found.items()}
+
+
+def etag(scope, pk, name):
+    """Entity tag for the value cached as ``name``: it changes whenever the value may have."""
+    return f'"{scope}-{pk}-{get_version(scope, pk)}-{name}"'
+
+
+async def aetag(scope, pk, name):
+    return f'"{scope}-{pk}-{await aget_version(scope, pk)}-{name}"'
+
+
+def _bump(scope, pks):
+    cache = _cache()
+    for pk in pks:
+        key = _version_key(scope, pk)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, time.time_ns(), None)
+    _count('invalidations', len(pks))
+
+
+def invalidate(group_ids=(), user_ids=()):
+    """Retire cached balances for these groups and users once the current transaction commits.
+
+    Bumping only after commit means a reader can never cache pre-commit
+    data under the new version.
+    """
+    group_ids, user_ids = set(group_ids), set(user_ids)
+
+    def bump():
+        # Imported here: balance_events reads versions through this module
+        from . import balance_events
+
+        _bump(GROUP, group_ids)
+        _bump(USER, user_ids)
+        balance_events.publish(group_ids)
+
+    transaction.on_commit(bump)
+
+
+def get_or_compute(scope, pk, name, compute, timeout=None):
+    """Return the cached value for ``name`` under the current version, computing it on a miss.
+
+    ``compute`` may return ``None`` to signal a result that must not be
+    cached (e.g. an unknown id). ``timeout`` overrides the configured one.
+    """
+    cache = _cache()
+    key = f"balances:{scope}:{pk}:{get_version(scope, pk)}:{name}"
+    value = cache.get(key)
+    if value is not None:
+        _count('hits')
+        return value
+    _count('misses')
+    value = compute()
+    if value is not None:
+        cache.set(key, value, timeout or _timeout())
+    return value
+
+
+async def aget_or_compute(scope, pk, name, compute, timeout=None):
+    """Async :func:`get_or_compute`; ``compute`` is a coroutine function."""
+    cache = _cache()
+    key = f"balances:{scope}:{pk}:{await aget_version(scope, pk)}:{name}"
+    value = await cache.aget(key)
+    if value is not None:
+        _count('hits')
+        return value
+    _count('misses')
+    value = await compute()
+    if value is not None:
+        await cache.aset(key, value, timeout or _timeout())
+    return value
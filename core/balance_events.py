@@ -0,0 +1,165 @@
+# core/balance_events.py
+"""Balance change notifications for the streaming balances endpoint.
+
+:func:`core.balance_cache.invalidate` publishes the ids of the groups a
+transaction touched once it commits; every open
+``/api/groups/<id>/balances/stream/`` connection subscribed to one of
+them wakes up and pushes the new balances. Notifications carry no data,
+only "this group changed", so several commits in quick succession
+collapse into one wake-up.
+
+The broker is chosen by ``BALANCE_EVENTS_BACKEND``:
+
+- :class:`LocalBroker` (default) fans out within the process, which is
+  enough for a single ASGI server process.
+- :class:`CacheBroker` also picks up commits made by other processes by
+  watching the groups' balance cache versions, which every process bumps
+  in the shared ``BALANCE_CACHE_ALIAS`` cache. Use it with several
+  workers and a shared cache backend.
+"""
+import asyncio
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from . import balance_cache
+
+
+class Subscription:
+    """One listener for one group, bound to the event loop that created it."""
+
+    def __init__(self, broker, group_id):
+        self.broker = broker
+        self.group_id = group_id
+        self.loop = asyncio.get_running_loop()
+        self._changed = asyncio.Event()
+
+    def notify(self):
+        # Called from whichever thread ran the on_commit callback
+        try:
+            self.loop.call_soon_threadsafe(self._changed.set)
+        except RuntimeError:
+            pass  # the loop has closed; the subscriber is gone
+
+    async def wait(self, timeout=None):
+        """Wait for a change; ``False`` if ``timeout`` seconds passed without one."""
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout)
+        except TimeoutError:
+            return False
+        self._changed.clear()
+        return True
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class LocalBroker:
+    def __init__(self):
+        self._subscriptions = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def subscribe(self, group_id):
+        subscription = Subscription(self, group_id)
+        with self._lock:
+            self._subscriptions[group_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.group_id)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscriptions[subscription.group_id]
+
+    def publish(self, group_ids):
+        with self._lock:
+            subscriptions = [s for group_id in group_ids for s in self._subscriptions.get(group_id, ())]
+        for subscription in subscriptions:
+            subscription.notify()
+
+    def subscriber_count(self):
+        with self._lock:
+            return sum(len(subscriptions) for subscriptions in self._subscriptions.values())
+
+
+class CacheBroker(LocalBroker):
+    """:class:`LocalBroker` that also notices commits made by other processes.
+
+    Each event loop with subscribers runs one task that reads the versions
+    of all its subscribed groups in a single ``get_many`` every
+    ``BALANCE_EVENTS_POLL_INTERVAL`` seconds and notifies the groups whose
+    version moved. Commits in this process are still delivered at once.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.interval = getattr(settings, 'BALANCE_EVENTS_POLL_INTERVAL', 1.0)
+        self._pollers = {}
+
+    def subscribe(self, group_id):
+        subscription = super().subscribe(group_id)
+        loop = subscription.loop
+        with self._lock:
+            if loop not in self._pollers:
+                self._pollers[loop] = loop.create_task(self._poll(loop))
+        return subscription
+
+    def _subscribed(self, loop):
+        with self._lock:
+            return {
+                group_id: [s for s in subscriptions if s.loop is loop]
+                for group_id, subscriptions in self._subscriptions.items()
+                if any(s.loop is loop for s in subscriptions)
+            }
+
+    async def _poll(self, loop):
+        seen = {}
+        try:
+            while True:
+                await asyncio.sleep(self.interval)
+                subscribed = self._subscribed(loop)
+                with self._lock:
+                    if not subscribed:
+                        del self._pollers[loop]
+                        return
+                versions = await balance_cache.aget_versions(balance_cache.GROUP, subscribed)
+                for group_id, version in versions.items():
+                    if group_id in seen and seen[group_id] != version:
+                        for subscription in subscribed[group_id]:
+                            subscription.notify()
+                seen = versions
+        except asyncio.CancelledError:
+            with self._lock:
+                self._pollers.pop(loop, None)
+            raise
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def broker():
+    global _broker
+    with _broker_lock:
+        if _broker is None:
+            _broker = import_string(getattr(settings, 'BALANCE_EVENTS_BACKEND', 'core.balance_events.LocalBroker'))()
+        return _broker
+
+
+def subscribe(group_id):
+    """Subscribe to changes of ``group_id``; must be called on the event loop that will wait."""
+    return broker().subscribe(group_id)
+
+
+def publish(group_ids):
+    broker().publish(group_ids)
@@ -0,0 +1,125 @@
+# core/benchmarking.py
+"""Small helpers shared by the benchmark management commands."""
+import math
+import random
+import time
+from contextlib import contextmanager
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from .ledger import record_expenses
+from .models import Group, GroupMember, Expense, Split
+from .serializers import build_splits
+from .splits import compute_batch
+
+
+class Rollback(Exception):
+    pass
+
+
+@contextmanager
+def rolled_back():
+    """Run the block in a transaction that is always rolled back.
+
+    Benchmarks seed and write throwaway data, so they can be pointed at a
+    real database without leaving anything behind.
+    """
+    try:
+        with transaction.atomic():
+            yield
+            raise Rollback
+    except Rollback:
+        pass
+
+
+@contextmanager
+def throwaway_database(name=None):
+    """Point the default connection at a fresh test database for the block.
+
+    Unlike :func:`rolled_back`, data written here is committed, so requests
+    served from other threads (threaded WSGI workers, the ASGI executor)
+    can see it. The database is destroyed afterwards. ``name`` overrides
+    the test database name, e.g. to get an on-disk SQLite file instead of
+    the in-memory default.
+    """
+    old_name = connection.settings_dict['NAME']
+    if name:
+        connection.settings_dict['TEST'] = {**connection.settings_dict.get('TEST', {}), 'NAME': name}
+    connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+@contextmanager
+def measured(samples):
+    """Append ``(seconds, query_count)`` for the block to ``samples``."""
+    with CaptureQueriesContext(connection) as queries:
+        start = time.perf_counter()
+        yield
+        elapsed = time.perf_counter() - start
+    samples.append((elapsed, len(queries)))
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    index = max(0, math.ceil(pct / 100 * len(ordered)) - 1)
+    return ordered[index]
+
+
+def seed_dataset(groups=10, members=20, expenses=200, percentage_ratio=0.3, seed=0, prefix='bench'):
+    """Bulk-create a synthetic dataset and return ``(groups, users)``.
+
+    Each group gets ``members`` users and ``expenses`` expenses paid by a
+    random member; roughly ``percentage_ratio`` of them are percentage
+    splits over a random subset of members, the rest equal splits over
+    the whole group. The balance ledger is kept consistent.
+    """
+    rng = random.Random(seed)
+    users = User.objects.bulk_create(
+        [User(username=f"{prefix}-user-{i}") for i in range(groups * members)]
+    )
+    group_rows = Group.objects.bulk_create([Group(name=f"{prefix}-group-{i}") for i in range(groups)])
+    memberships, expense_rows, planned = [], [], []
+    for index, group in enumerate(group_rows):
+        group_users = users[index * members:(index + 1) * members]
+        memberships.extend(GroupMember(group=group, user=user) for user in group_users)
+        for _ in range(expenses):
+            amount = Decimal(rng.randint(100, 500000)).scaleb(-2)
+            if rng.random() < percentage_ratio and len(group_users) > 1:
+                # whole percentages cut at random points, so at most 100 people
+                participants = rng.sample(group_users, rng.randint(2, min(len(group_users), 100)))
+                cuts = sorted(rng.sample(range(1, 100), len(participants) - 1))
+                percentages = [b - a for a, b in zip([0] + cuts, cuts + [100])]
+                entries = [{'user': user, 'percentage': Decimal(p)} for user, p in zip(participants, percentages)]
+                split_type = 'percentage'
+            else:
+                entries = [{'user': user} for user in group_users]
+                split_type = 'equal'
+            expense_rows.append(Expense(
+                group=group, description='seeded', amount=amount,
+                paid_by=rng.choice(group_users), split_type=split_type,
+            ))
+            planned.append(entries)
+    GroupMember.objects.bulk_create(memberships)
+    expense_rows = Expense.objects.bulk_create(expense_rows, batch_size=1000)
+
+    amounts = compute_batch(
+        (expense.split_type, expense.amount, splits_data) for expense, splits_data in zip(expense_rows, planned)
+    )
+    entries, split_rows = [], []
+    for expense, splits_data, shares in zip(expense_rows, planned, amounts):
+        for split, share in zip(splits_data, shares):
+            split['amount'] = share
+        splits = build_splits(expense, splits_data)
+        entries.append((expense, splits))
+        split_rows.extend(splits)
+    Split.objects.bulk_create(split_rows, batch_size=2000)
+    record_expenses(entries)
+    return group_rows, users
@@ -0,0 +1,25 @@
+# core/currency.py
+"""Currency codes and money formatting.
+
+Amounts are stored in the currency they were entered in; group balances
+are kept in the group's ``base_currency`` (see :mod:`core.fx`).
+"""
+DEFAULT_CURRENCY = 'INR'
+
+SYMBOLS = {
+    'INR': '₹',
+    'USD': '$',
+    'EUR': '€',
+    'GBP': '£',
+    'JPY': '¥',
+    'AUD': 'A$',
+    'CAD': 'C$',
+    'SGD': 'S$',
+}
+
+
+def format_money(amount, currency=DEFAULT_CURRENCY):
+    symbol = SYMBOLS.get(currency)
+    if symbol is None:
+        return f"{amount:.2f} {currency}"
+    return f"{symbol}{amount:.2f}"
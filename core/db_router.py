@@ -0,0 +1,68 @@
+# core/db_router.py
+"""Route balance reads to a read replica.
+
+Only code running inside :func:`replica_reads` reads from the ``replica``
+alias: the balance and summary reads, which tolerate a little replication
+lag. Everything else, and every write, stays on ``default``,
+as do all reads made inside a transaction on ``default`` (they must see
+its uncommitted writes).
+
+A client that has just written is pinned to the primary for
+``REPLICA_STICKY_SECONDS`` by :class:`core.middleware.ReplicaStickinessMiddleware`,
+so it always sees its own writes. Without a ``replica`` entry in
+``DATABASES`` all reads go to ``default``.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+REPLICA = 'replica'
+
+_replica_reads = ContextVar('replica_reads', default=False)
+_pinned = ContextVar('pinned_to_primary', default=False)
+
+
+def replica_configured():
+    return REPLICA in settings.DATABASES
+
+
+def read_alias():
+    """The alias reads in the current context are sent to."""
+    if (_replica_reads.get() and not _pinned.get() and replica_configured()
+            and not connections[DEFAULT_DB_ALIAS].in_atomic_block):
+        return REPLICA
+    return DEFAULT_DB_ALIAS
+
+
+@contextmanager
+def replica_reads():
+    """Allow reads in the block to go to the replica; yields the alias in effect."""
+    token = _replica_reads.set(True)
+    try:
+        yield read_alias()
+    finally:
+        _replica_reads.reset(token)
+
+
+@contextmanager
+def pinned_to_primary(pinned=True):
+    token = _pinned.set(pinned)
+    try:
+        yield
+    finally:
+        _pinned.reset(token)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        alias = read_alias()
+        return alias if alias != DEFAULT_DB_ALIAS else None
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases hold the same data
+        return True
@@ -1,22 +1,69 @@
+from decimal import Decimal
 from django import forms
+from django.utils import timezone
+from . import fx
+from .currency import DEFAULT_CURRENCY
 from .models import Group, Expense, Split
+from .splits import SPLIT_TYPES, SplitError, compute_amounts
 from django.contrib.auth.models import User
 
 class GroupForm(forms.ModelForm):
     class Meta:
         model = Group
-        fields = ['name', 'members']
+        fields = ['name', 'base_currency', 'members']
         widgets = {
             'members' : forms.CheckboxSelectMultiple()
         }
 
+    def clean_base_currency(self):
+        value = self.cleaned_data['base_currency'].upper()
+        if not fx.has_rates(value):
+            raise forms.ValidationError(f"No exchange rates loaded for {value}.")
+        return value
+
 class ExpenseForm(forms.Form):
     group = forms.ModelChoiceField(queryset=Group.objects.all())
     description = forms.CharField(max_length=255)
-    amount = forms.DecimalField(decimal_places=2, max_digits=10)
+    amount = forms.DecimalField(decimal_places=2, max_digits=10, min_value=Decimal('0.01'))
+    currency = forms.RegexField(regex=r'^[A-Za-z]{3}$', required=False, initial=DEFAULT_CURRENCY,
+                                help_text="Three-letter ISO code, e.g. INR or USD (defaults to the group's currency)")
     paid_by = forms.ModelChoiceField(queryset=User.objects.all())
-    split_type = forms.ChoiceField(choices=[('equal', 'Equal'), ('percentage', 'Percentage')])
+    split_type = forms.ChoiceField(choices=SPLIT_TYPES)
     members = forms.ModelMultipleChoiceField(queryset=User.objects.all(), widget=forms.CheckboxSelectMultiple)
-    percentages = forms.CharField(required=False, help_text="Comma-separated percentages if split_type is percentage (e.g., 50,30,20)")
+    percentages = forms.CharField(required=False, help_text="Comma-separated values in member order: percentages, exact amounts or shares depending on split_type (e.g., 50,30,20)")
+
+    def clean(self):
+        cleaned_data = super().clean()
+        split_type = cleaned_data.get('split_type')
+        amount = cleaned_data.get('amount')
+        members = cleaned_data.get('members')
+        if not (split_type and amount and members):
+            return cleaned_data
+
+        group = cleaned_data.get('group')
+        if group:
+            cleaned_data['currency'] = currency = (cleaned_data.get('currency') or group.base_currency).upper()
+            try:
+                fx.factor(currency, group.base_currency, timezone.localdate())
+            except fx.RateMissing as exc:
+                raise forms.ValidationError(str(exc))
+
+        splits = [{'user': user} for user in members]
+        if split_type != 'equal':
+            values = [value.strip() for value in (cleaned_data.get('percentages') or '').split(',') if value.strip()]
+            if len(values) != len(splits):
+                raise forms.ValidationError("Enter one value per selected member.")
+            key = {'percentage': 'percentage', 'exact': 'amount', 'shares': 'shares'}[split_type]
+            for split, value in zip(splits, values):
+                split[key] = value
+
+        try:
+            amounts = compute_amounts(split_type, amount, splits)
+        except SplitError as exc:
+            raise forms.ValidationError(str(exc))
+        for split, share in zip(splits, amounts):
+            split['amount'] = share
+        cleaned_data['splits'] = splits
+        return cleaned_data
 
 
@@ -0,0 +1,121 @@
+# core/fx.py
+"""Exchange rates from the locally loaded ``FxRate`` table.
+
+Each rate is the value of one unit of a currency in
+:data:`core.currency.DEFAULT_CURRENCY` on a date. A conversion uses the
+latest rate on or before the day, so gaps (weekends, holidays) fall back to
+the previous rate. There is no network access.
+
+Lookups are memoized per process by ``(currency, day)`` under a rates
+version read from the database: the number of ``FxRate`` rows and the
+latest ``updated_at``. Rates only ever come from ``manage.py
+load_fx_rates``, which stamps every row it writes, so every process that
+shares the database drops its memo. A process rereads the version (one
+aggregate query) at most every ``FX_VERSION_CHECK_SECONDS``, which bounds
+how long it may keep converting at the old rates.
+"""
+import csv
+import threading
+import time
+from decimal import Decimal, InvalidOperation
+from functools import lru_cache
+from pathlib import Path
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Max
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from .currency import DEFAULT_CURRENCY
+from .models import FxRate
+
+CENT = Decimal('0.01')
+DEFAULT_RATES_FILE = Path(__file__).resolve().parent / 'fixtures' / 'fx_rates.csv'
+
+
+class RateMissing(ValueError):
+    pass
+
+
+def day_of(moment):
+    """The calendar day used to pick a rate for a timestamp."""
+    return timezone.localdate(moment) if timezone.is_aware(moment) else moment.date()
+
+
+_version = {'value': None, 'checked': 0.0}
+_version_lock = threading.Lock()
+
+
+def _rates_version():
+    interval = getattr(settings, 'FX_VERSION_CHECK_SECONDS', 1)
+    with _version_lock:
+        if _version['value'] is None or time.monotonic() - _version['checked'] >= interval:
+            stamp = FxRate.objects.aggregate(count=Count('id'), latest=Max('updated_at'))
+            _version['value'] = (stamp['count'], stamp['latest'])
+            _version['checked'] = time.monotonic()
+        return _version['value']
+
+
+def clear_memo():
+    """Forget memoized rates in this process."""
+    _lookup.cache_clear()
+    with _version_lock:
+        _version['value'] = None
+
+
+def rate(currency, day):
+    if currency == DEFAULT_CURRENCY:
+        return Decimal(1)
+    return _lookup(currency, day, _rates_version())
+
+
+@lru_cache(maxsize=4096)
+def _lookup(currency, day, version):
+    value = (
+        FxRate.objects.filter(currency=currency, date__lte=day)
+        .order_by('-date').values_list('rate', flat=True).first()
+    )
+    if value is None:
+        raise RateMissing(f"No exchange rate for {currency} on or before {day}.")
+    return value
+
+
+def has_rates(currency):
+    return currency == DEFAULT_CURRENCY or FxRate.objects.filter(currency=currency).exists()
+
+
+def factor(source, target, day):
+    """Multiplier converting ``source`` amounts into ``target`` on ``day``."""
+    if source == target:
+        return Decimal(1)
+    return rate(source, day) / rate(target, day)
+
+
+def convert(amount, source, target, day):
+    return (Decimal(amount) * factor(source, target, day)).quantize(CENT)
+
+
+def read_rates(lines):
+    """Parse ``date,currency,rate`` CSV rows, raising ``ValueError`` on bad rows."""
+    for data in csv.DictReader(lines):
+        day = parse_date(data.get('date') or '')
+        currency = (data.get('currency') or '').strip().upper()
+        try:
+            value = Decimal(data.get('rate') or '')
+        except InvalidOperation:
+            value = None
+        if day is None or len(currency) != 3 or value is None or value <= 0:
+            raise ValueError(f"Invalid rate row: {data}")
+        yield FxRate(date=day, currency=currency, rate=value)
+
+
+def load_rates(rates):
+    """Insert or update ``FxRate`` rows and retire memoized lookups in every process."""
+    rates = list(rates)
+    with transaction.atomic():
+        FxRate.objects.bulk_create(
+            rates, update_conflicts=True, unique_fields=['currency', 'date'], update_fields=['rate', 'updated_at'],
+        )
+    clear_memo()
+    return len(rates)
@@ -0,0 +1,133 @@
+# core/history.py
+"""Append-only balance history.
+
+Every change to the ledger is also written as an ``ExpenseEvent`` holding
+per-member ``[paid, owed]`` or ``[paid, owed, settled]`` deltas.
+``BalanceSnapshot`` rows store the accumulated totals of a group at a
+point in time, so the balances at any moment are the nearest earlier
+snapshot plus a replay of the events after it. :func:`compact` folds old
+events into a snapshot and prunes them; history before that snapshot is
+no longer available.
+
+An event's ``created_at`` is stamped before its transaction commits, so
+an event can become visible after a snapshot that should cover it. Replays
+skip events older than their snapshot, so snapshots are never taken later
+than :func:`horizon`, ``HISTORY_SETTLE_SECONDS`` behind now, by which time
+every transaction that stamped an earlier event has committed.
+"""
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from .models import BalanceSnapshot, ExpenseEvent, Group
+
+
+# Ids per DELETE, under SQLite's bound parameter limit
+DELETE_BATCH_SIZE = 500
+
+
+class HistoryUnavailable(Exception):
+    pass
+
+
+def _encode(deltas):
+    return {str(user_id): [str(value) for value in values] for user_id, values in deltas.items()}
+
+
+def event(group_id, kind, deltas, expense_id=None, created_at=None):
+    """Build (without saving) an event from ``{user_id: (paid, owed[, settled])}`` deltas."""
+    return ExpenseEvent(
+        group_id=group_id, expense_id=expense_id, kind=kind,
+        deltas=_encode(deltas), created_at=created_at or timezone.now(),
+    )
+
+
+def append(events):
+    ExpenseEvent.objects.bulk_create(events)
+
+
+def _replay(totals, encoded):
+    for user_id, values in encoded.items():
+        row = totals[int(user_id)]
+        for i, value in enumerate(values):
+            row[i] += Decimal(value)
+
+
+def balances_as_of(group_id, as_of):
+    """Return ``{user_id: (paid, owed, settled)}`` for a group as it stood at ``as_of``.
+
+    Raises :class:`HistoryUnavailable` when ``as_of`` falls before the
+    group's compacted history.
+    """
+    snapshot = (
+        BalanceSnapshot.objects.filter(group_id=group_id, taken_at__lte=as_of)
+        .order_by('-taken_at').first()
+    )
+    totals = defaultdict(lambda: [Decimal(0), Decimal(0), Decimal(0)])
+    events = ExpenseEvent.objects.filter(group_id=group_id, created_at__lte=as_of)
+    if snapshot is not None:
+        _replay(totals, snapshot.balances)
+        events = events.filter(created_at__gt=snapshot.taken_at)
+    elif BalanceSnapshot.objects.filter(group_id=group_id, compacted=True).exists():
+        raise HistoryUnavailable("History this far back has been compacted.")
+    for deltas in events.order_by().values_list('deltas', flat=True).iterator():
+        _replay(totals, deltas)
+    return {user_id: tuple(values) for user_id, values in totals.items()}
+
+
+def horizon():
+    """The latest moment a snapshot may cover."""
+    return timezone.now() - timedelta(seconds=getattr(settings, 'HISTORY_SETTLE_SECONDS', 60))
+
+
+def take_snapshot(group_id, taken_at=None, compacted=False):
+    taken_at = min(taken_at or timezone.now(), horizon())
+    return BalanceSnapshot.objects.create(
+        group_id=group_id, taken_at=taken_at, compacted=compacted,
+        balances=_encode(balances_as_of(group_id, taken_at)),
+    )
+
+
+def stale_groups():
+    """Ids of groups with events newer than their latest snapshot."""
+    latest = dict(
+        BalanceSnapshot.objects.order_by().values('group').annotate(latest=Max('taken_at'))
+        .values_list('group', 'latest')
+    )
+    newest = (
+        ExpenseEvent.objects.filter(group__in=Group.objects.all()).order_by()
+        .values('group').annotate(newest=Max('created_at')).values_list('group', 'newest')
+    )
+    return sorted(group_id for group_id, created_at in newest if group_id not in latest or created_at > latest[group_id])
+
+
+def compact(before, group_ids=None):
+    """Fold events created at or before ``before`` into a snapshot and delete them.
+
+    ``before`` is capped at :func:`horizon`. Older snapshots of the group are
+    deleted too. Events of deleted groups are simply dropped. Returns
+    ``(groups compacted, events deleted)``.
+    """
+    before = min(before, horizon())
+    events = ExpenseEvent.objects.filter(created_at__lte=before)
+    if group_ids is not None:
+        events = events.filter(group_id__in=group_ids)
+    # Only the events listed here are deleted, and each of them committed
+    # before the snapshots below are read, so none is lost; anything that
+    # commits in between is left for the next run
+    rows = list(events.order_by().values_list('id', 'group_id'))
+    event_ids = [event_id for event_id, _ in rows]
+    live = sorted(Group.objects.filter(id__in={group_id for _, group_id in rows}).values_list('id', flat=True))
+    deleted = 0
+    with transaction.atomic():
+        for group_id in live:
+            take_snapshot(group_id, before, compacted=True)
+        BalanceSnapshot.objects.filter(group_id__in=live, taken_at__lt=before).delete()
+        for start in range(0, len(event_ids), DELETE_BATCH_SIZE):
+            deleted += ExpenseEvent.objects.filter(id__in=event_ids[start:start + DELETE_BATCH_SIZE]).delete()[0]
+    return len(live), deleted
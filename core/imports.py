@@ -0,0 +1,159 @@
+# core/imports.py
+"""Bulk expense import shared by the batch API and ``manage.py import_expenses``.
+
+Rows are validated with :class:`ExpenseCreateSerializer` rules and written
+in chunks: one transaction, one ``bulk_create`` for expenses and one for
+splits per chunk. A bad row is reported and skipped without aborting the
+rest of the batch.
+"""
+import csv
+import json
+from itertools import islice
+
+from django.contrib.auth.models import User
+from django.db import DatabaseError, transaction
+from rest_framework import serializers
+
+from .ledger import record_expenses
+from .models import Group, Expense, Split
+from .retry import retry_on_locked
+from .serializers import ExpenseCreateSerializer, build_splits
+
+DEFAULT_CHUNK_SIZE = 500
+
+
+class UnreadableRow:
+    """Stands in for a row a reader could not parse, carrying the reason."""
+
+    def __init__(self, message):
+        self.message = message
+
+
+class ExpenseImportSerializer(ExpenseCreateSerializer):
+    # Groups are resolved from the chunk's prefetched map instead of one
+    # query per row
+    group = serializers.IntegerField()
+
+    def validate_group(self, value):
+        try:
+            return self.context['groups'][value]
+        except KeyError:
+            raise serializers.ValidationError(f"Group ID {value} does not exist")
+
+
+def _int_or_none(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _referenced_ids(rows):
+    group_ids, user_ids = set(), set()
+    for _, data in rows:
+        if not isinstance(data, dict):
+            continue
+        group_ids.add(_int_or_none(data.get('group')))
+        user_ids.add(_int_or_none(data.get('paid_by_id')))
+        splits = data.get('splits')
+        if isinstance(splits, list):
+            user_ids.update(_int_or_none(split.get('user_id')) for split in splits if isinstance(split, dict))
+    group_ids.discard(None)
+    user_ids.discard(None)
+    return group_ids, user_ids
+
+
+def import_chunk(rows):
+    """Validate and write one chunk of ``(row_number, data)`` pairs.
+
+    Returns the created expenses and a list of ``{'row', 'errors'}`` dicts.
+    """
+    group_ids, user_ids = _referenced_ids(rows)
+    context = {
+        'groups': Group.objects.in_bulk(group_ids),
+        'users': User.objects.in_bulk(user_ids),
+    }
+
+    valid, errors = [], []
+    for row_number, data in rows:
+        if isinstance(data, UnreadableRow):
+            errors.append({'row': row_number, 'errors': [data.message]})
+            continue
+        if not isinstance(data, dict):
+            errors.append({'row': row_number, 'errors': [f"Row {row_number}: expected an object"]})
+            continue
+        serializer = ExpenseImportSerializer(data=data, context=context)
+        if serializer.is_valid():
+            valid.append((row_number, serializer.validated_data))
+        else:
+            errors.append({'row': row_number, 'errors': serializer.errors})
+    if not valid:
+        return [], errors
+
+    try:
+        expenses = _write_chunk([data for _, data in valid])
+    except DatabaseError as exc:
+        errors.extend({'row': row_number, 'errors': [f"Database error: {exc}"]} for row_number, _ in valid)
+        return [], errors
+    return expenses, errors
+
+
+@retry_on_locked
+@transaction.atomic
+def _write_chunk(rows):
+    expenses = Expense.objects.bulk_create([
+        Expense(**{key: value for key, value in data.items() if key != 'splits'})
+        for data in rows
+    ])
+    entries = [(expense, build_splits(expense, data['splits'])) for expense, data in zip(expenses, rows)]
+    Split.objects.bulk_create([split for _, splits in entries for split in splits])
+    record_expenses(entries)
+    return expenses
+
+
+def iter_chunks(rows, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Yield ``(expenses, errors)`` per chunk of a possibly lazy row stream.
+
+    Only one chunk is held in memory at a time.
+    """
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return
+        yield import_chunk(chunk)
+
+
+def import_expenses(rows, chunk_size=DEFAULT_CHUNK_SIZE):
+    report = {'created': [], 'errors': []}
+    for expenses, errors in iter_chunks(rows, chunk_size):
+        report['created'].extend(expense.id for expense in expenses)
+        report['errors'].extend(errors)
+    return report
+
+
+def read_jsonl(lines):
+    for row_number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            yield row_number, json.loads(line)
+        except ValueError as exc:
+            yield row_number, UnreadableRow(f"Invalid JSON: {exc}")
+
+
+def read_csv(lines):
+    """Rows of group, description, amount, paid_by_id, split_type, splits and an optional currency.
+
+    ``splits`` holds the same JSON list the API accepts, e.g.
+    ``[{"user_id": 1}, {"user_id": 2}]``.
+    """
+    reader = csv.DictReader(lines)
+    for data in reader:
+        if not data.get('currency'):
+            data.pop('currency', None)
+        try:
+            data['splits'] = json.loads(data.get('splits') or '[]')
+        except ValueError:
+            pass
+        yield reader.line_num, data
@@ -0,0 +1,202 @@
+# core/jobs.py
+"""A small database-backed job queue.
+
+Requests enqueue a ``Job`` row and return its id; ``manage.py run_worker``
+claims queued jobs and runs them in a process pool. The queue table is the
+only coordination point, so it works on SQLite and Postgres alike with no
+broker. A job is claimed with a conditional ``UPDATE ... WHERE status =
+'queued'``, so two workers can never run the same job.
+
+A claim is a lease: while a job runs, its worker refreshes ``heartbeat_at``
+every ``JOB_HEARTBEAT_SECONDS``. A job whose heartbeat is older than
+``JOB_LEASE_SECONDS`` has lost its worker. Idempotent kinds are queued
+again; the others (imports) are failed rather than run twice. Only the
+worker holding the claim can record the outcome, so a worker that lost its
+lease cannot overwrite the result of the run that replaced it.
+
+Handlers are plain functions registered with :func:`handler`; they take the
+job and return a JSON-serializable result.
+"""
+import os
+import socket
+import threading
+import traceback
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.db import DatabaseError, connection
+from django.db.models import Prefetch
+from django.utils import timezone
+from rest_framework.utils.encoders import JSONEncoder
+
+from . import imports, ledger
+from .models import Expense, Job, Split
+from .serializers import ExpenseDetailSerializer
+
+HANDLERS = {}
+# Kinds that may safely run again after their worker is lost
+IDEMPOTENT = set()
+MAX_REPORTED_ROWS = 100
+
+
+def handler(kind, idempotent=True):
+    def register(func):
+        HANDLERS[kind] = func
+        if idempotent:
+            IDEMPOTENT.add(kind)
+        return func
+    return register
+
+
+def enqueue(kind, payload=None):
+    if kind not in HANDLERS:
+        raise ValueError(f"Unknown job kind '{kind}'.")
+    return Job.objects.create(kind=kind, payload=payload or {})
+
+
+def worker_name():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def requeue_stale(lease=None):
+    """Release the jobs whose heartbeat is older than ``lease`` seconds.
+
+    Idempotent kinds are queued again, the others failed. Returns the
+    number of jobs requeued.
+    """
+    lease = lease if lease is not None else getattr(settings, 'JOB_LEASE_SECONDS', 300)
+    now = timezone.now()
+    stale = Job.objects.filter(status=Job.RUNNING, heartbeat_at__lt=now - timedelta(seconds=lease))
+    stale.exclude(kind__in=IDEMPOTENT).update(
+        status=Job.FAILED, finished_at=now,
+        error=f"Worker lost: no heartbeat for {lease} seconds; not retried because this kind of job is not idempotent.",
+    )
+    return stale.filter(kind__in=IDEMPOTENT).update(status=Job.QUEUED, worker='', started_at=None, heartbeat_at=None)
+
+
+def claim(limit, worker=None):
+    """Mark up to ``limit`` of the oldest queued jobs as running and return their ids.
+
+    Jobs whose lease has expired are requeued first.
+    """
+    worker = worker or worker_name()
+    requeue_stale()
+    claimed = []
+    candidates = list(Job.objects.filter(status=Job.QUEUED).order_by('id').values_list('id', flat=True)[:limit * 2])
+    for job_id in candidates:
+        now = timezone.now()
+        updated = Job.objects.filter(id=job_id, status=Job.QUEUED).update(
+            status=Job.RUNNING, worker=worker, started_at=now, heartbeat_at=now,
+        )
+        if updated:
+            claimed.append(job_id)
+            if len(claimed) == limit:
+                break
+    return claimed
+
+
+def finish(job_id, worker, result=None, error=''):
+    """Record the outcome of a job ``worker`` still holds; ``False`` if its lease was lost."""
+    return bool(Job.objects.filter(id=job_id, worker=worker, status=Job.RUNNING).update(
+        status=Job.FAILED if error else Job.SUCCEEDED,
+        result=result, error=error, finished_at=timezone.now(),
+    ))
+
+
+class Heartbeat(threading.Thread):
+    """Keeps a running job's lease alive from a background thread."""
+
+    def __init__(self, job_id, worker):
+        super().__init__(daemon=True)
+        self.job_id, self.worker = job_id, worker
+        self.interval = getattr(settings, 'JOB_HEARTBEAT_SECONDS', 30)
+        self._stopped = threading.Event()
+
+    def run(self):
+        try:
+            while not self._stopped.wait(self.interval):
+                try:
+                    Job.objects.filter(id=self.job_id, worker=self.worker, status=Job.RUNNING).update(
+                        heartbeat_at=timezone.now(),
+                    )
+                except DatabaseError:
+                    pass  # a missed beat is retried next interval; the lease allows several
+        finally:
+            connection.close()
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+
+
+def run(job_id, worker=None):
+    """Run one job claimed by ``worker`` and record its outcome. Safe to call in any process."""
+    worker = worker or worker_name()
+    job = Job.objects.get(id=job_id)
+    heartbeat = Heartbeat(job_id, worker)
+    heartbeat.start()
+    try:
+        result = HANDLERS[job.kind](job)
+    except Exception:
+        finish(job_id, worker, error=traceback.format_exc())
+        return False
+    finally:
+        heartbeat.stop()
+    return finish(job_id, worker, result=result)
+
+
+def export_path(job_id):
+    directory = Path(getattr(settings, 'JOB_EXPORT_DIR', Path(settings.BASE_DIR) / 'exports'))
+    directory.mkdir(parents=True, exist_ok=True)
+    return directory / f"job-{job_id}.jsonl"
+
+
+@handler('rebuild_balances')
+def rebuild_balances(job):
+    mismatches = ledger.rebuild(job.payload.get('groups'), dry_run=job.payload.get('verify', False))
+    return {
+        'mismatches': len(mismatches),
+        'rows': [
+            {'group_id': group_id, 'user_id': user_id,
+             'stored': [str(value) for value in stored] if stored else None,
+             'expected': [str(value) for value in expected] if expected else None}
+            for group_id, user_id, stored, expected in mismatches[:MAX_REPORTED_ROWS]
+        ],
+    }
+
+
+@handler('import_expenses', idempotent=False)
+def import_expenses(job):
+    # Either inline rows (from the batch API) or a server-side file path
+    payload = job.payload
+    chunk_size = payload.get('chunk_size', imports.DEFAULT_CHUNK_SIZE)
+    if 'path' in payload:
+        reader = imports.read_csv if payload.get('format') == 'csv' else imports.read_jsonl
+        with open(payload['path'], newline='', encoding='utf-8') as lines:
+            report = imports.import_expenses(reader(lines), chunk_size)
+    else:
+        report = imports.import_expenses(enumerate(payload.get('rows', [])), chunk_size)
+    return {
+        'created': len(report['created']),
+        'error_count': len(report['errors']),
+        'errors': report['errors'][:MAX_REPORTED_ROWS],
+    }
+
+
+@handler('export_group_expenses')
+def export_group_expenses(job):
+    expenses = (
+        Expense.objects.filter(group_id=job.payload['group'])
+        .select_related('paid_by')
+        .prefetch_related(Prefetch('splits', queryset=Split.objects.select_related('user')))
+        .order_by('-created_at', '-id')
+    )
+    path = export_path(job.id)
+    encoder = JSONEncoder()
+    count = 0
+    with open(path, 'w', encoding='utf-8') as out:
+        for expense in expenses.iterator(chunk_size=2000):
+            out.write(encoder.encode(ExpenseDetailSerializer(expense).data) + "\n")
+            count += 1
+    return {'path': str(path), 'rows': count}
@@ -0,0 +1,241 @@
+# core/ledger.py
+"""Maintain the per-member running balances stored in ``MemberBalance``.
+
+Write paths hand every new expense (with its splits) to
+:func:`record_expenses` inside their own transaction, so the ledger always
+moves together with the raw ``Expense``/``Split`` rows; settlements go
+through :func:`record_settlements` the same way. Every change is also
+appended to the event log in :mod:`core.history`. :func:`rebuild`
+recomputes it from scratch for repairs and verification.
+
+The ledger is kept in each group's base currency. An expense in another
+currency is converted split by split at the rate of the day it was
+created, and the payer is credited with the sum of the converted splits,
+so a group's balances still add up to exactly zero.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+
+from . import balance_cache, fx, history, platform_stats
+from .models import Expense, Group, Split, MemberBalance, Settlement
+from .retry import retry_on_locked
+from .settlement import DEFAULT_STRATEGY, settle
+
+CENT = Decimal('0.01')
+ZERO = (Decimal(0), Decimal(0), Decimal(0))
+
+
+def to_cents(value):
+    return Decimal(value).quantize(CENT)
+
+
+def _zeros():
+    return [Decimal(0), Decimal(0), Decimal(0)]
+
+
+def _base_currencies(expenses):
+    """``{group_id: base_currency}``, reading already loaded groups first."""
+    bases = {}
+    for expense in expenses:
+        if Expense.group.is_cached(expense):
+            bases[expense.group_id] = expense.group.base_currency
+    missing = {expense.group_id for expense in expenses} - set(bases)
+    if missing:
+        bases.update(Group.objects.filter(id__in=missing).values_list('id', 'base_currency'))
+    return bases
+
+
+def split_changes(expense, splits, base_currency):
+    """``{user_id: [paid, owed]}`` in the group's base currency for one expense."""
+    changes = defaultdict(lambda: [Decimal(0), Decimal(0)])
+    if expense.currency == base_currency:
+        changes[expense.paid_by_id][0] += to_cents(expense.amount)
+        for split in splits:
+            changes[split.user_id][1] += to_cents(split.amount)
+        return changes
+    rate = fx.factor(expense.currency, base_currency, fx.day_of(expense.created_at))
+    for split in splits:
+        share = to_cents(split.amount * rate)
+        changes[expense.paid_by_id][0] += share
+        changes[split.user_id][1] += share
+    return changes
+
+
+def record_expenses(entries):
+    """Add ``(expense, splits)`` pairs to the ledger in a constant number of queries."""
+    deltas = defaultdict(_zeros)
+    events = []
+    bases = _base_currencies([expense for expense, _ in entries])
+    for expense, splits in entries:
+        changes = split_changes(expense, splits, bases[expense.group_id])
+        for user_id, (paid, owed) in changes.items():
+            deltas[(expense.group_id, user_id)][0] += paid
+            deltas[(expense.group_id, user_id)][1] += owed
+        events.append(history.event(expense.group_id, 'created', changes, expense.id, expense.created_at))
+    history.append(events)
+    apply_deltas(deltas)
+    platform_stats.push_expenses([expense for expense, _ in entries])
+
+
+def record_settlements(settlements):
+    """Add saved settlements to the ledger in a constant number of queries."""
+    deltas = defaultdict(_zeros)
+    events = []
+    for settlement in settlements:
+        amount = to_cents(settlement.amount)
+        deltas[(settlement.group_id, settlement.payer_id)][2] += amount
+        deltas[(settlement.group_id, settlement.payee_id)][2] -= amount
+        events.append(history.event(
+            settlement.group_id, 'settlement',
+            {settlement.payer_id: (0, 0, amount), settlement.payee_id: (0, 0, -amount)},
+            created_at=settlement.created_at,
+        ))
+    history.append(events)
+    apply_deltas(deltas)
+
+
+@retry_on_locked
+def settle_all(group, strategy=DEFAULT_STRATEGY):
+    """Record the suggested payments that settle every member of ``group``.
+
+    The members' ledger rows are locked while the payments are computed, so
+    concurrent writes cannot make the settlements stale. Returns the saved
+    settlements.
+    """
+    with transaction.atomic():
+        nets = dict(
+            MemberBalance.objects.select_for_update()
+            .filter(group=group, user__in=group.members.all())
+            .values_list('user_id', 'net')
+        )
+        settlements = Settlement.objects.bulk_create([
+            Settlement(group=group, payer_id=debtor, payee_id=creditor, amount=to_cents(amount))
+            for debtor, creditor, amount in settle(nets, strategy)
+            if to_cents(amount) > 0
+        ])
+        record_settlements(settlements)
+    return settlements
+
+
+def apply_deltas(deltas):
+    """Apply ``{(group_id, user_id): [paid, owed, settled]}`` increments to the ledger.
+
+    The settled increment may be left out.
+    """
+    if not deltas:
+        return
+    group_ids = {group_id for group_id, _ in deltas}
+    user_ids = {user_id for _, user_id in deltas}
+
+    with transaction.atomic():
+        MemberBalance.objects.bulk_create(
+            [MemberBalance(group_id=group_id, user_id=user_id) for group_id, user_id in deltas],
+            ignore_conflicts=True,
+        )
+        rows = MemberBalance.objects.select_for_update().filter(group_id__in=group_ids, user_id__in=user_ids)
+        changed = []
+        for row in rows:
+            delta = deltas.get((row.group_id, row.user_id))
+            if delta is None:
+                continue
+            row.paid += delta[0]
+            row.owed += delta[1]
+            if len(delta) > 2:
+                row.settled += delta[2]
+            row.net = row.paid - row.owed + row.settled
+            changed.append(row)
+        # The rows are locked above, so writing the new totals back as an
+        # upsert is safe and avoids bulk_update's per-row CASE expressions.
+        MemberBalance.objects.bulk_create(
+            changed, update_conflicts=True,
+            unique_fields=['group', 'user'], update_fields=['paid', 'owed', 'settled', 'net'],
+        )
+        balance_cache.invalidate(group_ids, user_ids)
+
+
+def compute_totals(group_ids=None):
+    """Recompute ``{(group_id, user_id): (paid, owed, settled)}`` from the raw rows.
+
+    Uses one grouped query per side no matter how many groups or members
+    are involved. Expenses in a foreign currency are grouped by currency,
+    day and split amount, so each distinct conversion is computed once
+    and the per-split rounding matches :func:`split_changes`.
+    """
+    expenses = Expense.objects.order_by().filter(currency=F('group__base_currency'))
+    splits = Split.objects.order_by()
+    settlements = Settlement.objects.order_by()
+    if group_ids is not None:
+        expenses = expenses.filter(group_id__in=group_ids)
+        splits = splits.filter(expense__group_id__in=group_ids)
+        settlements = settlements.filter(group_id__in=group_ids)
+    foreign = splits.exclude(expense__currency=F('expense__group__base_currency'))
+    splits = splits.filter(expense__currency=F('expense__group__base_currency'))
+
+    totals = defaultdict(_zeros)
+    for group_id, user_id, total in expenses.values('group', 'paid_by').annotate(total=Sum('amount')).values_list('group', 'paid_by', 'total'):
+        totals[(group_id, user_id)][0] += total
+    for group_id, user_id, total in splits.values('expense__group', 'user').annotate(total=Sum('amount')).values_list('expense__group', 'user', 'total'):
+        totals[(group_id, user_id)][1] += total
+    foreign = (
+        foreign.annotate(day=TruncDate('expense__created_at'))
+        .values('expense__group', 'expense__group__base_currency', 'expense__currency', 'day', 'expense__paid_by', 'user', 'amount')
+        .annotate(count=Count('id'))
+    )
+    for row in foreign:
+        rate = fx.factor(row['expense__currency'], row['expense__group__base_currency'], row['day'])
+        total = to_cents(row['amount'] * rate) * row['count']
+        totals[(row['expense__group'], row['expense__paid_by'])][0] += total
+        totals[(row['expense__group'], row['user'])][1] += total
+    for group_id, user_id, total in settlements.values('group', 'payer').annotate(total=Sum('amount')).values_list('group', 'payer', 'total'):
+        totals[(group_id, user_id)][2] += total
+    for group_id, user_id, total in settlements.values('group', 'payee').annotate(total=Sum('amount')).values_list('group', 'payee', 'total'):
+        totals[(group_id, user_id)][2] -= total
+    return {key: tuple(to_cents(value) for value in values) for key, values in totals.items()}
+
+
+def rebuild(group_ids=None, dry_run=False):
+    """Bring the ledger in line with the raw rows.
+
+    Returns a list of ``(group_id, user_id, stored, expected)`` mismatches,
+    where each side is a ``(paid, owed, settled)`` triple or ``None`` for a
+    missing row.
+    With ``dry_run`` the mismatches are only reported.
+    """
+    expected = compute_totals(group_ids)
+    rows = MemberBalance.objects.all()
+    if group_ids is not None:
+        rows = rows.filter(group_id__in=group_ids)
+    stored = {(row.group_id, row.user_id): row for row in rows}
+
+    mismatches = []
+    for key in sorted(set(expected) | set(stored)):
+        row = stored.get(key)
+        actual = (row.paid, row.owed, row.settled) if row else None
+        wanted = expected.get(key, ZERO)
+        if actual is None and wanted == ZERO:
+            continue
+        if actual != wanted:
+            mismatches.append((key[0], key[1], actual, expected.get(key)))
+    if dry_run or not mismatches:
+        return mismatches
+
+    with transaction.atomic():
+        to_create, to_update = [], []
+        for group_id, user_id, actual, wanted in mismatches:
+            paid, owed, settled = wanted or ZERO
+            row = stored.get((group_id, user_id))
+            if row is None:
+                to_create.append(MemberBalance(
+                    group_id=group_id, user_id=user_id, paid=paid, owed=owed, settled=settled, net=paid - owed + settled,
+                ))
+            else:
+                row.paid, row.owed, row.settled, row.net = paid, owed, settled, paid - owed + settled
+                to_update.append(row)
+        MemberBalance.objects.bulk_create(to_create)
+        MemberBalance.objects.bulk_update(to_update, ['paid', 'owed', 'settled', 'net'])
+        balance_cache.invalidate({m[0] for m in mismatches}, {m[1] for m in mismatches})
+    return mismatches
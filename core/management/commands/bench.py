@@ -0,0 +1,155 @@
+import json
+import random
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from core.benchmarking import measured, percentile, rolled_back, seed_dataset
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a synthetic dataset and drive the API through the Django test client, reporting "
+        "latency percentiles, queries per request and throughput per endpoint. Nothing is persisted."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--groups', type=int, default=20)
+        parser.add_argument('--members', type=int, default=15)
+        parser.add_argument('--expenses', type=int, default=200, help="Seeded expenses per group.")
+        parser.add_argument('--percentage-ratio', type=float, default=0.3,
+                            help="Share of seeded and posted expenses that use percentage splits.")
+        parser.add_argument('--requests', type=int, default=100, help="Requests per endpoint.")
+        parser.add_argument('--no-cache', action='store_true',
+                            help="Clear the balance cache before every request to measure the compute path.")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help="Write the results as JSON to this path.")
+        parser.add_argument('--baseline', help="Compare against a previous --output file and fail on regressions.")
+        parser.add_argument('--tolerance', type=float, default=0.25,
+                            help="Allowed relative p95 latency increase over the baseline (default 0.25).")
+
+    def workload(self, rng, groups, members):
+        def create_group():
+            users = rng.sample(members[rng.choice(groups).id], 4)
+            return 'post', '/api/groups/', {'name': 'bench', 'member_ids': [u.id for u in users]}
+
+        def create_expense():
+            group = rng.choice(groups)
+            users = members[group.id]
+            payload = {
+                'group': group.id, 'description': 'bench', 'amount': f"{rng.randint(100, 100000) / 100:.2f}",
+                'paid_by_id': rng.choice(users).id, 'split_type': 'equal',
+                'splits': [{'user_id': u.id} for u in users],
+            }
+            if rng.random() < self.percentage_ratio:
+                share = 100 // len(users)
+                payload['split_type'] = 'percentage'
+                payload['splits'] = [
+                    {'user_id': u.id, 'percentage': share + (100 - share * len(users) if i == 0 else 0)}
+                    for i, u in enumerate(users)
+                ]
+            return 'post', '/api/expenses/', payload
+
+        def group_balances():
+            return 'get', f'/api/groups/{rng.choice(groups).id}/balances/', None
+
+        def user_balances():
+            return 'get', f'/api/users/{rng.choice(members[rng.choice(groups).id]).id}/balances/', None
+
+        def dashboard():
+            return 'get', '/api/dashboard/', None
+
+        return {
+            'GroupCreateView': create_group,
+            'ExpenseCreateView': create_expense,
+            'GroupBalanceView': group_balances,
+            'UserBalanceView': user_balances,
+            'dashboard': dashboard,
+        }
+
+    def run_endpoint(self, client, make_request, count, clear_cache):
+        samples = []
+        started = time.perf_counter()
+        for _ in range(count):
+            method, path, payload = make_request()
+            if clear_cache:
+                caches[settings.BALANCE_CACHE_ALIAS].clear()
+            with measured(samples):
+                if method == 'post':
+                    response = client.post(path, payload, content_type='application/json')
+                else:
+                    response = client.get(path)
+            if response.status_code >= 400:
+                raise CommandError(f"{method.upper()} {path} returned {response.status_code}: {response.content[:200]!r}")
+        wall = time.perf_counter() - started
+
+        latencies = [elapsed * 1000 for elapsed, _ in samples]
+        queries = [query_count for _, query_count in samples]
+        return {
+            'requests': count,
+            'p50_ms': round(percentile(latencies, 50), 3),
+            'p95_ms': round(percentile(latencies, 95), 3),
+            'p99_ms': round(percentile(latencies, 99), 3),
+            'mean_queries': round(sum(queries) / len(queries), 2),
+            'max_queries': max(queries),
+            'throughput_rps': round(count / wall, 1),
+        }
+
+    def regressions(self, results, baseline, tolerance):
+        found = []
+        for name, before in baseline.get('endpoints', {}).items():
+            after = results['endpoints'].get(name)
+            if after is None:
+                continue
+            if after['p95_ms'] > before['p95_ms'] * (1 + tolerance):
+                found.append(f"{name}: p95 {before['p95_ms']} ms -> {after['p95_ms']} ms")
+            if after['max_queries'] > before['max_queries']:
+                found.append(f"{name}: queries {before['max_queries']} -> {after['max_queries']}")
+        return found
+
+    def handle(self, *args, **options):
+        self.percentage_ratio = options['percentage_ratio']
+        rng = random.Random(options['seed'])
+        results = {
+            'config': {key: options[key] for key in ('groups', 'members', 'expenses', 'percentage_ratio', 'requests', 'no_cache', 'seed')},
+            'endpoints': {},
+        }
+
+        setup_test_environment()
+        try:
+            with rolled_back():
+                groups, users = seed_dataset(
+                    options['groups'], options['members'], options['expenses'],
+                    options['percentage_ratio'], options['seed'],
+                )
+                per_group = options['members']
+                members = {group.id: users[i * per_group:(i + 1) * per_group] for i, group in enumerate(groups)}
+
+                client = Client()
+                for name, make_request in self.workload(rng, groups, members).items():
+                    results['endpoints'][name] = self.run_endpoint(client, make_request, options['requests'], options['no_cache'])
+        finally:
+            teardown_test_environment()
+
+        self.stdout.write(f"{'endpoint':<20} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'queries':>8} {'req/s':>8}")
+        for name, row in results['endpoints'].items():
+            self.stdout.write(
+                f"{name:<20} {row['p50_ms']:>8.2f} {row['p95_ms']:>8.2f} {row['p99_ms']:>8.2f} "
+                f"{row['mean_queries']:>8.1f} {row['throughput_rps']:>8.1f}"
+            )
+
+        if options['output']:
+            with open(options['output'], 'w') as handle:
+                json.dump(results, handle, indent=2)
+
+        if options['baseline']:
+            with open(options['baseline']) as handle:
+                baseline = json.load(handle)
+            found = self.regressions(results, baseline, options['tolerance'])
+            if found:
+                raise CommandError("Performance regressions:\n  " + "\n  ".join(found))
+            self.stdout.write(self.style.SUCCESS("No regressions against baseline."))
@@ -0,0 +1,125 @@
+import asyncio
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import ThreadSensitiveContext
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management.base import BaseCommand, CommandError
+from django.test import AsyncClient, Client
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from core.benchmarking import percentile, seed_dataset, throwaway_database
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a throwaway database and compare throughput of the synchronous endpoints served "
+        "through WSGI with their async variants served through ASGI, at the same concurrency."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--groups', type=int, default=10)
+        parser.add_argument('--members', type=int, default=10)
+        parser.add_argument('--expenses', type=int, default=100, help="Seeded expenses per group.")
+        parser.add_argument('--requests', type=int, default=200, help="Requests per endpoint and server.")
+        parser.add_argument('--concurrency', type=int, default=8,
+                            help="WSGI worker threads, and in-flight requests on the ASGI event loop.")
+        parser.add_argument('--no-cache', action='store_true',
+                            help="Clear the balance cache before every request to measure the compute path.")
+        parser.add_argument('--seed', type=int, default=0)
+
+    def workload(self, rng, groups, members):
+        """Paths per endpoint as ``(wsgi, asgi)`` pairs, fixed up front so both servers see the same requests."""
+        def group_balances():
+            group_id = rng.choice(groups).id
+            return f'/api/groups/{group_id}/balances/', f'/api/async/groups/{group_id}/balances/'
+
+        def user_balances():
+            user_id = rng.choice(members[rng.choice(groups).id]).id
+            return f'/api/users/{user_id}/balances/', f'/api/async/users/{user_id}/balances/'
+
+        def dashboard():
+            return '/api/dashboard/', '/api/async/dashboard/'
+
+        return {'group balances': group_balances, 'user balances': user_balances, 'dashboard': dashboard}
+
+    def ensure_ok(self, path, response):
+        if response.status_code >= 400:
+            raise CommandError(f"GET {path} returned {response.status_code}: {response.content[:200]!r}")
+
+    def run_wsgi(self, paths, concurrency, clear_cache):
+        local = threading.local()
+
+        def fetch(path):
+            if not hasattr(local, 'client'):
+                local.client = Client()
+            if clear_cache:
+                caches[settings.BALANCE_CACHE_ALIAS].clear()
+            start = time.perf_counter()
+            response = local.client.get(path)
+            elapsed = time.perf_counter() - start
+            self.ensure_ok(path, response)
+            return elapsed
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(concurrency) as pool:
+            latencies = list(pool.map(fetch, paths))
+        return latencies, time.perf_counter() - started
+
+    async def run_asgi(self, paths, concurrency, clear_cache):
+        client = AsyncClient()
+        pending = iter(paths)
+        latencies = []
+
+        async def worker():
+            for path in pending:
+                if clear_cache:
+                    await caches[settings.BALANCE_CACHE_ALIAS].aclear()
+                start = time.perf_counter()
+                # Like ASGIHandler, give each request its own thread-sensitive executor
+                async with ThreadSensitiveContext():
+                    response = await client.get(path)
+                latencies.append(time.perf_counter() - start)
+                self.ensure_ok(path, response)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return latencies, time.perf_counter() - started
+
+    def summarize(self, latencies, wall):
+        latencies = [elapsed * 1000 for elapsed in latencies]
+        return percentile(latencies, 50), percentile(latencies, 95), len(latencies) / wall
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        concurrency, clear_cache = options['concurrency'], options['no_cache']
+        rows = []
+
+        setup_test_environment()
+        try:
+            with throwaway_database():
+                self.stdout.write("Seeding...")
+                groups, users = seed_dataset(options['groups'], options['members'], options['expenses'], seed=options['seed'])
+                per_group = options['members']
+                members = {group.id: users[i * per_group:(i + 1) * per_group] for i, group in enumerate(groups)}
+
+                for name, make_paths in self.workload(rng, groups, members).items():
+                    wsgi_paths, asgi_paths = zip(*(make_paths() for _ in range(options['requests'])))
+                    caches[settings.BALANCE_CACHE_ALIAS].clear()
+                    wsgi = self.summarize(*self.run_wsgi(wsgi_paths, concurrency, clear_cache))
+                    caches[settings.BALANCE_CACHE_ALIAS].clear()
+                    asgi = self.summarize(*asyncio.run(self.run_asgi(asgi_paths, concurrency, clear_cache)))
+                    rows.append((name, wsgi, asgi))
+        finally:
+            teardown_test_environment()
+
+        self.stdout.write(
+            f"{'endpoint':<16} {'server':<6} {'p50 ms':>8} {'p95 ms':>8} {'req/s':>8}"
+        )
+        for name, wsgi, asgi in rows:
+            for server, (p50, p95, rps) in (('WSGI', wsgi), ('ASGI', asgi)):
+                self.stdout.write(f"{name:<16} {server:<6} {p50:>8.2f} {p95:>8.2f} {rps:>8.1f}")
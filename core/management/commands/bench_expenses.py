@@ -0,0 +1,46 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+
+from core.benchmarking import measured, percentile, rolled_back
+from core.models import Group, GroupMember
+from core.serializers import ExpenseCreateSerializer
+
+
+class Command(BaseCommand):
+    help = "Measure queries and latency of ExpenseCreateSerializer at different split counts. Nothing is persisted."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--splits', default='1,10,50,200',
+                            help="Comma-separated split counts to measure.")
+        parser.add_argument('--repeat', type=int, default=20,
+                            help="Expenses written per split count.")
+
+    def handle(self, *args, **options):
+        split_counts = [int(n) for n in options['splits'].split(',')]
+
+        self.stdout.write(f"{'splits':>8} {'queries':>8} {'p50 ms':>9} {'p95 ms':>9}")
+        with rolled_back():
+            users = User.objects.bulk_create(
+                [User(username=f"bench-expenses-{i}") for i in range(max(split_counts))]
+            )
+            group = Group.objects.create(name="bench-expenses")
+            GroupMember.objects.bulk_create([GroupMember(group=group, user=user) for user in users])
+
+            for count in split_counts:
+                payload = {
+                    'group': group.id, 'description': 'bench', 'amount': '1000.00',
+                    'paid_by_id': users[0].id, 'split_type': 'equal',
+                    'splits': [{'user_id': user.id} for user in users[:count]],
+                }
+                samples = []
+                for _ in range(options['repeat']):
+                    with measured(samples):
+                        serializer = ExpenseCreateSerializer(data=payload)
+                        serializer.is_valid(raise_exception=True)
+                        serializer.save()
+
+                timings = [elapsed * 1000 for elapsed, _ in samples]
+                queries = max(query_count for _, query_count in samples)
+                self.stdout.write(
+                    f"{count:>8} {queries:>8} {percentile(timings, 50):>9.2f} {percentile(timings, 95):>9.2f}"
+                )
@@ -0,0 +1,73 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Sum
+
+from core.benchmarking import percentile, rolled_back, seed_dataset
+from core.models import Expense, Split
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a synthetic dataset and compare query plans and timings of the balance, "
+        "listing and dashboard queries with and without the core indexes. Nothing is persisted."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--groups', type=int, default=50)
+        parser.add_argument('--members', type=int, default=20)
+        parser.add_argument('--expenses', type=int, default=400, help="Expenses per group.")
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def workload(self, group, user):
+        return {
+            'group payer totals': Expense.objects.filter(group=group).order_by().values('paid_by').annotate(total=Sum('amount')),
+            'user owed in group': Split.objects.filter(user=user, expense__group=group).order_by().values('user').annotate(total=Sum('amount')),
+            'user paid in groups': Expense.objects.filter(group__in=[group], paid_by=user).order_by().values('paid_by').annotate(total=Sum('amount')),
+            'group expenses page': Expense.objects.filter(group=group).order_by('-created_at', '-id')[:50],
+            'user splits page': Split.objects.filter(user=user).order_by('-expense__created_at', '-id')[:50],
+            'dashboard recent': Expense.objects.order_by('-created_at', '-id')[:5],
+        }
+
+    def run_workload(self, workload, repeat):
+        results = {}
+        for name, queryset in workload.items():
+            list(queryset.all())  # warm the page cache before timing
+            timings = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                list(queryset.all())
+                timings.append((time.perf_counter() - start) * 1000)
+            results[name] = (percentile(timings, 50), queryset.explain())
+        return results
+
+    def drop_indexes(self):
+        quote = connection.ops.quote_name
+        with connection.cursor() as cursor:
+            for model in (Expense, Split):
+                for index in model._meta.indexes:
+                    cursor.execute(f"DROP INDEX {quote(index.name)}")
+
+    def analyze(self):
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+
+    def handle(self, *args, **options):
+        with rolled_back():
+            self.stdout.write("Seeding...")
+            groups, users = seed_dataset(options['groups'], options['members'], options['expenses'])
+            workload = self.workload(groups[len(groups) // 2], users[len(users) // 2])
+
+            self.analyze()
+            after = self.run_workload(workload, options['repeat'])
+            self.drop_indexes()
+            self.analyze()
+            before = self.run_workload(workload, options['repeat'])
+
+        for name in workload:
+            before_ms, before_plan = before[name]
+            after_ms, after_plan = after[name]
+            self.stdout.write(self.style.MIGRATE_HEADING(f"\n{name}: {before_ms:.2f} ms -> {after_ms:.2f} ms"))
+            self.stdout.write("  before:\n    " + before_plan.replace("\n", "\n    "))
+            self.stdout.write("  after:\n    " + after_plan.replace("\n", "\n    "))
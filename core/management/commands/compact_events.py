@@ -0,0 +1,32 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core import history
+
+
+class Command(BaseCommand):
+    help = (
+        "Snapshot every group with new balance events, then fold events older than --days into a "
+        "compacted snapshot and delete them. Run it periodically to keep as_of replays short."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=90,
+                            help="Keep point-in-time history for this many days (default 90).")
+        parser.add_argument('--group', type=int, action='append', dest='groups', help="Limit compaction to this group id (repeatable).")
+        parser.add_argument('--snapshot-only', action='store_true', help="Take fresh snapshots but prune nothing.")
+
+    def handle(self, *args, **options):
+        groups = options['groups']
+        stale = [group_id for group_id in history.stale_groups() if groups is None or group_id in groups]
+        now = timezone.now()
+        for group_id in stale:
+            history.take_snapshot(group_id, now)
+        self.stdout.write(f"Snapshotted {len(stale)} groups.")
+
+        if options['snapshot_only']:
+            return
+        compacted, deleted = history.compact(now - timedelta(days=options['days']), groups)
+        self.stdout.write(self.style.SUCCESS(f"Compacted {compacted} groups, deleted {deleted} events."))
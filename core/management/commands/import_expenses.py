@@ -0,0 +1,33 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.imports import DEFAULT_CHUNK_SIZE, iter_chunks, read_csv, read_jsonl
+
+
+class Command(BaseCommand):
+    help = "Stream expenses from a CSV or JSON-lines file into the database in chunked transactions."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=['csv', 'jsonl'],
+                            help="Input format; defaults to the file extension.")
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or ('csv' if path.endswith('.csv') else 'jsonl')
+        reader = read_csv if fmt == 'csv' else read_jsonl
+
+        created = failed = 0
+        try:
+            with open(path, newline='', encoding='utf-8') as handle:
+                for expenses, errors in iter_chunks(reader(handle), options['chunk_size']):
+                    created += len(expenses)
+                    failed += len(errors)
+                    for error in errors:
+                        self.stderr.write(f"row {error['row']}: {json.dumps(error['errors'])}")
+        except OSError as exc:
+            raise CommandError(str(exc))
+
+        self.stdout.write(self.style.SUCCESS(f"Imported {created} expense(s), {failed} row(s) rejected."))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core import fx
+
+
+class Command(BaseCommand):
+    help = "Load exchange rates from a local date,currency,rate CSV (the bundled fixture by default)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default=str(fx.DEFAULT_RATES_FILE))
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['path'], newline='') as handle:
+                count = fx.load_rates(fx.read_rates(handle))
+        except (OSError, ValueError) as exc:
+            raise CommandError(str(exc))
+        self.stdout.write(self.style.SUCCESS(f"Loaded {count} exchange rates."))
@@ -0,0 +1,47 @@
+import json
+
+from django.core.management.base import BaseCommand
+from rest_framework.utils.encoders import JSONEncoder
+
+from core.analytics import platform_report
+from core.settlement import DEFAULT_STRATEGY, STRATEGIES
+
+
+class Command(BaseCommand):
+    help = (
+        "Report platform-wide outstanding debt, the largest creditors and debtors, and the debt "
+        "cycles across groups that could be cancelled out."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=10)
+        parser.add_argument('--cycles', type=int, default=10, help="How many of the largest cycles to list.")
+        parser.add_argument('--strategy', choices=sorted(STRATEGIES), default=DEFAULT_STRATEGY)
+        parser.add_argument('--json', action='store_true', help="Print the report as JSON.")
+
+    def handle(self, *args, **options):
+        report = platform_report(options['top'], options['cycles'], options['strategy'])
+        if options['json']:
+            self.stdout.write(json.dumps(report, cls=JSONEncoder, indent=2))
+            return
+
+        currency = report['currency']
+        self.stdout.write(
+            f"{report['users']} users, {report['edges']} debts, {report['outstanding']} {currency} outstanding"
+        )
+        for title, rows in (('Top creditors', report['top_creditors']), ('Top debtors', report['top_debtors'])):
+            self.stdout.write(self.style.MIGRATE_HEADING(title))
+            for row in rows:
+                self.stdout.write(f"  {row['user'] or row['user_id']:<24} {row['amount']:>14} {currency}")
+
+        cycles = report['cycles']
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"{cycles['count']} debt cycles; cancelling them removes {cycles['cancellable']} {currency}, "
+            f"leaving {cycles['outstanding_after']} {currency}"
+        ))
+        for cycle in cycles['largest']:
+            self.stdout.write(f"  {' -> '.join(cycle['users'])} -> {cycle['users'][0]}: {cycle['amount']} {currency}")
+        if report['skipped_groups']:
+            self.stdout.write(self.style.WARNING(
+                f"Skipped groups without exchange rates: {', '.join(map(str, report['skipped_groups']))}"
+            ))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core import ledger
+
+
+class Command(BaseCommand):
+    help = "Verify or rebuild the MemberBalance ledger from the raw Expense and Split rows."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--group', type=int, action='append', dest='groups',
+                            help="Only check this group id (may be repeated).")
+        parser.add_argument('--verify', action='store_true',
+                            help="Report mismatches without writing; exits non-zero if any are found.")
+
+    def handle(self, *args, **options):
+        mismatches = ledger.rebuild(options['groups'], dry_run=options['verify'])
+
+        for group_id, user_id, stored, expected in mismatches:
+            self.stdout.write(f"group {group_id} user {user_id}: stored {stored} expected {expected}")
+
+        if not mismatches:
+            self.stdout.write(self.style.SUCCESS("Ledger is consistent."))
+        elif options['verify']:
+            raise CommandError(f"{len(mismatches)} ledger row(s) out of sync.")
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Rebuilt {len(mismatches)} ledger row(s)."))
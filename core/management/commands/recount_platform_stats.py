@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from core import platform_stats
+
+
+class Command(BaseCommand):
+    help = "Reset the dashboard's group, user and expense counters from the tables."
+
+    def handle(self, *args, **options):
+        counts = platform_stats.recount()
+        self.stdout.write(", ".join(f"{count} {name}" for name, count in counts.items()))
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from core import recurring
+
+
+class Command(BaseCommand):
+    help = (
+        "Create the expenses of every recurring expense that is due, catching up on all missed "
+        "periods. Safe to run repeatedly (e.g. hourly from cron): a period is never created twice."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', help="Materialize occurrences due on or before this date (default: today).")
+        parser.add_argument('--chunk-size', type=int, default=recurring.DEFAULT_CHUNK_SIZE,
+                            help="Expenses written per transaction.")
+
+    def handle(self, *args, **options):
+        today = None
+        if options['date']:
+            today = parse_date(options['date'])
+            if today is None:
+                raise CommandError(f"Invalid --date '{options['date']}', expected YYYY-MM-DD")
+        report = recurring.run(today, options['chunk_size'])
+        for error in report['errors']:
+            self.stderr.write(f"Recurring expense {error['recurring']}: {error['error']}")
+        self.stdout.write(self.style.SUCCESS(
+            f"{report['templates']} due templates: created {report['created']} expenses, "
+            f"{report['existing']} already existed, {len(report['errors'])} errors."
+        ))
@@ -0,0 +1,93 @@
+import multiprocessing
+import os
+import signal
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+# Pool processes import this module before Django is set up (to unpickle
+# the functions below), so core modules touching models are imported lazily.
+
+
+def init_process(settings_module):
+    # Pool processes are spawned, not forked, so they set Django up from
+    # scratch and never share the parent's database connections
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings_module)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    django.setup()
+
+
+def run_in_process(job_id, worker):
+    from core import jobs
+
+    try:
+        return jobs.run(job_id, worker)
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = "Claim queued jobs from the database and run them in a pool of worker processes."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=os.cpu_count() or 2,
+                            help="Pool size; 0 runs jobs one by one in this process.")
+        parser.add_argument('--poll-interval', type=float, default=1.0, help="Seconds between polls of an empty queue.")
+        parser.add_argument('--once', action='store_true', help="Exit once the queue is empty.")
+
+    def handle(self, *args, **options):
+        from core import jobs
+
+        self.jobs = jobs
+        processes, once = options['processes'], options['once']
+        self.worker = jobs.worker_name()
+        if processes == 0:
+            return self.run_inline(options['poll_interval'], once)
+
+        connections.close_all()
+        pool = ProcessPoolExecutor(
+            max_workers=processes, mp_context=multiprocessing.get_context('spawn'),
+            initializer=init_process, initargs=(os.environ['DJANGO_SETTINGS_MODULE'],),
+        )
+        running = {}
+        try:
+            while True:
+                for job_id in self.jobs.claim(processes - len(running), self.worker):
+                    running[pool.submit(run_in_process, job_id, self.worker)] = job_id
+                if not running:
+                    if once:
+                        break
+                    time.sleep(options['poll_interval'])
+                    continue
+                done, _ = wait(running, timeout=options['poll_interval'], return_when=FIRST_COMPLETED)
+                for future in done:
+                    self.report(running.pop(future), future)
+        except KeyboardInterrupt:
+            self.stdout.write("Stopping; waiting for running jobs to finish.")
+        finally:
+            for future in wait(running).done:
+                self.report(running.pop(future), future)
+            pool.shutdown()
+
+    def run_inline(self, poll_interval, once):
+        while True:
+            claimed = self.jobs.claim(1, self.worker)
+            if not claimed:
+                if once:
+                    return
+                time.sleep(poll_interval)
+                continue
+            ok = self.jobs.run(claimed[0], self.worker)
+            self.stdout.write(f"job {claimed[0]}: {'succeeded' if ok else 'failed'}")
+
+    def report(self, job_id, future):
+        exc = future.exception()
+        if exc is not None:
+            # The process died before the job could record its own outcome
+            self.jobs.finish(job_id, self.worker, error=f"Worker process failed: {exc!r}")
+            self.stderr.write(f"job {job_id}: worker process failed: {exc!r}")
+        else:
+            self.stdout.write(f"job {job_id}: {'succeeded' if future.result() else 'failed'}")
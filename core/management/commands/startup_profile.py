@@ -0,0 +1,117 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+PROFILES = {
+    'full': 'splitwise_backend.settings',
+    'api': 'splitwise_backend.settings_api',
+}
+
+# Runs in a fresh interpreter under -X importtime: boots Django like a WSGI
+# server would and serves one request. The URLconf, and with it every view
+# module, is only imported by that first request.
+PROBE = r'''
+import io, json, sys, time
+start = time.perf_counter()
+from django.core.wsgi import get_wsgi_application
+application = get_wsgi_application()
+booted = time.perf_counter()
+statuses = []
+environ = {
+    'REQUEST_METHOD': 'GET', 'PATH_INFO': sys.argv[1], 'QUERY_STRING': '',
+    'SERVER_NAME': sys.argv[2], 'SERVER_PORT': '80', 'HTTP_HOST': sys.argv[2],
+    'wsgi.input': io.BytesIO(), 'wsgi.errors': sys.stderr, 'wsgi.url_scheme': 'http',
+    'wsgi.version': (1, 0), 'wsgi.multithread': False, 'wsgi.multiprocess': True, 'wsgi.run_once': False,
+}
+b''.join(application(environ, lambda status, headers, exc_info=None: statuses.append(status)))
+done = time.perf_counter()
+print(json.dumps({
+    'boot': booted - start, 'first_response': done - start, 'status': statuses[0],
+    'modules': len(sys.modules), 'core': sorted(name for name in sys.modules if name.startswith('core.')),
+}))
+'''
+
+
+def parse_importtime(stderr):
+    """Sum ``-X importtime`` self times (in microseconds) per top-level package."""
+    packages = defaultdict(int)
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, _, name = line[len('import time:'):].split('|')
+        packages[name.strip().split('.')[0]] += int(self_us)
+    return packages
+
+
+def probe(settings_module, path='/api/', host='localhost'):
+    """Start a new interpreter with ``settings_module`` and time its first response."""
+    env = {**os.environ, 'DJANGO_SETTINGS_MODULE': settings_module}
+    started = time.perf_counter()
+    process = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', PROBE, path, host],
+        cwd=settings.BASE_DIR, env=env, capture_output=True, text=True,
+    )
+    wall = time.perf_counter() - started
+    if process.returncode:
+        raise CommandError(f"{settings_module} failed to start:\n{process.stderr[-2000:]}")
+    result = json.loads(process.stdout.strip().splitlines()[-1])
+    result['process'] = wall
+    result['imports'] = parse_importtime(process.stderr)
+    return result
+
+
+class Command(BaseCommand):
+    help = (
+        "Start a fresh interpreter per settings profile and report its import time (from "
+        "-X importtime, broken down by package) and its time to first response."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--profile', action='append', choices=sorted(PROFILES),
+                            help="Profile to measure (repeatable); defaults to all of them.")
+        parser.add_argument('--path', default='/api/', help="Path of the first request.")
+        parser.add_argument('--host', default='localhost', help="Host header of the first request.")
+        parser.add_argument('--runs', type=int, default=3, help="Cold starts per profile; medians are reported.")
+        parser.add_argument('--top', type=int, default=10, help="Packages to list in the import breakdown.")
+
+    def handle(self, *args, **options):
+        names = options['profile'] or list(PROFILES)
+        reports = {}
+        for name in names:
+            runs = [probe(PROFILES[name], options['path'], options['host']) for _ in range(max(options['runs'], 1))]
+            statuses = {run['status'] for run in runs}
+            if any(status.startswith('5') for status in statuses):
+                raise CommandError(f"{name}: GET {options['path']} returned {sorted(statuses)[-1]}")
+            packages = defaultdict(list)
+            for run in runs:
+                for package, self_us in run['imports'].items():
+                    packages[package].append(self_us)
+            reports[name] = {
+                'imports': statistics.median(sum(run['imports'].values()) for run in runs) / 1000,
+                'boot': statistics.median(run['boot'] for run in runs) * 1000,
+                'first_response': statistics.median(run['first_response'] for run in runs) * 1000,
+                'process': statistics.median(run['process'] for run in runs) * 1000,
+                'modules': runs[0]['modules'],
+                'packages': {package: statistics.median(times) / 1000 for package, times in packages.items()},
+            }
+
+        self.stdout.write(
+            f"{'profile':<8} {'imports ms':>10} {'boot ms':>8} {'1st resp ms':>11} {'process ms':>10} {'modules':>8}"
+        )
+        for name, report in reports.items():
+            self.stdout.write(
+                f"{name:<8} {report['imports']:>10.1f} {report['boot']:>8.1f} {report['first_response']:>11.1f} "
+                f"{report['process']:>10.1f} {report['modules']:>8}"
+            )
+        for name, report in reports.items():
+            self.stdout.write(f"\n{name}: import time by package (self ms)")
+            ranked = sorted(report['packages'].items(), key=lambda item: -item[1])[:options['top']]
+            for package, ms in ranked:
+                self.stdout.write(f"  {package:<24} {ms:>8.1f}")
@@ -0,0 +1,135 @@
+import logging
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection
+from django.test import Client
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from core import ledger, retry
+from core.benchmarking import percentile, seed_dataset, throwaway_database
+from core.retry import is_lock_error
+
+PROFILES = ('default', 'production')
+
+
+class Command(BaseCommand):
+    help = (
+        "Post expenses from many threads at once against a throwaway on-disk SQLite database and "
+        "report throughput, latency and lock errors per SQLite profile. Nothing is persisted."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--seconds', type=float, default=10, help="How long each profile is stressed.")
+        parser.add_argument('--groups', type=int, default=4)
+        parser.add_argument('--members', type=int, default=6)
+        parser.add_argument('--profile', choices=PROFILES + ('both',), default='both')
+
+    @contextmanager
+    def profile(self, name):
+        # New connections (one per thread) read their options from this dict
+        settings_dict = connection.settings_dict
+        old_options = settings_dict.get('OPTIONS', {})
+        settings_dict['OPTIONS'] = settings.SQLITE_PRODUCTION_OPTIONS if name == 'production' else {}
+        connection.close()
+        try:
+            yield
+        finally:
+            connection.close()
+            settings_dict['OPTIONS'] = old_options
+
+    def writer(self, deadline, groups, members, stats, lock):
+        client = Client()
+        latencies, written, lock_errors, index = [], 0, 0, 0
+        try:
+            while time.perf_counter() < deadline:
+                group = groups[index % len(groups)]
+                users = members[group.id]
+                index += 1
+                payload = {
+                    'group': group.id, 'description': 'stress', 'amount': f"{index % 997 + 1}.{index % 100:02d}",
+                    'paid_by_id': users[index % len(users)].id, 'split_type': 'equal',
+                    'splits': [{'user_id': user.id} for user in users],
+                }
+                start = time.perf_counter()
+                try:
+                    response = client.post('/api/expenses/', payload, content_type='application/json')
+                except OperationalError as exc:
+                    if not is_lock_error(exc):
+                        raise
+                    lock_errors += 1
+                    continue
+                if response.status_code != 201:
+                    raise CommandError(f"POST /api/expenses/ returned {response.status_code}: {response.content[:200]!r}")
+                latencies.append(time.perf_counter() - start)
+                written += 1
+        finally:
+            connection.close()
+            with lock:
+                stats['latencies'].extend(latencies)
+                stats['written'] += written
+                stats['lock_errors'] += lock_errors
+
+    def run_profile(self, name, options):
+        with tempfile.TemporaryDirectory(prefix='stress-') as directory, \
+                self.profile(name), throwaway_database(os.path.join(directory, 'stress.sqlite3')):
+            with connection.cursor() as cursor:
+                cursor.execute("PRAGMA journal_mode")
+                journal_mode = cursor.fetchone()[0]
+            groups, users = seed_dataset(options['groups'], options['members'], 0)
+            per_group = options['members']
+            members = {group.id: users[i * per_group:(i + 1) * per_group] for i, group in enumerate(groups)}
+
+            stats, lock = {'latencies': [], 'written': 0, 'lock_errors': 0}, threading.Lock()
+            deadline = time.perf_counter() + options['seconds']
+            threads = [
+                threading.Thread(target=self.writer, args=(deadline, groups, members, stats, lock))
+                for _ in range(options['threads'])
+            ]
+            retries_before = retry.retries()
+            started = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            wall = time.perf_counter() - started
+            retried = retry.retries() - retries_before
+            mismatches = ledger.rebuild(dry_run=True)
+
+        latencies = [elapsed * 1000 for elapsed in stats['latencies']] or [0]
+        return {
+            'journal': journal_mode, 'written': stats['written'], 'rps': stats['written'] / wall,
+            'p50': percentile(latencies, 50), 'p95': percentile(latencies, 95),
+            'retries': retried, 'lock_errors': stats['lock_errors'], 'mismatches': len(mismatches),
+        }
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError("stress_writes measures SQLite locking; the default database is not SQLite.")
+        profiles = PROFILES if options['profile'] == 'both' else (options['profile'],)
+
+        # Every contended write is a "slow request"; keep those warnings out of the report
+        metrics_logger = logging.getLogger('core.metrics')
+        old_level = metrics_logger.level
+        metrics_logger.setLevel(logging.ERROR)
+        setup_test_environment()
+        try:
+            results = [(name, self.run_profile(name, options)) for name in profiles]
+        finally:
+            teardown_test_environment()
+            metrics_logger.setLevel(old_level)
+
+        self.stdout.write(
+            f"{'profile':<11} {'journal':<8} {'written':>8} {'writes/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'retried':>8} {'failed':>7} {'ledger':>7}"
+        )
+        for name, row in results:
+            self.stdout.write(
+                f"{name:<11} {row['journal']:<8} {row['written']:>8} {row['rps']:>9.1f} {row['p50']:>8.2f} "
+                f"{row['p95']:>8.2f} {row['retries']:>8} {row['lock_errors']:>7} {'ok' if not row['mismatches'] else row['mismatches']:>7}"
+            )
@@ -0,0 +1,42 @@
+import sqlite3
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+
+from core.db_router import REPLICA
+
+
+class Command(BaseCommand):
+    help = (
+        "Copy the primary SQLite database onto the replica file, standing in for replication "
+        "when both aliases are local SQLite files (see DATABASE_REPLICA_NAME)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--every', type=float, default=0,
+                            help="Keep copying every this many seconds, simulating replication lag.")
+
+    def handle(self, *args, **options):
+        if REPLICA not in settings.DATABASES:
+            raise CommandError("No 'replica' database configured; set DATABASE_REPLICA_NAME.")
+        primary, replica = settings.DATABASES[DEFAULT_DB_ALIAS], settings.DATABASES[REPLICA]
+        if not all(db['ENGINE'] == 'django.db.backends.sqlite3' for db in (primary, replica)):
+            raise CommandError("sync_replica only copies SQLite databases; use the server's replication otherwise.")
+
+        while True:
+            self.copy(primary['NAME'], replica['NAME'])
+            self.stdout.write(f"Copied {primary['NAME']} to {replica['NAME']}")
+            if not options['every']:
+                return
+            time.sleep(options['every'])
+
+    def copy(self, source_name, target_name):
+        # The backup API takes a consistent snapshot even while the primary is being written
+        source, target = sqlite3.connect(source_name), sqlite3.connect(target_name)
+        try:
+            source.backup(target)
+        finally:
+            source.close()
+            target.close()
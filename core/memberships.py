@@ -0,0 +1,112 @@
+# core/memberships.py
+"""Group membership writes and the cached user -> group ids index.
+
+Balance and summary reads need "the groups this user belongs to" on
+every request. The index keeps that list per user in the balance cache
+so those reads can filter on ``group_id IN (...)`` instead of joining
+``GroupMember``. Every membership change drops the affected users'
+entries (see :mod:`core.signals`) and moves the balance cache versions
+on, since group balances list the members.
+"""
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+from . import balance_cache
+from .models import GroupMember, MemberBalance
+
+
+class MembershipError(ValueError):
+    pass
+
+
+def _cache():
+    return caches[getattr(settings, 'BALANCE_CACHE_ALIAS', 'default')]
+
+
+def _key(user_id):
+    return f"memberships:user:{user_id}"
+
+
+def _query(user_id):
+    # Always from the primary: a lagging replica must not seed the shared index
+    return GroupMember.objects.using(DEFAULT_DB_ALIAS).filter(user_id=user_id).order_by('group_id').values_list('group_id', flat=True)
+
+
+def group_ids(user_id):
+    """Ids of the groups ``user_id`` belongs to, from the index when possible."""
+    cache = _cache()
+    ids = cache.get(_key(user_id))
+    if ids is None:
+        ids = list(_query(user_id))
+        cache.set(_key(user_id), ids, balance_cache._timeout())
+    return ids
+
+
+async def agroup_ids(user_id):
+    cache = _cache()
+    ids = await cache.aget(_key(user_id))
+    if ids is None:
+        ids = [group_id async for group_id in _query(user_id)]
+        await cache.aset(_key(user_id), ids, balance_cache._timeout())
+    return ids
+
+
+def invalidate(user_ids, group_ids=()):
+    """Forget the index entries of ``user_ids`` now and again once the transaction commits.
+
+    Dropping them straight away keeps this transaction's own reads right;
+    dropping them again after commit removes anything a concurrent reader
+    cached from the pre-commit state in between.
+    """
+    user_ids, keys = set(user_ids), [_key(user_id) for user_id in set(user_ids)]
+    if not keys:
+        return
+    _cache().delete_many(keys)
+    transaction.on_commit(lambda: _cache().delete_many(keys))
+    balance_cache.invalidate(group_ids, user_ids)
+
+
+def resolve_users(user_ids):
+    """Map ids to users in one query, raising :class:`MembershipError` naming every unknown id."""
+    users = User.objects.only('id').in_bulk(set(user_ids))
+    missing = sorted(set(user_ids) - set(users))
+    if missing:
+        raise MembershipError(f"User ID(s) {', '.join(map(str, missing))} do not exist")
+    return users
+
+
+@transaction.atomic
+def add_members(group, user_ids):
+    """Add users to ``group``; existing members are left alone. Returns the ids newly added."""
+    users = resolve_users(user_ids)
+    existing = set(GroupMember.objects.filter(group=group, user_id__in=users).values_list('user_id', flat=True))
+    GroupMember.objects.bulk_create(
+        [GroupMember(group=group, user_id=user_id) for user_id in users if user_id not in existing],
+        ignore_conflicts=True,
+    )
+    added = sorted(set(users) - existing)
+    invalidate(added, [group.id])
+    return added
+
+
+@transaction.atomic
+def remove_members(group, user_ids):
+    """Remove users from ``group`` in one delete. Returns the ids removed.
+
+    Members who still owe or are owed money in the group cannot leave until
+    they settle up, so nothing is removed if any of them has a balance.
+    """
+    user_ids = set(user_ids)
+    unsettled = sorted(
+        MemberBalance.objects.select_for_update()
+        .filter(group=group, user_id__in=user_ids).exclude(net=0)
+        .values_list('user_id', flat=True)
+    )
+    if unsettled:
+        raise MembershipError(f"User ID(s) {', '.join(map(str, unsettled))} still have a balance in this group")
+    removed = sorted(GroupMember.objects.filter(group=group, user_id__in=user_ids).values_list('user_id', flat=True))
+    GroupMember.objects.filter(group=group, user_id__in=removed).delete()
+    invalidate(removed, [group.id])
+    return removed
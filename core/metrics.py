@@ -0,0 +1,101 @@
+# core/metrics.py
+"""In-process request metrics, rendered in the Prometheus text format.
+
+Counters are per worker process; scrape every worker (or run a single
+one) the same way as with any other in-process Prometheus client.
+"""
+import threading
+from collections import defaultdict
+
+from . import balance_cache, retry
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class ViewStats:
+    __slots__ = ('requests', 'errors', 'duration', 'queries', 'sql_time', 'slow', 'duplicate_queries', 'buckets')
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.duration = 0.0
+        self.queries = 0
+        self.sql_time = 0.0
+        self.slow = 0
+        self.duplicate_queries = 0
+        self.buckets = [0] * len(DURATION_BUCKETS)
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._views = defaultdict(ViewStats)
+
+    def record(self, view, status_code, duration, queries, sql_time, slow, duplicate_queries):
+        with self._lock:
+            stats = self._views[view]
+            stats.requests += 1
+            stats.errors += status_code >= 500
+            stats.duration += duration
+            stats.queries += queries
+            stats.sql_time += sql_time
+            stats.slow += slow
+            stats.duplicate_queries += duplicate_queries
+            for i, bound in enumerate(DURATION_BUCKETS):
+                if duration <= bound:
+                    stats.buckets[i] += 1
+
+    def reset(self):
+        with self._lock:
+            self._views.clear()
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                view: {name: getattr(stats, name) for name in ViewStats.__slots__ if name != 'buckets'}
+                for view, stats in self._views.items()
+            }
+
+    def render(self):
+        def label(view):
+            return view.replace('\\', '\\\\').replace('"', '\\"')
+
+        with self._lock:
+            views = sorted(self._views.items())
+            lines = []
+
+            def counter(name, help_text, attr):
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} counter")
+                for view, stats in views:
+                    lines.append(f'{name}{{view="{label(view)}"}} {getattr(stats, attr)}')
+
+            counter('splitwise_http_requests_total', 'Requests handled.', 'requests')
+            counter('splitwise_http_errors_total', 'Requests that returned a 5xx status.', 'errors')
+            counter('splitwise_db_queries_total', 'SQL queries executed while handling requests.', 'queries')
+            counter('splitwise_db_query_seconds_total', 'Time spent in SQL while handling requests.', 'sql_time')
+            counter('splitwise_slow_requests_total', 'Requests slower than SLOW_REQUEST_THRESHOLD_MS.', 'slow')
+            counter('splitwise_duplicate_query_requests_total',
+                    'Requests that repeated one SQL statement at least DUPLICATE_QUERY_THRESHOLD times (likely N+1).',
+                    'duplicate_queries')
+
+            name = 'splitwise_http_request_duration_seconds'
+            lines.append(f"# HELP {name} Request wall time.")
+            lines.append(f"# TYPE {name} histogram")
+            for view, stats in views:
+                for bound, count in zip(DURATION_BUCKETS, stats.buckets):
+                    lines.append(f'{name}_bucket{{view="{label(view)}",le="{bound}"}} {count}')
+                lines.append(f'{name}_bucket{{view="{label(view)}",le="+Inf"}} {stats.requests}')
+                lines.append(f'{name}_sum{{view="{label(view)}"}} {stats.duration}')
+                lines.append(f'{name}_count{{view="{label(view)}"}} {stats.requests}')
+
+        for key, value in balance_cache.stats().items():
+            name = f'splitwise_balance_cache_{key}_total'
+            lines.append(f"# TYPE {name} counter")
+            lines.append(f"{name} {value}")
+        lines.append("# TYPE splitwise_db_lock_retries_total counter")
+        lines.append(f"splitwise_db_lock_retries_total {retry.retries()}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
@@ -0,0 +1,146 @@
+# core/middleware.py
+import logging
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+
+from . import db_router
+from .metrics import registry
+
+logger = logging.getLogger('core.metrics')
+
+
+class QueryRecorder:
+    """``execute_wrapper`` hook counting queries, SQL time and repeated statements."""
+
+    def __init__(self):
+        self.count = 0
+        self.sql_time = 0.0
+        self.statements = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_time += time.perf_counter() - start
+            self.count += 1
+            self.statements[sql] += 1
+
+    def duplicates(self, threshold):
+        return {sql: n for sql, n in self.statements.items() if n >= threshold}
+
+
+class QueryMetricsMiddleware:
+    """Record wall time, query count and SQL time for every request.
+
+    Results are attached as a ``Server-Timing`` header, aggregated per URL
+    route for ``/api/_metrics`` (staff only), and logged to ``core.metrics`` when a
+    request is slower than ``SLOW_REQUEST_THRESHOLD_MS`` or repeats one
+    statement ``DUPLICATE_QUERY_THRESHOLD`` times or more (an N+1 pattern).
+    Queries run while a streaming response is consumed are not counted.
+
+    Under ASGI the middleware runs async so async views stay on the event
+    loop. The ORM runs their queries on the request's thread-sensitive
+    executor thread, so the query hooks are installed on that thread.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.slow_threshold = getattr(settings, 'SLOW_REQUEST_THRESHOLD_MS', 500) / 1000
+        self.duplicate_threshold = getattr(settings, 'DUPLICATE_QUERY_THRESHOLD', 5)
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    @staticmethod
+    def _install(stack, recorder):
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(recorder))
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        recorder = QueryRecorder()
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            self._install(stack, recorder)
+            response = self.get_response(request)
+        return self.finish(request, response, recorder, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        recorder = QueryRecorder()
+        start = time.perf_counter()
+        stack = ExitStack()
+        await sync_to_async(self._install)(stack, recorder)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(stack.close)()
+        return self.finish(request, response, recorder, time.perf_counter() - start)
+
+    def finish(self, request, response, recorder, duration):
+        match = request.resolver_match
+        view = match.route if match else 'unmatched'
+        slow = duration >= self.slow_threshold
+        duplicates = recorder.duplicates(self.duplicate_threshold)
+        registry.record(view, response.status_code, duration, recorder.count, recorder.sql_time, slow, bool(duplicates))
+
+        response['Server-Timing'] = (
+            f'app;dur={duration * 1000:.1f}, '
+            f'db;dur={recorder.sql_time * 1000:.1f};desc="{recorder.count} queries"'
+        )
+        if slow:
+            logger.warning(
+                "Slow request %s %s (%s): %.0f ms, %d queries, %.0f ms SQL",
+                request.method, request.path, view, duration * 1000, recorder.count, recorder.sql_time * 1000,
+            )
+        for sql, count in duplicates.items():
+            logger.warning("Possible N+1 in %s: statement ran %d times: %s", view, count, sql[:200])
+        return response
+
+
+class ReplicaStickinessMiddleware:
+    """Give read-your-writes consistency on top of :mod:`core.db_router`.
+
+    A successful unsafe request (an expense POST, a settlement, ...) sets a
+    short-lived cookie; requests carrying it, and the writing request
+    itself, read from the primary instead of the replica.
+    """
+
+    sync_capable = True
+    async_capable = True
+    UNSAFE_METHODS = {'POST', 'PUT', 'PATCH', 'DELETE'}
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.cookie = getattr(settings, 'REPLICA_STICKY_COOKIE', 'pin_primary')
+        self.seconds = getattr(settings, 'REPLICA_STICKY_SECONDS', 10)
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def pinned(self, request):
+        return request.method in self.UNSAFE_METHODS or self.cookie in request.COOKIES
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with db_router.pinned_to_primary(self.pinned(request)):
+            response = self.get_response(request)
+        return self.finish(request, response)
+
+    async def __acall__(self, request):
+        with db_router.pinned_to_primary(self.pinned(request)):
+            response = await self.get_response(request)
+        return self.finish(request, response)
+
+    def finish(self, request, response):
+        if request.method in self.UNSAFE_METHODS and response.status_code < 400 and db_router.replica_configured():
+            response.set_cookie(self.cookie, '1', max_age=self.seconds, httponly=True, samesite='Lax')
+        return response
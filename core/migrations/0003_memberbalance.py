@@ -0,0 +1,49 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:09
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def backfill_balances(apps, schema_editor):
+    Expense = apps.get_model('core', 'Expense')
+    Split = apps.get_model('core', 'Split')
+    MemberBalance = apps.get_model('core', 'MemberBalance')
+
+    totals = {}
+    for row in Expense.objects.order_by().values('group', 'paid_by').annotate(total=Sum('amount')):
+        totals.setdefault((row['group'], row['paid_by']), [0, 0])[0] += row['total']
+    for row in Split.objects.order_by().values('expense__group', 'user').annotate(total=Sum('amount')):
+        totals.setdefault((row['expense__group'], row['user']), [0, 0])[1] += row['total']
+
+    MemberBalance.objects.bulk_create([
+        MemberBalance(group_id=group_id, user_id=user_id, paid=paid, owed=owed, net=paid - owed)
+        for (group_id, user_id), (paid, owed) in totals.items()
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_user'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MemberBalance',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('paid', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('owed', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('net', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('group', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='member_balances', to='core.group')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='member_balances', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('group', 'user')},
+            },
+        ),
+        migrations.RunPython(backfill_balances, migrations.RunPython.noop),
+    ]
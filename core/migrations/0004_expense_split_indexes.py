@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:15
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_memberbalance'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='expense',
+            index=models.Index(fields=['group', 'paid_by'], name='expense_group_payer_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='expense',
+            index=models.Index(fields=['group', 'created_at', 'id'], name='expense_group_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='expense',
+            index=models.Index(fields=['created_at', 'id'], name='expense_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='split',
+            index=models.Index(fields=['user', 'expense'], name='split_user_expense_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='split',
+            constraint=models.CheckConstraint(condition=models.Q(('amount__gte', 0)), name='split_amount_non_negative'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_expense_split_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='split',
+            name='shares',
+            field=models.DecimalField(blank=True, decimal_places=4, max_digits=10, null=True),
+        ),
+        migrations.AlterField(
+            model_name='expense',
+            name='split_type',
+            field=models.CharField(choices=[('equal', 'Equal'), ('percentage', 'Percentage'), ('exact', 'Exact amounts'), ('shares', 'Shares')], max_length=20),
+        ),
+        migrations.AlterField(
+            model_name='split',
+            name='percentage',
+            field=models.DecimalField(blank=True, decimal_places=4, max_digits=7, null=True),
+        ),
+    ]
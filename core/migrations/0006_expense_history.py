@@ -0,0 +1,69 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:25
+
+import django.db.models.deletion
+import django.utils.timezone
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import migrations, models
+
+
+def backfill_events(apps, schema_editor):
+    """Log a 'created' event for every existing expense, at its creation time."""
+    Expense = apps.get_model('core', 'Expense')
+    Split = apps.get_model('core', 'Split')
+    ExpenseEvent = apps.get_model('core', 'ExpenseEvent')
+
+    owed = defaultdict(lambda: defaultdict(Decimal))
+    for expense_id, user_id, amount in Split.objects.order_by().values_list('expense_id', 'user_id', 'amount').iterator():
+        owed[expense_id][user_id] += amount
+
+    events = []
+    for expense in Expense.objects.order_by('created_at', 'id').iterator():
+        deltas = defaultdict(lambda: [Decimal(0), Decimal(0)])
+        deltas[expense.paid_by_id][0] += expense.amount
+        for user_id, amount in owed.pop(expense.id, {}).items():
+            deltas[user_id][1] += amount
+        events.append(ExpenseEvent(
+            group_id=expense.group_id, expense_id=expense.id, kind='created', created_at=expense.created_at,
+            deltas={str(user_id): [str(paid), str(owing)] for user_id, (paid, owing) in deltas.items()},
+        ))
+    ExpenseEvent.objects.bulk_create(events, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_split_engine'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BalanceSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('taken_at', models.DateTimeField()),
+                ('balances', models.JSONField(default=dict)),
+                ('compacted', models.BooleanField(default=False)),
+                ('group', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='balance_snapshots', to='core.group')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['group', 'taken_at'], name='snapshot_group_taken_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ExpenseEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('expense_id', models.IntegerField(blank=True, null=True)),
+                ('kind', models.CharField(choices=[('created', 'Created'), ('edited', 'Edited'), ('deleted', 'Deleted'), ('settlement', 'Settlement')], max_length=20)),
+                ('deltas', models.JSONField(default=dict)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('group', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='core.group')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['group', 'created_at'], name='event_group_created_idx')],
+            },
+        ),
+        migrations.RunPython(backfill_events, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_settlements'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='expense',
+            name='currency',
+            field=models.CharField(default='INR', max_length=3),
+        ),
+        migrations.AddField(
+            model_name='group',
+            name='base_currency',
+            field=models.CharField(default='INR', max_length=3),
+        ),
+        migrations.CreateModel(
+            name='FxRate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('currency', models.CharField(max_length=3)),
+                ('date', models.DateField()),
+                ('rate', models.DecimalField(decimal_places=8, max_digits=18)),
+            ],
+            options={
+                'unique_together': {('currency', 'date')},
+            },
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:47
+
+from django.conf import settings
+from django.db import migrations, models
+
+SHARDS = 8  # core.platform_stats.SHARDS
+
+
+def backfill_counters(apps, schema_editor):
+    """Seed every counter's shards, with the current table counts in shard 0."""
+    PlatformCounter = apps.get_model('core', 'PlatformCounter')
+    counts = {
+        'groups': apps.get_model('core', 'Group').objects.count(),
+        'users': apps.get_model(settings.AUTH_USER_MODEL).objects.count(),
+        'expenses': apps.get_model('core', 'Expense').objects.count(),
+    }
+    PlatformCounter.objects.bulk_create([
+        PlatformCounter(name=name, shard=shard, value=count if shard == 0 else 0)
+        for name, count in counts.items() for shard in range(SHARDS)
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_job_queue'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PlatformCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=30)),
+                ('shard', models.PositiveSmallIntegerField()),
+                ('value', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'unique_together': {('name', 'shard')},
+            },
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
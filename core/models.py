@@ -1,10 +1,14 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.utils import timezone
+from .currency import DEFAULT_CURRENCY
+from .splits import SPLIT_TYPES
 
 class Group(models.Model):
     name = models.CharField(max_length=255)
     created_at = models.DateTimeField(auto_now_add=True)
     members = models.ManyToManyField(User, through='GroupMember')
+    base_currency = models.CharField(max_length=3, default=DEFAULT_CURRENCY)  # balances and settlements are kept in this currency
 
     def __str__(self):
         return self.name
@@ -24,9 +28,27 @@ class Expense(models.Model):
     group = models.ForeignKey(Group, on_delete=models.CASCADE)
     description = models.CharField(max_length=255)
     amount = models.DecimalField(max_digits=10, decimal_places=2)
+    currency = models.CharField(max_length=3, default=DEFAULT_CURRENCY)  # amount and split amounts are in this currency
     paid_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='expenses_paid')
-    split_type = models.CharField(max_length=20, choices=[('equal', 'Equal'), ('percentage', 'Percentage')])
+    split_type = models.CharField(max_length=20, choices=SPLIT_TYPES)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Set on expenses generated from a RecurringExpense: the occurrence's date
+    recurring = models.ForeignKey('RecurringExpense', on_delete=models.SET_NULL, null=True, blank=True, related_name='occurrences')
+    period = models.DateField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            # one expense per template and period, however often the scheduler runs
+            models.UniqueConstraint(fields=['recurring', 'period'], name='expense_recurring_period_uniq'),
+        ]
+        indexes = [
+            # per-payer totals within a group
+            models.Index(fields=['group', 'paid_by'], name='expense_group_payer_idx'),
+            # a group's expenses newest first (keyset listing)
+            models.Index(fields=['group', 'created_at', 'id'], name='expense_group_created_idx'),
+            # platform-wide recent expenses (dashboard)
+            models.Index(fields=['created_at', 'id'], name='expense_created_idx'),
+        ]
 
     def __str__(self):
         return f"{self.description} - {self.amount} in {self.group.name}"
@@ -35,11 +57,183 @@ class Split(models.Model):
     expense = models.ForeignKey(Expense, on_delete=models.CASCADE, related_name='splits')
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     amount = models.DecimalField(max_digits=10, decimal_places=2)
-    percentage = models.FloatField(null=True, blank=True)  # Optional: used only for percentage splits
+    percentage = models.DecimalField(max_digits=7, decimal_places=4, null=True, blank=True)  # Optional: used only for percentage splits
+    shares = models.DecimalField(max_digits=10, decimal_places=4, null=True, blank=True)  # Optional: used only for share splits
+
+    class Meta:
+        indexes = [
+            # a user's share of expenses, joined on to the expense's group
+            models.Index(fields=['user', 'expense'], name='split_user_expense_idx'),
+        ]
+        constraints = [
+            models.CheckConstraint(condition=models.Q(amount__gte=0), name='split_amount_non_negative'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} owes {self.amount} for {self.expense.description}"
 
+class MemberBalance(models.Model):
+    group = models.ForeignKey(Group, on_delete=models.CASCADE, related_name='member_balances')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='member_balances')
+    paid = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    owed = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    settled = models.DecimalField(max_digits=12, decimal_places=2, default=0)  # settlements paid minus received
+    net = models.DecimalField(max_digits=12, decimal_places=2, default=0)  # paid - owed + settled, kept in sync by core.ledger
+
+    class Meta:
+        unique_together = ('group', 'user')
+
+    def __str__(self):
+        return f"{self.user.username} in {self.group.name}: {self.net}"
+
+class Settlement(models.Model):
+    group = models.ForeignKey(Group, on_delete=models.CASCADE, related_name='settlements')
+    payer = models.ForeignKey(User, on_delete=models.CASCADE, related_name='settlements_paid')
+    payee = models.ForeignKey(User, on_delete=models.CASCADE, related_name='settlements_received')
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # per-member settlement totals within a group (ledger rebuild)
+            models.Index(fields=['group', 'payer'], name='settlement_group_payer_idx'),
+            models.Index(fields=['group', 'payee'], name='settlement_group_payee_idx'),
+        ]
+        constraints = [
+            models.CheckConstraint(condition=models.Q(amount__gt=0), name='settlement_amount_positive'),
+            models.CheckConstraint(condition=~models.Q(payer=models.F('payee')), name='settlement_distinct_users'),
+        ]
+
+    def __str__(self):
+        return f"{self.payer.username} paid {self.payee.username} {self.amount} in {self.group.name}"
+
+class FxRate(models.Model):
+    currency = models.CharField(max_length=3)
+    date = models.DateField()
+    rate = models.DecimalField(max_digits=18, decimal_places=8)  # value of one unit in DEFAULT_CURRENCY
+    updated_at = models.DateTimeField(auto_now=True)  # with the row count, the rates version in core.fx
+
+    class Meta:
+        unique_together = ('currency', 'date')
+
+    def __str__(self):
+        return f"{self.currency} {self.rate} on {self.date}"
+
+class Job(models.Model):
+    QUEUED, RUNNING, SUCCEEDED, FAILED = 'queued', 'running', 'succeeded', 'failed'
+    STATUSES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (SUCCEEDED, 'Succeeded'),
+        (FAILED, 'Failed'),
+    ]
+
+    kind = models.CharField(max_length=50)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=20, choices=STATUSES, default=QUEUED)
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    worker = models.CharField(max_length=100, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)  # refreshed while the claim is held
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # workers claim the oldest queued jobs
+            models.Index(fields=['status', 'id'], name='job_status_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} job {self.id} ({self.status})"
+
+class PlatformCounter(models.Model):
+    # Platform-wide totals (groups, users, expenses) split over a few shard
+    # rows so concurrent writers rarely update the same row; see core.platform_stats
+    name = models.CharField(max_length=30)
+    shard = models.PositiveSmallIntegerField()
+    value = models.BigIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('name', 'shard')
+
+    def __str__(self):
+        return f"{self.name}[{self.shard}] = {self.value}"
+
+class RecurringExpense(models.Model):
+    # A template materialized into an Expense per period by core.recurring
+    DAILY, WEEKLY, MONTHLY, YEARLY = 'daily', 'weekly', 'monthly', 'yearly'
+    FREQUENCIES = [
+        (DAILY, 'Daily'),
+        (WEEKLY, 'Weekly'),
+        (MONTHLY, 'Monthly'),
+        (YEARLY, 'Yearly'),
+    ]
+
+    group = models.ForeignKey(Group, on_delete=models.CASCADE, related_name='recurring_expenses')
+    description = models.CharField(max_length=255)
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    currency = models.CharField(max_length=3, default=DEFAULT_CURRENCY)
+    paid_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='recurring_expenses_paid')
+    split_type = models.CharField(max_length=20, choices=SPLIT_TYPES)
+    splits = models.JSONField(default=list)  # split entries as the expense API takes them, decimals as strings
+    frequency = models.CharField(max_length=10, choices=FREQUENCIES, default=MONTHLY)
+    interval = models.PositiveSmallIntegerField(default=1)  # every `interval` days/weeks/months/years
+    start_date = models.DateField()  # first occurrence; monthly dates keep its day of the month
+    end_date = models.DateField(null=True, blank=True)  # last possible occurrence
+    next_due = models.DateField()  # next occurrence not yet materialized
+    active = models.BooleanField(default=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # the scheduler's due templates
+            models.Index(fields=['active', 'next_due'], name='recurring_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.description} ({self.frequency}) in {self.group.name}"
+
+class ExpenseEvent(models.Model):
+    KINDS = [
+        ('created', 'Created'),
+        ('edited', 'Edited'),
+        ('deleted', 'Deleted'),
+        ('settlement', 'Settlement'),
+    ]
+
+    # Append-only: events are never updated and outlive the expenses (and
+    # groups) they describe, so neither side is a real foreign key.
+    group = models.ForeignKey(Group, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    expense_id = models.IntegerField(null=True, blank=True)
+    kind = models.CharField(max_length=20, choices=KINDS)
+    deltas = models.JSONField(default=dict)  # {user_id: [paid, owed]} as decimal strings
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            # replaying one group's events after a snapshot
+            models.Index(fields=['group', 'created_at'], name='event_group_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} expense {self.expense_id} in group {self.group_id}"
+
+class BalanceSnapshot(models.Model):
+    group = models.ForeignKey(Group, on_delete=models.CASCADE, related_name='balance_snapshots')
+    taken_at = models.DateTimeField()  # covers every event created at or before this time
+    balances = models.JSONField(default=dict)  # {user_id: [paid, owed]} as decimal strings
+    compacted = models.BooleanField(default=False)  # events before this snapshot were pruned
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['group', 'taken_at'], name='snapshot_group_taken_idx'),
+        ]
+
+    def __str__(self):
+        return f"Group {self.group_id} balances at {self.taken_at}"
+
 class User(models.Model):
     username = models.CharField(max_length=100)
 
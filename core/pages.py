@@ -0,0 +1,109 @@
+# core/pages.py
+"""Server-rendered HTML pages (forms, balances, summary, dashboard).
+
+Kept apart from the JSON API in :mod:`core.views` so API-only workers
+(``splitwise_backend.settings_api``) never import the forms or render
+templates.
+"""
+import asyncio
+
+from django.db import transaction
+from django.http import Http404
+from django.shortcuts import get_object_or_404, redirect, render
+from django.views.decorators.http import require_POST
+from rest_framework.decorators import api_view
+
+from . import platform_stats
+from .forms import ExpenseForm, GroupForm
+from .ledger import record_expenses, settle_all
+from .models import Expense, Group, Split
+from .retry import retry_on_locked
+from .serializers import build_splits
+from .utils import group_balances, user_summary
+
+
+@api_view(['GET', 'POST'])
+def create_group_view(request):
+    if request.method == 'POST':
+        form = GroupForm(request.POST)
+        if form.is_valid():
+            form.save()
+            return redirect('create-group')
+    else:
+        form = GroupForm()
+    return render(request, 'create_group.html', {'form': form})
+
+
+def add_expense(request):
+    if request.method == "POST":
+        form = ExpenseForm(request.POST)
+        if form.is_valid():
+            group = form.cleaned_data['group']
+            description = form.cleaned_data['description']
+            amount = form.cleaned_data['amount']
+            currency = form.cleaned_data['currency']
+            paid_by = form.cleaned_data['paid_by']
+            split_type = form.cleaned_data['split_type']
+
+            @retry_on_locked
+            @transaction.atomic
+            def save():
+                expense = Expense.objects.create(
+                    group=group, description=description,
+                    amount=amount, currency=currency, paid_by=paid_by, split_type=split_type
+                )
+                splits = Split.objects.bulk_create(build_splits(expense, form.cleaned_data['splits']))
+
+                record_expenses([(expense, splits)])
+
+            save()
+
+            return redirect('add-expense')
+    else:
+        form = ExpenseForm()
+
+    return render(request, 'add_expense.html', {'form': form})
+
+
+@api_view(['GET'])
+def group_balances_page(request, group_id):
+    result = group_balances(group_id)
+    if "error" in result:
+        return render(request, 'group_balances.html', {'balances': ["Group not found"]})
+    return render(request, 'group_balances.html', {'balances': result.get('balances', []), 'group_id': group_id})
+
+
+@require_POST
+def settle_all_page(request, group_id):
+    settle_all(get_object_or_404(Group, id=group_id))
+    return redirect('group-balances-page', group_id=group_id)
+
+
+def user_summary_page(request, user_id):
+    summary = user_summary(user_id)
+    if "error" in summary:
+        raise Http404(summary["error"])
+
+    return render(request, 'user_summary.html', {'summary': summary})
+
+
+def dashboard(request):
+    # Counters and the feed are callables: the template only calls them when
+    # a fragment keyed on the dashboard version is not cached
+    context = {
+        'dashboard_version': platform_stats.version(),
+        'stats': platform_stats.totals,
+        'recent_expenses': platform_stats.recent_expenses,
+    }
+    return render(request, 'dashboard.html', context)
+
+
+async def dashboard_async(request):
+    # Everything is fetched up front through the async cache and ORM (both
+    # cached under the dashboard version), so rendering touches no database
+    version = await platform_stats.aversion()
+    stats, recent_expenses = await asyncio.gather(
+        platform_stats.atotals(version), platform_stats.arecent_expenses(),
+    )
+    context = {'dashboard_version': version, 'stats': stats, 'recent_expenses': recent_expenses}
+    return render(request, 'dashboard.html', context)
@@ -0,0 +1,78 @@
+# core/pagination.py
+import base64
+import json
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """Newest-first cursor pagination on ``(created_at, id)``.
+
+    Unlike offset pagination every page is an index range scan, so page
+    1000 costs the same as page 1. Views name the timestamp column in
+    ``cursor_field`` (e.g. ``'expense__created_at'`` for splits); ``id``
+    breaks ties.
+    """
+    cursor_query_param = 'cursor'
+    limit_query_param = 'limit'
+    page_size = 50
+    max_page_size = 500
+
+    def get_cursor_field(self, view):
+        return getattr(view, 'cursor_field', 'created_at')
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            timestamp, pk = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+            created_at = parse_datetime(timestamp)
+            if created_at is None:
+                raise ValueError
+            return created_at, int(pk)
+        except (TypeError, ValueError):
+            raise ValidationError({self.cursor_query_param: "Invalid cursor."})
+
+    def encode_cursor(self, obj, field):
+        value = obj
+        for part in field.split('__'):
+            value = getattr(value, part)
+        payload = json.dumps([value.isoformat(), obj.pk])
+        return base64.urlsafe_b64encode(payload.encode()).decode()
+
+    def filter_queryset(self, queryset, request, view):
+        """Order the queryset and skip everything up to the request's cursor."""
+        field = self.get_cursor_field(view)
+        queryset = queryset.order_by(f'-{field}', '-id')
+        cursor = self.decode_cursor(request)
+        if cursor is not None:
+            created_at, pk = cursor
+            queryset = queryset.filter(Q(**{f'{field}__lt': created_at}) | Q(**{field: created_at, 'id__lt': pk}))
+        return queryset
+
+    def get_limit(self, request):
+        try:
+            limit = int(request.query_params[self.limit_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(limit, self.max_page_size))
+
+    def paginate_queryset(self, queryset, request, view=None):
+        limit = self.get_limit(request)
+        page = list(self.filter_queryset(queryset, request, view)[:limit + 1])
+
+        self.next_url = None
+        if len(page) > limit:
+            page = page[:limit]
+            cursor = self.encode_cursor(page[-1], self.get_cursor_field(view))
+            self.next_url = replace_query_param(request.build_absolute_uri(), self.cursor_query_param, cursor)
+        return page
+
+    def get_paginated_response(self, data):
+        return Response({'next': self.next_url, 'results': data})
@@ -0,0 +1,172 @@
+# core/platform_stats.py
+"""Precomputed dashboard data: platform counters and the recent-expenses feed.
+
+Counts of groups, users and expenses are kept in :class:`PlatformCounter`
+rows, updated in the same transaction as the write that changes them
+(signals for groups and users, :func:`core.ledger.record_expenses` for
+expenses), so the dashboard reads them with one small query instead of
+``COUNT(*)`` over whole tables. Each counter is spread over ``SHARDS``
+rows picked at random per write, so concurrent writers seldom wait on
+each other's row lock.
+
+The feed holds the latest ``FEED_SIZE`` expenses in the balance cache;
+new expenses are pushed onto it once their transaction commits, and it
+is rebuilt from the table when missing. Both bump a version token that
+keys the dashboard's template fragment cache.
+
+The ``a``-prefixed functions are the async equivalents for the async
+dashboard. They read through the async cache API and the async ORM, and
+they also cache the totals under the version, so a warm async dashboard
+runs no queries either.
+"""
+import random
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import F, Sum
+
+from .models import Expense, Group, PlatformCounter
+
+COUNTERS = ('groups', 'users', 'expenses')
+SHARDS = 8
+FEED_SIZE = 20
+
+_FEED_KEY = 'platform:recent-expenses'
+_VERSION_KEY = 'platform:dashboard:version'
+
+
+def _cache():
+    return caches[getattr(settings, 'BALANCE_CACHE_ALIAS', 'default')]
+
+
+def _timeout():
+    return getattr(settings, 'BALANCE_CACHE_TIMEOUT', 300)
+
+
+def increment(name, n=1):
+    shard = random.randrange(SHARDS)
+    if not PlatformCounter.objects.filter(name=name, shard=shard).update(value=F('value') + n):
+        counter, created = PlatformCounter.objects.get_or_create(name=name, shard=shard, defaults={'value': n})
+        if not created:
+            PlatformCounter.objects.filter(pk=counter.pk).update(value=F('value') + n)
+    changed()
+
+
+def _totals_query():
+    return PlatformCounter.objects.values('name').annotate(total=Sum('value')).values_list('name', 'total')
+
+
+def totals():
+    counts = dict.fromkeys(COUNTERS, 0)
+    counts.update(_totals_query())
+    return counts
+
+
+async def atotals(version):
+    key = f'platform:totals:{version}'
+    counts = await _cache().aget(key)
+    if counts is None:
+        counts = dict.fromkeys(COUNTERS, 0)
+        counts.update([row async for row in _totals_query()])
+        await _cache().aset(key, counts, _timeout())
+    return counts
+
+
+def recount():
+    """Reset every counter from the tables, e.g. after bulk writes that skipped the hooks."""
+    counts = {'groups': Group.objects.count(), 'users': User.objects.count(), 'expenses': Expense.objects.count()}
+    with transaction.atomic():
+        PlatformCounter.objects.all().delete()
+        PlatformCounter.objects.bulk_create([
+            PlatformCounter(name=name, shard=shard, value=count if shard == 0 else 0)
+            for name, count in counts.items() for shard in range(SHARDS)
+        ])
+        changed()
+    return counts
+
+
+def version():
+    cache = _cache()
+    value = cache.get(_VERSION_KEY)
+    if value is None:
+        cache.add(_VERSION_KEY, time.time_ns(), None)
+        value = cache.get(_VERSION_KEY)
+    return value
+
+
+async def aversion():
+    cache = _cache()
+    value = await cache.aget(_VERSION_KEY)
+    if value is None:
+        await cache.aadd(_VERSION_KEY, time.time_ns(), None)
+        value = await cache.aget(_VERSION_KEY)
+    return value
+
+
+def changed(drop_feed=False):
+    """Retire the cached dashboard fragments (and the feed) once the transaction commits."""
+    def bump():
+        cache = _cache()
+        if drop_feed:
+            cache.delete(_FEED_KEY)
+        try:
+            cache.incr(_VERSION_KEY)
+        except ValueError:
+            cache.set(_VERSION_KEY, time.time_ns(), None)
+
+    transaction.on_commit(bump)
+
+
+def _entry(expense, group_name):
+    return {
+        'id': expense.id, 'description': expense.description, 'amount': expense.amount,
+        'currency': expense.currency, 'group': group_name, 'created_at': expense.created_at,
+    }
+
+
+def _feed_query():
+    return Expense.objects.select_related('group').order_by('-created_at', '-id')[:FEED_SIZE]
+
+
+def recent_expenses(limit=5):
+    feed = _cache().get(_FEED_KEY)
+    if feed is None:
+        feed = [_entry(expense, expense.group.name) for expense in _feed_query()]
+        _cache().set(_FEED_KEY, feed, _timeout())
+    return feed[:limit]
+
+
+async def arecent_expenses(limit=5):
+    feed = await _cache().aget(_FEED_KEY)
+    if feed is None:
+        feed = [_entry(expense, expense.group.name) async for expense in _feed_query()]
+        await _cache().aset(_FEED_KEY, feed, _timeout())
+    return feed[:limit]
+
+
+def push_expenses(expenses):
+    """Add newly created expenses to the feed after commit (and count them now)."""
+    if not expenses:
+        return
+    increment('expenses', len(expenses))
+    # Write paths usually hold the group object already
+    group_names = {e.group_id: e.group.name for e in expenses if Expense.group.is_cached(e)}
+    missing = {e.group_id for e in expenses} - set(group_names)
+    if missing:
+        group_names.update(Group.objects.filter(id__in=missing).values_list('id', 'name'))
+    entries = [_entry(expense, group_names.get(expense.group_id)) for expense in expenses]
+
+    def push():
+        cache = _cache()
+        feed = cache.get(_FEED_KEY)
+        if feed is None:
+            return  # rebuilt from the table on the next read
+        # Read-modify-write: a concurrent push can be lost, which only costs
+        # an entry until the feed is next rebuilt
+        merged = sorted(entries + feed, key=lambda e: (e['created_at'], e['id']), reverse=True)
+        cache.set(_FEED_KEY, merged[:FEED_SIZE], _timeout())
+
+    transaction.on_commit(push)
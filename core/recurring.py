@@ -0,0 +1,150 @@
+# core/recurring.py
+"""Materialize recurring expense templates into expenses.
+
+:func:`run` loads every due template with one query on
+``recurring_due_idx`` and walks each template's missed periods up to the
+run date. The occurrences are written in chunks. Each chunk is one
+transaction with one ``bulk_create`` for expenses, one for splits, the
+ledger update, and a ``bulk_update`` that moves the templates'
+``next_due`` past what was written. A template's split amounts are
+computed once for all its occurrences, so the query count grows with the
+number of chunks, not occurrences.
+
+Generated expenses record their template and period, and
+``(recurring, period)`` is unique, so no period is ever materialized
+twice. If two runs overlap, the loser's chunk fails on the constraint
+and is rolled back.
+
+A caught-up occurrence is booked when it is written, not backdated to its
+period: its ``created_at``, and so its FX rate, are those of the run. The
+ledger's history events take the expense's ``created_at``, and an event
+dated behind a snapshot that has already been taken would be left out of
+every replay (see :mod:`core.history`). ``period`` keeps the date the
+occurrence was due.
+"""
+import calendar
+import datetime
+from decimal import Decimal
+from itertools import islice
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from . import fx
+from .ledger import record_expenses
+from .models import Expense, RecurringExpense, Split
+from .retry import retry_on_locked
+from .splits import SplitError, compute_batch
+
+DEFAULT_CHUNK_SIZE = 500
+
+
+def add_months(day, months, anchor_day):
+    """``day`` moved by ``months``, on ``anchor_day`` or the month's last day if it is shorter."""
+    month = day.month - 1 + months
+    year, month = day.year + month // 12, month % 12 + 1
+    return datetime.date(year, month, min(anchor_day, calendar.monthrange(year, month)[1]))
+
+
+def next_date(template, day):
+    if template.frequency == RecurringExpense.DAILY:
+        return day + datetime.timedelta(days=template.interval)
+    if template.frequency == RecurringExpense.WEEKLY:
+        return day + datetime.timedelta(weeks=template.interval)
+    months = template.interval * (12 if template.frequency == RecurringExpense.YEARLY else 1)
+    return add_months(day, months, template.start_date.day)
+
+
+def periods(template, until):
+    """Dates of the template's occurrences from ``next_due`` up to ``until``, inclusive."""
+    last = min(until, template.end_date) if template.end_date else until
+    day = template.next_due
+    while day <= last:
+        yield day
+        day = next_date(template, day)
+
+
+def due(today):
+    return RecurringExpense.objects.filter(active=True, next_due__lte=today).select_related('group').order_by('id')
+
+
+def _splits(expense, template, amounts):
+    return [
+        Split(
+            expense=expense, user_id=entry['user_id'], amount=amount,
+            percentage=Decimal(entry['percentage']) if template.split_type == 'percentage' else None,
+            shares=Decimal(entry['shares']) if template.split_type == 'shares' else None,
+        )
+        for entry, amount in zip(template.splits, amounts)
+    ]
+
+
+@retry_on_locked
+@transaction.atomic
+def _write_chunk(chunk):
+    """Write ``(template, split_amounts, period)`` occurrences; returns ``(created, existing)``."""
+    templates = {template.id: template for template, _, _ in chunk}
+    dates = [period for _, _, period in chunk]
+    existing = set(
+        Expense.objects.filter(recurring_id__in=templates, period__range=(min(dates), max(dates)))
+        .values_list('recurring_id', 'period')
+    )
+    new = [(template, amounts, period) for template, amounts, period in chunk if (template.id, period) not in existing]
+    expenses = Expense.objects.bulk_create([
+        Expense(
+            group=template.group, description=template.description, amount=template.amount,
+            currency=template.currency, paid_by_id=template.paid_by_id, split_type=template.split_type,
+            recurring=template, period=period,
+        )
+        for template, _, period in new
+    ])
+    entries = [(expense, _splits(expense, template, amounts)) for expense, (template, amounts, _) in zip(expenses, new)]
+    Split.objects.bulk_create([split for _, splits in entries for split in splits])
+    record_expenses(entries)
+
+    # A template's periods arrive in order, so the last one seen is the latest
+    for template, _, period in chunk:
+        template.next_due = next_date(template, period)
+        if template.end_date and template.next_due > template.end_date:
+            template.active = False
+    RecurringExpense.objects.bulk_update(templates.values(), ['next_due', 'active'])
+    return len(expenses), len(chunk) - len(new)
+
+
+def run(today=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Materialize every occurrence due on or before ``today`` (default: today)."""
+    today = today or timezone.localdate()
+    templates = list(due(today))
+    report = {'templates': len(templates), 'created': 0, 'existing': 0, 'errors': []}
+
+    valid, finished = [], []
+    for template, amounts in zip(templates, compute_batch((t.split_type, t.amount, t.splits) for t in templates)):
+        if isinstance(amounts, SplitError):
+            report['errors'].append({'recurring': template.id, 'error': str(amounts)})
+        elif template.end_date and template.next_due > template.end_date:
+            template.active = False
+            finished.append(template)
+        else:
+            valid.append((template, amounts))
+    if finished:
+        RecurringExpense.objects.bulk_update(finished, ['active'])
+
+    # Templates of a failed chunk are left for the next run: writing their
+    # later periods now would move next_due past the ones that failed
+    failed = set()
+    occurrences = (
+        (template, amounts, period)
+        for template, amounts in valid for period in periods(template, today)
+        if template.id not in failed
+    )
+    while chunk := list(islice(occurrences, chunk_size)):
+        try:
+            created, existing = _write_chunk(chunk)
+        except (IntegrityError, fx.RateMissing) as exc:
+            template_ids = sorted({template.id for template, _, _ in chunk})
+            failed.update(template_ids)
+            report['errors'].extend({'recurring': template_id, 'error': str(exc)} for template_id in template_ids)
+            continue
+        report['created'] += created
+        report['existing'] += existing
+    return report
@@ -0,0 +1,48 @@
+# core/retry.py
+"""Retry write transactions that lose the race for SQLite's write lock.
+
+SQLite allows one writer at a time. With ``busy_timeout`` a writer waits
+for the lock, but under sustained load it can still give up with
+"database is locked"; :func:`retry_on_locked` then reruns the whole
+transaction after a jittered exponential backoff. Only the outermost
+transaction can be retried, so inside an open ``atomic`` block the error
+is raised straight away for the caller's own transaction to handle.
+"""
+import functools
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.db import OperationalError, connection
+
+_retries = 0
+_retries_lock = threading.Lock()
+
+
+def retries():
+    """Lock errors retried so far in this process."""
+    return _retries
+
+
+def is_lock_error(exc):
+    message = str(exc).lower()
+    return 'database is locked' in message or 'database table is locked' in message or 'busy' in message
+
+
+def retry_on_locked(func):
+    @functools.wraps(func)
+    def wrapped(*args, **kwargs):
+        global _retries
+        attempts = getattr(settings, 'DB_LOCK_RETRIES', 5)
+        delay = getattr(settings, 'DB_LOCK_RETRY_DELAY_MS', 20) / 1000
+        for attempt in range(attempts):
+            try:
+                return func(*args, **kwargs)
+            except OperationalError as exc:
+                if attempt == attempts - 1 or connection.in_atomic_block or not is_lock_error(exc):
+                    raise
+            with _retries_lock:
+                _retries += 1
+            time.sleep(delay * 2 ** attempt * (1 + random.random()))
+    return wrapped
@@ -1,8 +1,12 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User
-from .models import Group, GroupMember, Expense, Split
-from django.core.exceptions import ObjectDoesNotExist
-from decimal import Decimal
+from .models import Group, GroupMember, Expense, Split, Settlement, Job, RecurringExpense
+from django.db import transaction
+from django.utils import timezone
+from . import fx, memberships
+from .ledger import record_expenses, record_settlements
+from .retry import retry_on_locked
+from .splits import SplitError, compute_amounts
 #user serializer basic info
 
 class UserSerializer(serializers.ModelSerializer):
@@ -20,20 +24,28 @@ class GroupSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Group
-        fields = ['id', 'name', 'created_at', 'members','member_ids']
+        fields = ['id', 'name', 'base_currency', 'created_at', 'members','member_ids']
 
+    def validate_base_currency(self, value):
+        value = validate_currency_code(value)
+        if not fx.has_rates(value):
+            raise serializers.ValidationError(f"No exchange rates loaded for {value}.")
+        return value
+
+    @transaction.atomic
     def create(self, validated_data):
         member_ids = validated_data.pop('member_ids', [])
         group = Group.objects.create(**validated_data)
+        try:
+            memberships.add_members(group, member_ids)
+        except memberships.MembershipError as exc:
+            # Rolls the group back too, so no half-created group is left behind
+            raise serializers.ValidationError(str(exc))
+        return group
 
-        for user_id in member_ids:
-            try:
-                user = User.objects.get(id=user_id)
-                GroupMember.objects.create(group=group, user=user)
-            except ObjectDoesNotExist:
-                raise serializers.ValidationError(f"User ID {user_id} does not exist")
 
-        return group  
+class MemberIdsSerializer(serializers.Serializer):
+    user_ids = serializers.ListField(child=serializers.IntegerField(), allow_empty=False, max_length=1000)
 
 #group member serializer
 
@@ -51,7 +63,7 @@ class ExpenseSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Expense
-        fields = ['id', 'description', 'amount', 'paid_by', 'group', 'split_type', 'created_at']
+        fields = ['id', 'description', 'amount', 'currency', 'paid_by', 'group', 'split_type', 'created_at']
 
 #Split serializer
 
@@ -61,13 +73,41 @@ class SplitSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Split
-        fields = ['id', 'expense', 'user', 'amount', 'percentage']
+        fields = ['id', 'expense', 'user', 'amount', 'percentage', 'shares']
+
+#expense listing serializer
+
+class ExpenseDetailSerializer(ExpenseSerializer):
+    splits = SplitSerializer(many=True, read_only=True)
+
+    class Meta(ExpenseSerializer.Meta):
+        fields = ExpenseSerializer.Meta.fields + ['splits']
 
 
 class SplitInputSerializer(serializers.Serializer):
     user_id = serializers.IntegerField()
-    amount = serializers.DecimalField(max_digits=10, decimal_places=2, required=False)
-    percentage = serializers.FloatField(required=False)
+    amount = serializers.DecimalField(max_digits=10, decimal_places=2, required=False)  # exact splits
+    percentage = serializers.DecimalField(max_digits=7, decimal_places=4, required=False)  # percentage splits
+    shares = serializers.DecimalField(max_digits=10, decimal_places=4, required=False)  # share splits
+
+def validate_currency_code(value):
+    value = value.upper()
+    if len(value) != 3 or not value.isalpha():
+        raise serializers.ValidationError("Enter a three-letter ISO currency code.")
+    return value
+
+def build_splits(expense, splits_data):
+    # splits_data entries carry a resolved 'user' and the 'amount' computed
+    # by core.splits; rows are returned unsaved for bulk_create
+    return [
+        Split(
+            expense=expense, user=split['user'], amount=split['amount'],
+            percentage=split.get('percentage') if expense.split_type == 'percentage' else None,
+            shares=split.get('shares') if expense.split_type == 'shares' else None,
+        )
+        for split in splits_data
+    ]
+
 
 class ExpenseCreateSerializer(serializers.ModelSerializer):
     splits = SplitInputSerializer(many=True)
@@ -75,35 +115,164 @@ class ExpenseCreateSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Expense
-        fields = ['id', 'group', 'description', 'amount', 'paid_by_id', 'split_type', 'created_at', 'splits']
+        fields = ['id', 'group', 'description', 'amount', 'currency', 'paid_by_id', 'split_type', 'created_at', 'splits']
+
+    def validate_amount(self, value):
+        if value <= 0:
+            raise serializers.ValidationError("Amount must be positive.")
+        return value
+
+    def validate_currency(self, value):
+        return validate_currency_code(value)
 
     def validate(self, data):
-        if data['split_type'] == 'equal':
-            if not data.get('splits'):
-                raise serializers.ValidationError("Splits are required.")
-        elif data['split_type'] == 'percentage':
-            total = sum(split['percentage'] for split in data['splits'])
-            if total != 100:
-                raise serializers.ValidationError("Total percentage must be 100.")
+        try:
+            amounts = compute_amounts(data['split_type'], data['amount'], data['splits'])
+        except SplitError as exc:
+            raise serializers.ValidationError(str(exc))
+        # Without a currency the expense is in the group's own currency,
+        # not the model default
+        data.setdefault('currency', data['group'].base_currency)
+        try:
+            fx.factor(data['currency'], data['group'].base_currency, timezone.localdate())
+        except fx.RateMissing as exc:
+            raise serializers.ValidationError(str(exc))
+        for split, amount in zip(data['splits'], amounts):
+            split['amount'] = amount
+
+        # Resolve the payer and every split user in one query and report
+        # all unknown IDs together
+        user_ids = {data['paid_by_id']} | {split['user_id'] for split in data['splits']}
+        if 'users' in self.context:
+            # Batch callers prefetch users for many rows at once
+            users = {user_id: self.context['users'][user_id] for user_id in user_ids if user_id in self.context['users']}
+        else:
+            users = User.objects.in_bulk(user_ids)
+        missing = sorted(user_ids - set(users))
+        if missing:
+            raise serializers.ValidationError(
+                f"User ID(s) {', '.join(str(user_id) for user_id in missing)} do not exist"
+            )
+        data['paid_by'] = users[data.pop('paid_by_id')]
+        for split in data['splits']:
+            split['user'] = users[split['user_id']]
         return data
 
     def create(self, validated_data):
         splits_data = validated_data.pop('splits')
-        paid_by_id = validated_data.pop('paid_by_id')
-        paid_by = User.objects.get(id=paid_by_id)
-
-        expense = Expense.objects.create(paid_by=paid_by, **validated_data)
-
-        if expense.split_type == 'equal':
-            share = expense.amount / len(splits_data)
-            for split in splits_data:
-                user = User.objects.get(id=split['user_id'])
-                Split.objects.create(expense=expense, user=user, amount=share)
-        elif expense.split_type == 'percentage':
-            for split in splits_data:
-                user = User.objects.get(id=split['user_id'])
-                percent = split['percentage']
-                amount = (expense.amount * Decimal(percent)) / Decimal(100)
-                Split.objects.create(expense=expense, user=user, amount=amount, percentage=percent)
-
-        return expense
+
+        # A retry reruns the whole transaction, so it must not consume its inputs
+        @retry_on_locked
+        @transaction.atomic
+        def write(data, splits_data):
+            expense = Expense.objects.create(**data)
+            splits = Split.objects.bulk_create(build_splits(expense, splits_data))
+            record_expenses([(expense, splits)])
+            return expense
+        return write(dict(validated_data), splits_data)
+
+
+#recurring expense serializer (the template; core.recurring creates the expenses)
+
+class RecurringExpenseSerializer(serializers.ModelSerializer):
+    splits = SplitInputSerializer(many=True)
+    paid_by_id = serializers.IntegerField()
+    start_date = serializers.DateField(required=False)
+    interval = serializers.IntegerField(min_value=1, max_value=366, required=False)
+
+    class Meta:
+        model = RecurringExpense
+        fields = [
+            'id', 'group', 'description', 'amount', 'currency', 'paid_by_id', 'split_type', 'splits',
+            'frequency', 'interval', 'start_date', 'end_date', 'next_due', 'active', 'created_at',
+        ]
+        read_only_fields = ['group', 'next_due', 'active']
+
+    def validate_amount(self, value):
+        if value <= 0:
+            raise serializers.ValidationError("Amount must be positive.")
+        return value
+
+    def validate_currency(self, value):
+        return validate_currency_code(value)
+
+    def validate(self, data):
+        group = self.context['group']
+        try:
+            compute_amounts(data['split_type'], data['amount'], data['splits'])
+        except SplitError as exc:
+            raise serializers.ValidationError(str(exc))
+        data.setdefault('currency', group.base_currency)
+        try:
+            fx.factor(data['currency'], group.base_currency, timezone.localdate())
+        except fx.RateMissing as exc:
+            raise serializers.ValidationError(str(exc))
+
+        # Occurrences are created unattended, so everyone involved must be a
+        # member of the group already
+        user_ids = {data['paid_by_id']} | {split['user_id'] for split in data['splits']}
+        members = set(GroupMember.objects.filter(group=group, user_id__in=user_ids).values_list('user_id', flat=True))
+        missing = sorted(user_ids - members)
+        if missing:
+            raise serializers.ValidationError(
+                f"User ID(s) {', '.join(str(user_id) for user_id in missing)} are not members of this group"
+            )
+
+        data.setdefault('start_date', timezone.localdate())
+        if data.get('end_date') and data['end_date'] < data['start_date']:
+            raise serializers.ValidationError("end_date cannot be before start_date.")
+        data['group'] = group
+        data['next_due'] = data['start_date']
+        # Stored as JSON, with decimals as strings
+        data['splits'] = [
+            {key: str(value) if key != 'user_id' else value for key, value in split.items()}
+            for split in data['splits']
+        ]
+        return data
+
+
+#settlement serializer
+
+class SettlementSerializer(serializers.ModelSerializer):
+    payer_id = serializers.IntegerField()
+    payee_id = serializers.IntegerField()
+
+    class Meta:
+        model = Settlement
+        fields = ['id', 'group', 'payer_id', 'payee_id', 'amount', 'created_at']
+        read_only_fields = ['group']
+
+    def validate_amount(self, value):
+        if value <= 0:
+            raise serializers.ValidationError("Amount must be positive.")
+        return value
+
+    def validate(self, data):
+        if data['payer_id'] == data['payee_id']:
+            raise serializers.ValidationError("Payer and payee must be different users.")
+        group = self.context['group']
+        user_ids = {data['payer_id'], data['payee_id']}
+        members = set(GroupMember.objects.filter(group=group, user_id__in=user_ids).values_list('user_id', flat=True))
+        missing = sorted(user_ids - members)
+        if missing:
+            raise serializers.ValidationError(
+                f"User ID(s) {', '.join(str(user_id) for user_id in missing)} are not members of this group"
+            )
+        data['group'] = group
+        return data
+
+    @retry_on_locked
+    @transaction.atomic
+    def create(self, validated_data):
+        settlement = Settlement.objects.create(**validated_data)
+        record_settlements([settlement])
+        return settlement
+
+
+#background job serializer (payloads can be large and are not echoed back)
+
+class JobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Job
+        fields = ['id', 'kind', 'status', 'result', 'error', 'created_at', 'started_at', 'finished_at']
+        read_only_fields = fields
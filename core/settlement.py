@@ -0,0 +1,128 @@
+# core/settlement.py
+"""Turn net balances into a list of suggested payments.
+
+Every strategy takes a mapping of party -> net balance (positive means the
+party is owed money) and returns ``(debtor, creditor, amount)`` tuples.
+Amounts are handled in integer paise internally so the pairing is exact.
+"""
+import heapq
+from decimal import Decimal
+
+# The exact solver walks every subset of the non-zero parties, so it is only
+# worth running on small groups.
+EXACT_SOLVER_LIMIT = 12
+
+DEFAULT_STRATEGY = 'greedy'
+
+
+def _to_paise(amount):
+    return int((Decimal(amount) * 100).to_integral_value())
+
+
+def _from_paise(paise):
+    return Decimal(paise).scaleb(-2)
+
+
+def _split_parties(balances):
+    creditors, debtors = [], []
+    for party, amount in balances.items():
+        paise = _to_paise(amount)
+        if paise > 0:
+            creditors.append((party, paise))
+        elif paise < 0:
+            debtors.append((party, -paise))
+    return creditors, debtors
+
+
+def _pair_greedily(creditors, debtors):
+    # Max-heaps keyed on amount; the insertion index breaks ties so the
+    # output is deterministic and parties themselves are never compared.
+    creditor_heap = [(-paise, i, party) for i, (party, paise) in enumerate(creditors)]
+    debtor_heap = [(-paise, i, party) for i, (party, paise) in enumerate(debtors)]
+    heapq.heapify(creditor_heap)
+    heapq.heapify(debtor_heap)
+
+    payments = []
+    while creditor_heap and debtor_heap:
+        credit, ci, creditor = heapq.heappop(creditor_heap)
+        debt, di, debtor = heapq.heappop(debtor_heap)
+        paise = min(-credit, -debt)
+        payments.append((debtor, creditor, _from_paise(paise)))
+        if -credit > paise:
+            heapq.heappush(creditor_heap, (credit + paise, ci, creditor))
+        if -debt > paise:
+            heapq.heappush(debtor_heap, (debt + paise, di, debtor))
+    return payments
+
+
+def greedy(balances):
+    """Pair the largest creditor with the largest debtor, O(N log N).
+
+    Produces at most N - 1 payments and is usually optimal or close to it.
+    """
+    creditors, debtors = _split_parties(balances)
+    return _pair_greedily(creditors, debtors)
+
+
+def exact(balances):
+    """Minimum number of payments, found by zero-sum subset partitioning.
+
+    A group of k parties whose balances cancel out can always be settled in
+    k - 1 payments, so the fewest payments overall comes from splitting the
+    parties into as many zero-sum groups as possible. Falls back to
+    :func:`greedy` above ``EXACT_SOLVER_LIMIT`` non-zero parties.
+    """
+    creditors, debtors = _split_parties(balances)
+    parties = [(party, paise) for party, paise in creditors] + \
+              [(party, -paise) for party, paise in debtors]
+    n = len(parties)
+    if n > EXACT_SOLVER_LIMIT:
+        return _pair_greedily(creditors, debtors)
+
+    full = (1 << n) - 1
+    sums = [0] * (full + 1)
+    for mask in range(1, full + 1):
+        low = mask & -mask
+        sums[mask] = sums[mask ^ low] + parties[low.bit_length() - 1][1]
+
+    # best[mask]: most zero-sum groups the parties in mask can be cut into,
+    # built by peeling one party at a time; parent records which mask we
+    # came from so the partition can be recovered.
+    best = [0] * (full + 1)
+    parent = [0] * (full + 1)
+    for mask in range(1, full + 1):
+        score, source = -1, 0
+        bits = mask
+        while bits:
+            low = bits & -bits
+            bits ^= low
+            if best[mask ^ low] > score:
+                score, source = best[mask ^ low], mask ^ low
+        best[mask] = score + (1 if sums[mask] == 0 else 0)
+        parent[mask] = source
+
+    payments = []
+    mask, chunk_end = full, full
+    while mask:
+        mask = parent[mask]
+        if mask == 0 or sums[mask] == 0:
+            chunk = chunk_end ^ mask
+            chunk_creditors = [parties[i] for i in range(n) if chunk >> i & 1 and parties[i][1] > 0]
+            chunk_debtors = [(parties[i][0], -parties[i][1]) for i in range(n) if chunk >> i & 1 and parties[i][1] < 0]
+            payments.extend(_pair_greedily(chunk_creditors, chunk_debtors))
+            chunk_end = mask
+    return payments
+
+
+STRATEGIES = {
+    'greedy': greedy,
+    'exact': exact,
+}
+
+
+def settle(balances, strategy=DEFAULT_STRATEGY):
+    try:
+        solver = STRATEGIES[strategy]
+    except KeyError:
+        raise ValueError(f"Unknown settlement strategy '{strategy}'")
+    return solver(balances)
@@ -0,0 +1,131 @@
+# core/signals.py
+from django.contrib.auth.models import User
+from django.db.models import F
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from . import balance_cache, fx, history, memberships, platform_stats
+from .ledger import to_cents
+from .models import Expense, Group, GroupMember, Split, MemberBalance, Settlement
+
+
+# Deletions can come from the admin or cascades rather than our own write
+# paths, so the ledger is unwound row by row here. Rows are only ever
+# updated, never created, so cascades that also remove the ledger rows are
+# harmless. Each unwound row is also logged as a 'deleted' event. For a
+# foreign-currency expense the payer was credited split by split, so the
+# payer's share is unwound with each split rather than with the expense.
+
+@receiver(post_delete, sender=Split)
+def unwind_split(sender, instance, **kwargs):
+    expense = (
+        Expense.objects.filter(id=instance.expense_id)
+        .values('group_id', 'group__base_currency', 'currency', 'paid_by_id', 'created_at').first()
+    )
+    if expense is None:
+        return
+    group_id = expense['group_id']
+    if expense['currency'] == expense['group__base_currency']:
+        amount = to_cents(instance.amount)
+        deltas = {instance.user_id: (0, -amount)}
+    else:
+        amount = fx.convert(instance.amount, expense['currency'], expense['group__base_currency'], fx.day_of(expense['created_at']))
+        deltas = {instance.user_id: (0, -amount)}
+        MemberBalance.objects.filter(
+            group_id=group_id, user_id=expense['paid_by_id']
+        ).update(paid=F('paid') - amount, net=F('net') - amount)
+        paid, owed = deltas.get(expense['paid_by_id'], (0, 0))
+        deltas[expense['paid_by_id']] = (paid - amount, owed)
+    MemberBalance.objects.filter(
+        group_id=group_id, user_id=instance.user_id
+    ).update(owed=F('owed') - amount, net=F('net') + amount)
+    history.append([history.event(group_id, 'deleted', deltas, instance.expense_id)])
+    balance_cache.invalidate([group_id], [instance.user_id, expense['paid_by_id']])
+
+
+@receiver(post_delete, sender=Expense)
+def unwind_expense(sender, instance, **kwargs):
+    base_currency = Group.objects.filter(id=instance.group_id).values_list('base_currency', flat=True).first()
+    if base_currency is not None and instance.currency != base_currency:
+        return
+    amount = to_cents(instance.amount)
+    MemberBalance.objects.filter(
+        group_id=instance.group_id, user_id=instance.paid_by_id
+    ).update(paid=F('paid') - amount, net=F('net') - amount)
+    history.append([history.event(instance.group_id, 'deleted', {instance.paid_by_id: (-amount, 0)}, instance.id)])
+    balance_cache.invalidate([instance.group_id], [instance.paid_by_id])
+
+
+@receiver(post_delete, sender=Settlement)
+def unwind_settlement(sender, instance, **kwargs):
+    amount = to_cents(instance.amount)
+    MemberBalance.objects.filter(
+        group_id=instance.group_id, user_id=instance.payer_id
+    ).update(settled=F('settled') - amount, net=F('net') - amount)
+    MemberBalance.objects.filter(
+        group_id=instance.group_id, user_id=instance.payee_id
+    ).update(settled=F('settled') + amount, net=F('net') + amount)
+    history.append([history.event(
+        instance.group_id, 'deleted', {instance.payer_id: (0, 0, -amount), instance.payee_id: (0, 0, amount)},
+    )])
+    balance_cache.invalidate([instance.group_id], [instance.payer_id, instance.payee_id])
+
+
+# Memberships added one at a time (GroupMember.objects.create) or through
+# group.members (the group form) keep the user -> groups index current; the
+# bulk paths in core.memberships invalidate it themselves.
+
+@receiver(post_save, sender=GroupMember)
+def membership_saved(sender, instance, created, **kwargs):
+    if created:
+        memberships.invalidate([instance.user_id], [instance.group_id])
+
+
+@receiver(m2m_changed, sender=Group.members.through)
+def members_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if action == 'pre_clear':
+        # pk_set is not provided for clear(), so read the members before they go
+        if reverse:
+            pk_set = set(GroupMember.objects.filter(user=instance).values_list('group_id', flat=True))
+        else:
+            pk_set = set(GroupMember.objects.filter(group=instance).values_list('user_id', flat=True))
+    if reverse:
+        memberships.invalidate([instance.pk], pk_set)
+    else:
+        memberships.invalidate(pk_set, [instance.pk])
+
+
+# Platform counters behind the dashboard (core.platform_stats). Expenses are
+# counted by record_expenses, which also covers bulk imports.
+
+@receiver(post_save, sender=Group)
+def group_saved(sender, instance, created, **kwargs):
+    if created:
+        platform_stats.increment('groups')
+    else:
+        platform_stats.changed(drop_feed=True)  # the feed shows group names
+
+
+@receiver(post_delete, sender=Group)
+def group_deleted(sender, instance, **kwargs):
+    platform_stats.increment('groups', -1)
+    platform_stats.changed(drop_feed=True)
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, **kwargs):
+    if created:
+        platform_stats.increment('users')
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    platform_stats.increment('users', -1)
+
+
+@receiver(post_delete, sender=Expense)
+def expense_deleted(sender, instance, **kwargs):
+    platform_stats.increment('expenses', -1)
+    platform_stats.changed(drop_feed=True)
@@ -0,0 +1,164 @@
+# core/splits.py
+"""Exact split computation in integer paise.
+
+An expense amount is converted to paise once, divided between the
+participants with integer arithmetic, and any leftover paise are handed
+out by the largest-remainder method (ties go to the earlier participant).
+The shares therefore always add up to the expense amount exactly and the
+result is deterministic. Decimals are only touched when converting the
+inputs to integers and the shares back, and :func:`compute_batch` does
+each distinct conversion once per batch, so the per-row work of a large
+import or recompute is integer arithmetic.
+
+Supported split types:
+
+- ``equal``: everyone gets the same share.
+- ``percentage``: ``percentage`` per participant, summing to 100.
+- ``exact``: ``amount`` per participant, summing to the expense amount.
+- ``shares``: ``shares`` weight per participant, e.g. 2 for a couple.
+"""
+import heapq
+from decimal import Decimal, InvalidOperation
+
+SPLIT_TYPES = [
+    ('equal', 'Equal'),
+    ('percentage', 'Percentage'),
+    ('exact', 'Exact amounts'),
+    ('shares', 'Shares'),
+]
+
+# Percentages and share weights are accepted with up to this many decimal
+# places and handled as integers scaled by 10 ** WEIGHT_PLACES.
+WEIGHT_PLACES = 4
+_WEIGHT_SCALE = 10 ** WEIGHT_PLACES
+_HUNDRED_PERCENT = 100 * _WEIGHT_SCALE
+
+
+class SplitError(ValueError):
+    pass
+
+
+def to_paise(amount):
+    value = Decimal(amount).scaleb(2)
+    if value != value.to_integral_value():
+        raise SplitError(f"{amount} has more than two decimal places.")
+    return int(value)
+
+
+def from_paise(paise):
+    return Decimal(paise).scaleb(-2)
+
+
+def _to_weight(value, name):
+    try:
+        scaled = Decimal(value).scaleb(WEIGHT_PLACES)
+    except (InvalidOperation, TypeError, ValueError):
+        raise SplitError(f"Invalid {name} {value!r}.")
+    if scaled != scaled.to_integral_value():
+        raise SplitError(f"{name.capitalize()} {value} has more than {WEIGHT_PLACES} decimal places.")
+    if scaled < 0:
+        raise SplitError(f"{name.capitalize()} cannot be negative.")
+    return int(scaled)
+
+
+def allocate(total, weights):
+    """Split ``total`` paise proportionally to integer ``weights``."""
+    weight_sum = sum(weights)
+    if weight_sum <= 0:
+        raise SplitError("At least one participant needs a non-zero weight.")
+    shares, remainders = [], []
+    for index, weight in enumerate(weights):
+        share, remainder = divmod(total * weight, weight_sum)
+        shares.append(share)
+        remainders.append((-remainder, index))
+    leftover = total - sum(shares)
+    for _, index in heapq.nsmallest(leftover, remainders):
+        shares[index] += 1
+    return shares
+
+
+def compute_paise(split_type, total, entries, to_weight=_to_weight, to_paise=to_paise):
+    """Return each participant's share of ``total`` paise.
+
+    ``entries`` are dicts carrying the per-participant input for the split
+    type (``percentage``, ``amount`` or ``shares``); equal splits only need
+    one entry per participant. ``to_weight`` and ``to_paise`` convert the
+    entries' values; :func:`compute_batch` passes memoized ones.
+    """
+    if not entries:
+        raise SplitError("Splits are required.")
+
+    if split_type == 'equal':
+        return allocate(total, [1] * len(entries))
+
+    if split_type == 'percentage':
+        weights = [to_weight(entry.get('percentage'), 'percentage') for entry in entries]
+        if sum(weights) != _HUNDRED_PERCENT:
+            raise SplitError("Total percentage must be 100.")
+        return allocate(total, weights)
+
+    if split_type == 'shares':
+        return allocate(total, [to_weight(entry.get('shares'), 'shares') for entry in entries])
+
+    if split_type == 'exact':
+        try:
+            shares = [to_paise(entry['amount']) for entry in entries]
+        except (KeyError, InvalidOperation, TypeError):
+            raise SplitError("Every split needs an amount.")
+        if any(share < 0 for share in shares):
+            raise SplitError("Split amounts cannot be negative.")
+        if sum(shares) != total:
+            raise SplitError(f"Split amounts add up to {from_paise(sum(shares))}, not {from_paise(total)}.")
+        return shares
+
+    raise SplitError(f"Unknown split type '{split_type}'.")
+
+
+def compute_amounts(split_type, amount, entries):
+    """Like :func:`compute_paise` but takes and returns Decimal rupee amounts."""
+    return [from_paise(paise) for paise in compute_paise(split_type, to_paise(amount), entries)]
+
+
+class _Memo:
+    """A conversion memoized by its input value, for the length of one batch.
+
+    Amounts, percentages and share weights repeat heavily across rows, so
+    most lookups skip Decimal entirely. Unhashable values and failed
+    conversions are not memoized.
+    """
+
+    def __init__(self, convert, limit=100_000):
+        self.convert = convert
+        self.limit = limit
+        self.memo = {}
+
+    def __call__(self, value, *args):
+        try:
+            return self.memo[value]
+        except KeyError:
+            pass
+        except TypeError:
+            return self.convert(value, *args)
+        result = self.convert(value, *args)
+        if len(self.memo) >= self.limit:
+            self.memo.clear()
+        self.memo[value] = result
+        return result
+
+
+def compute_batch(rows):
+    """Compute splits for many ``(split_type, amount, entries)`` rows.
+
+    Yields a list of Decimal amounts per row, or the :class:`SplitError`
+    instance for rows that are invalid, so one bad row does not stop the
+    batch. Amounts, weights and resulting shares are converted between
+    Decimal and integers once per distinct value for the whole batch.
+    """
+    paise, weight, rupees = _Memo(to_paise), _Memo(_to_weight), _Memo(from_paise)
+    for split_type, amount, entries in rows:
+        try:
+            shares = compute_paise(split_type, paise(amount), entries, weight, paise)
+        except SplitError as exc:
+            yield exc
+            continue
+        yield [rupees(share) for share in shares]
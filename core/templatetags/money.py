@@ -0,0 +1,13 @@
+from django import template
+
+from core.currency import DEFAULT_CURRENCY, format_money
+
+register = template.Library()
+
+
+@register.filter
+def money(amount, currency=None):
+    """``{{ amount|money:currency }}``, e.g. ₹12.50 or 3.00 CHF."""
+    if amount in (None, ''):
+        return ''
+    return format_money(amount, currency or DEFAULT_CURRENCY)
@@ -1,3 +1,1095 @@
-from django.test import TestCase
+import asyncio
+import json
+import os
+import tempfile
+from datetime import date, timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.management import call_command, CommandError
+from django.db import IntegrityError, OperationalError, connection, transaction
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import Resolver404, resolve
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from . import analytics, balance_cache, balance_events, db_router, fx, history, jobs, ledger, memberships, platform_stats, recurring, splits
+from .ledger import record_expenses
+from .management.commands import startup_profile
+from .metrics import registry
+from .middleware import QueryRecorder, ReplicaStickinessMiddleware
+from .retry import retry_on_locked
+from .models import Group, GroupMember, Expense, Split, MemberBalance, ExpenseEvent, BalanceSnapshot, Settlement, FxRate, Job, PlatformCounter, RecurringExpense
+from .serializers import ExpenseCreateSerializer
+from .settlement import greedy, exact
+from .splits import SplitError, allocate, compute_amounts, compute_batch, compute_paise
+from .utils import calculate_group_balances, calculate_user_summary, group_balances_etag
+
+
+def make_group(name, member_count):
+    group = Group.objects.create(name=name)
+    users = [User.objects.create(username=f"{name}-u{i}") for i in range(member_count)]
+    for user in users:
+        GroupMember.objects.create(group=group, user=user)
+    return group, users
+
+
+def add_equal_expense(group, paid_by, amount, members):
+    expense = Expense.objects.create(
+        group=group, description='test', amount=Decimal(amount),
+        paid_by=paid_by, split_type='equal'
+    )
+    shares = compute_amounts('equal', expense.amount, members)
+    splits = [Split.objects.create(expense=expense, user=user, amount=share) for user, share in zip(members, shares)]
+    record_expenses([(expense, splits)])
+    return expense
+
+
+class BalanceTestCase(TestCase):
+    def setUp(self):
+        # The balance cache and rate memo are process-wide and outlive each test's rollback
+        caches[settings.BALANCE_CACHE_ALIAS].clear()
+        fx.clear_memo()
+
+
+class GroupBalanceTests(BalanceTestCase):
+    def test_missing_group(self):
+        self.assertEqual(calculate_group_balances(999999), {"error": "Group not found"})
+
+    def test_transactions(self):
+        group, (a, b, c) = make_group('trip', 3)
+        add_equal_expense(group, a, '90.00', [a, b, c])
+        add_equal_expense(group, b, '30.00', [a, b, c])
+
+        self.assertEqual(calculate_group_balances(group.id), {"balances": [
+            "trip-u2 owes trip-u0 ₹40.00",
+            "trip-u1 owes trip-u0 ₹10.00",
+        ]})
+
+    def test_query_count_is_flat(self):
+        small, small_users = make_group('small', 3)
+        large, large_users = make_group('large', 60)
+        add_equal_expense(small, small_users[0], '30.00', small_users)
+        add_equal_expense(large, large_users[0], '600.00', large_users)
+
+        with self.assertNumQueries(3):
+            calculate_group_balances(small.id)
+        with self.assertNumQueries(3):
+            calculate_group_balances(large.id)
+
+    def test_strategy_query_param(self):
+        group, (a, b) = make_group('pair', 2)
+        add_equal_expense(group, a, '10.00', [a, b])
+        client = APIClient()
+
+        response = client.get(f'/api/groups/{group.id}/balances/', {'strategy': 'exact'})
+        self.assertEqual(response.json(), {"balances": ["pair-u1 owes pair-u0 ₹5.00"]})
+        response = client.get(f'/api/groups/{group.id}/balances/', {'strategy': 'bogus'})
+        self.assertEqual(response.status_code, 400)
+
+
+class LedgerTests(BalanceTestCase):
+    def setUp(self):
+        super().setUp()
+        self.group, self.users = make_group('flat', 3)
+        self.client = APIClient()
+
+    def net(self, user):
+        return MemberBalance.objects.get(group=self.group, user=user).net
+
+    def test_api_write_updates_ledger(self):
+        a, b, c = self.users
+        response = self.client.post('/api/expenses/', {
+            'group': self.group.id, 'description': 'rent', 'amount': '300.00',
+            'paid_by_id': a.id, 'split_type': 'percentage',
+            'splits': [{'user_id': a.id, 'percentage': 50}, {'user_id': b.id, 'percentage': 30},
+                       {'user_id': c.id, 'percentage': 20}],
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([self.net(u) for u in self.users], [Decimal('150.00'), Decimal('-90.00'), Decimal('-60.00')])
+
+        response = self.client.get(f'/api/users/{b.id}/balances/')
+        self.assertEqual(response.json()['net_balance'], -90.0)
+
+    def test_unknown_users_reported_together(self):
+        a = self.users[0]
+        response = self.client.post('/api/expenses/', {
+            'group': self.group.id, 'description': 'x', 'amount': '10.00', 'paid_by_id': a.id,
+            'split_type': 'equal', 'splits': [{'user_id': a.id}, {'user_id': 99998}, {'user_id': 99999}],
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("99998, 99999", str(response.json()))
+        self.assertFalse(Expense.objects.exists())
+
+    def test_negative_amounts_rejected(self):
+        a, b, c = self.users
+        response = self.client.post('/api/expenses/', {
+            'group': self.group.id, 'description': 'x', 'amount': '-10.00', 'paid_by_id': a.id,
+            'split_type': 'equal', 'splits': [{'user_id': a.id}],
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+
+        expense = add_equal_expense(self.group, a, '10.00', [a])
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Split.objects.create(expense=expense, user=b, amount=Decimal('-1.00'))
+
+    def test_split_writes_are_bulk(self):
+        group, users = make_group('wide', 40)
+
+        def post(members):
+            serializer = ExpenseCreateSerializer(data={
+                'group': group.id, 'description': 'x', 'amount': '100.00', 'paid_by_id': users[0].id,
+                'split_type': 'equal', 'splits': [{'user_id': u.id} for u in members],
+            })
+            serializer.is_valid(raise_exception=True)
+            with CaptureQueriesContext(connection) as queries:
+                serializer.save()
+            return len(queries)
+
+        self.assertEqual(post(users[:2]), post(users))
+
+    def test_delete_unwinds_ledger(self):
+        a, b, c = self.users
+        expense = add_equal_expense(self.group, a, '30.00', self.users)
+        expense.delete()
+        self.assertEqual([self.net(u) for u in self.users], [Decimal(0)] * 3)
+
+    def test_rebuild_command(self):
+        a, b, c = self.users
+        add_equal_expense(self.group, a, '30.00', self.users)
+        MemberBalance.objects.filter(user=b).update(owed=0, net=0)
+
+        with self.assertRaises(CommandError):
+            call_command('rebuild_balances', verify=True, stdout=StringIO())
+        call_command('rebuild_balances', stdout=StringIO())
+        call_command('rebuild_balances', verify=True, stdout=StringIO())
+        self.assertEqual(self.net(b), Decimal('-10.00'))
+
+
+class ImportTests(BalanceTestCase):
+    def setUp(self):
+        super().setUp()
+        self.group, self.users = make_group('import', 3)
+
+    def row(self, amount, **overrides):
+        row = {
+            'group': self.group.id, 'description': 'imported', 'amount': amount,
+            'paid_by_id': self.users[0].id, 'split_type': 'equal',
+            'splits': [{'user_id': u.id} for u in self.users],
+        }
+        row.update(overrides)
+        return row
+
+    def test_batch_endpoint_reports_bad_rows(self):
+        rows = [self.row('30.00'), self.row('60.00', paid_by_id=99999), self.row('90.00', group=99999)]
+        response = APIClient().post('/api/expenses/batch/', rows, format='json')
+
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual(len(response.json()['created']), 1)
+        self.assertEqual([error['row'] for error in response.json()['errors']], [1, 2])
+        self.assertEqual(MemberBalance.objects.get(group=self.group, user=self.users[0]).net, Decimal('20.00'))
+
+    def test_batch_endpoint_rejects_non_objects_and_empty_lists(self):
+        response = APIClient().post('/api/expenses/batch/', [self.row('30.00'), 'DROP TABLE', 7], format='json')
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual(response.json()['errors'], [
+            {'row': 1, 'errors': ['Row 1: expected an object']},
+            {'row': 2, 'errors': ['Row 2: expected an object']},
+        ])
+        response = APIClient().post('/api/expenses/batch/', [], format='json')
+        self.assertEqual((response.status_code, response.json()), (400, {'error': 'The list of expenses is empty'}))
+
+    def test_import_command_streams_in_chunks(self):
+        lines = [json.dumps(self.row(f'{i}.00')) for i in range(1, 8)] + ['{not json']
+        with tempfile.NamedTemporaryFile('w', suffix='.jsonl', delete=False) as handle:
+            handle.write('\n'.join(lines))
+        self.addCleanup(os.remove, handle.name)
+
+        err = StringIO()
+        call_command('import_expenses', handle.name, chunk_size=3, stdout=StringIO(), stderr=err)
+        self.assertEqual(Expense.objects.count(), 7)
+        self.assertEqual(Split.objects.count(), 21)
+        self.assertIn('row 8', err.getvalue())
+
+
+class ListingTests(BalanceTestCase):
+    def setUp(self):
+        super().setUp()
+        self.group, self.users = make_group('list', 3)
+        self.expenses = [add_equal_expense(self.group, self.users[i % 3], f'{i + 1}.00', self.users) for i in range(5)]
+        self.client = APIClient()
+
+    def test_group_expenses_keyset_pages(self):
+        url, seen = f'/api/groups/{self.group.id}/expenses/?limit=2', []
+        while url:
+            with self.assertNumQueries(3):
+                body = self.client.get(url).json()
+            seen.extend(expense['id'] for expense in body['results'])
+            self.assertTrue(all(len(expense['splits']) == 3 for expense in body['results']))
+            url = body['next']
+        self.assertEqual(seen, [expense.id for expense in reversed(self.expenses)])
+
+    def test_user_splits_export_streams_jsonl(self):
+        response = self.client.get(f'/api/users/{self.users[1].id}/splits/', {'export': 'jsonl'})
+        self.assertTrue(response.streaming)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual([json.loads(line)['expense'] for line in lines], [e.id for e in reversed(self.expenses)])
+
+    def test_bad_cursor(self):
+        response = self.client.get(f'/api/groups/{self.group.id}/expenses/', {'cursor': 'nope'})
+        self.assertEqual(response.status_code, 400)
+
+
+class BalanceCacheTests(BalanceTestCase):
+    def setUp(self):
+        super().setUp()
+        self.group, self.users = make_group('cached', 2)
+        self.client = APIClient()
+        balance_cache.reset_stats()
+
+    def balances(self):
+        return self.client.get(f'/api/groups/{self.group.id}/balances/').json()['balances']
+
+    def test_serializer_write_invalidates(self):
+        a, b = self.users
+        self.assertEqual(self.balances(), [])
+        with self.assertNumQueries(0):
+            self.assertEqual(self.balances(), [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/api/expenses/', {
+                'group': self.group.id, 'description': 'x', 'amount': '10.00', 'paid_by_id': a.id,
+                'split_type': 'equal', 'splits': [{'user_id': a.id}, {'user_id': b.id}],
+            }, format='json')
+        self.assertEqual(self.balances(), ["cached-u1 owes cached-u0 ₹5.00"])
+        self.assertEqual(balance_cache.stats()['hits'], 1)
+        self.assertEqual(balance_cache.stats()['misses'], 2)
+
+    def test_add_expense_invalidates_user_summary(self):
+        a, b = self.users
+        self.assertEqual(self.client.get(f'/api/users/{b.id}/balances/').json()['net_balance'], 0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/expenses/add/', {
+                'group': self.group.id, 'description': 'x', 'amount': '10.00', 'paid_by': a.id,
+                'split_type': 'equal', 'members': [a.id, b.id],
+            })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.client.get(f'/api/users/{b.id}/balances/').json()['net_balance'], -5.0)
+
+    def test_stats_are_for_staff_only(self):
+        self.balances()
+        self.assertEqual(self.client.get('/api/cache/stats/').status_code, 403)
+        self.client.force_authenticate(User.objects.create(username='ops', is_staff=True))
+        self.assertEqual(self.client.get('/api/cache/stats/').json(), {'hits': 0, 'misses': 1, 'invalidations': 0})
+
+    def test_delete_invalidates(self):
+        a, b = self.users
+        expense = add_equal_expense(self.group, a, '10.00', self.users)
+        self.assertEqual(len(self.balances()), 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            expense.delete()
+        self.assertEqual(self.balances(), [])
+
+
+class MetricsTests(BalanceTestCase):
+    def setUp(self):
+        super().setUp()
+        registry.reset()
+
+    def test_server_timing_and_prometheus_endpoint(self):
+        group, users = make_group('metrics', 2)
+        response = APIClient().get(f'/api/groups/{group.id}/balances/')
+        self.assertRegex(response['Server-Timing'], r'db;dur=[\d.]+;desc="3 queries"')
+
+        client = APIClient()
+        self.assertEqual(client.get('/api/_metrics').status_code, 403)
+        client.force_authenticate(User.objects.create(username='prometheus', is_staff=True))
+        body = client.get('/api/_metrics').content.decode()
+        self.assertIn('splitwise_http_requests_total{view="api/groups/<int:group_id>/balances/"} 1', body)
+        self.assertIn('splitwise_db_queries_total{view="api/groups/<int:group_id>/balances/"} 3', body)
+
+    @override_settings(SLOW_REQUEST_THRESHOLD_MS=0)
+    def test_slow_requests_are_logged(self):
+        with self.assertLogs('core.metrics', level='WARNING') as logs:
+            APIClient().get('/api/')
+        self.assertIn('Slow request GET /api/', logs.output[0])
+
+    def test_duplicate_statements_detected(self):
+        recorder = QueryRecorder()
+        users = [User.objects.create(username=f'dup{i}') for i in range(6)]
+        with connection.execute_wrapper(recorder):
+            for user in users:
+                User.objects.get(id=user.id)
+        self.assertEqual(list(recorder.duplicates(5).values()), [6])
+
+
+class UserSummaryTests(BalanceTestCase):
+    def test_per_group_and_counterparty_breakdown(self):
+        trip, (a, b) = make_group('trip', 2)
+        flat = Group.objects.create(name='flat')
+        c = User.objects.create(username='c')
+        GroupMember.objects.bulk_create([GroupMember(group=flat, user=a), GroupMember(group=flat, user=c)])
+        add_equal_expense(trip, b, '100.00', [a, b])
+        add_equal_expense(flat, a, '30.00', [a, c])
+
+        summary = calculate_user_summary(a.id)
+        self.assertEqual(summary['net_balance'], Decimal('-35.00'))
+        self.assertEqual([(g['group'], g['net']) for g in summary['groups']], [('trip', Decimal('-50.00')), ('flat', Decimal('15.00'))])
+        self.assertEqual([(p['user'], p['net']) for p in summary['counterparties']], [('trip-u1', Decimal('-50.00')), ('c', Decimal('15.00'))])
+
+    def test_query_count_is_flat(self):
+        user = User.objects.create(username='power')
+        for i in range(2):
+            group, users = make_group(f'g{i}', 3)
+            GroupMember.objects.create(group=group, user=user)
+            add_equal_expense(group, user, '30.00', users + [user])
+        # One more while the membership index is cold
+        with self.assertNumQueries(7):
+            calculate_user_summary(user.id)
+        with self.assertNumQueries(6):
+            calculate_user_summary(user.id)
+        for i in range(2, 12):
+            group, users = make_group(f'g{i}', 3)
+            GroupMember.objects.create(group=group, user=user)
+            add_equal_expense(group, users[0], '30.00', users + [user])
+        with self.assertNumQueries(7):
+            self.assertEqual(len(calculate_user_summary(user.id)['groups']), 12)
+
+    def test_page_and_api_agree(self):
+        group, (a, b) = make_group('agree', 2)
+        add_equal_expense(group, a, '10.00', [a, b])
+        api = APIClient().get(f'/api/users/{b.id}/balances/').json()
+        page = self.client.get(f'/api/users/{b.id}/summary/page/')
+        self.assertEqual(api['net_balance'], -5.0)
+        self.assertEqual(page.context['summary']['net_balance'], Decimal('-5.00'))
+        self.assertContains(page, 'You owe <strong>agree-u0</strong>')
+
+
+class AsyncViewTests(BalanceTestCase):
+    def test_async_endpoints_match_sync(self):
+        group, (a, b, c) = make_group('async', 3)
+        add_equal_expense(group, a, '90.00', [a, b, c])
+        for sync_path, async_path in [
+            (f'/api/groups/{group.id}/balances/?strategy=exact', f'/api/async/groups/{group.id}/balances/?strategy=exact'),
+            (f'/api/users/{b.id}/balances/', f'/api/async/users/{b.id}/balances/'),
+        ]:
+            caches[settings.BALANCE_CACHE_ALIAS].clear()
+            expected = self.client.get(sync_path).json()
+            caches[settings.BALANCE_CACHE_ALIAS].clear()
+            self.assertEqual(self.client.get(async_path).json(), expected)
+        self.assertEqual(self.client.get('/api/async/groups/999999/balances/').status_code, 404)
+        self.assertEqual(self.client.get('/api/async/users/999999/balances/').status_code, 404)
+        self.assertEqual(self.client.get(f'/api/async/groups/{group.id}/balances/?strategy=nope').status_code, 400)
+
+    def test_async_dashboard(self):
+        group, (a, b) = make_group('dash', 2)
+        add_equal_expense(group, a, '10.00', [a, b])
+        response = self.client.get('/api/async/dashboard/')
+        self.assertContains(response, '<p class="text-3xl text-green-600">2</p>', html=True)
+        self.assertContains(response, '<em>dash</em>', html=True)
+        self.assertIn('db;dur=', response['Server-Timing'])
+        response = self.client.get('/api/async/dashboard/')
+        self.assertIn('desc="0 queries"', response['Server-Timing'])
+
+
+class ConditionalBalanceTests(BalanceTestCase):
+    def test_unchanged_balances_answer_304_without_queries(self):
+        group, (a, b) = make_group('etag', 2)
+        url = f'/api/groups/{group.id}/balances/'
+        first = self.client.get(url)
+        etag = first['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(self.client.get(f'{url}?strategy=exact', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            add_equal_expense(group, a, '10.00', [a, b])
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.json()['balances'], ['etag-u1 owes etag-u0 ₹5.00'])
+
+    def test_user_summary_and_async_views(self):
+        group, (a, b) = make_group('etag-user', 2)
+        etag = self.client.get(f'/api/users/{b.id}/balances/')['ETag']
+        self.assertEqual(self.client.get(f'/api/async/users/{b.id}/balances/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        etag = self.client.get(f'/api/async/groups/{group.id}/balances/')['ETag']
+        self.assertEqual(self.client.get(f'/api/groups/{group.id}/balances/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertNotIn('ETag', self.client.get('/api/users/999999/balances/'))
+
+
+class BalanceStreamTests(BalanceTestCase):
+    async def test_stream_pushes_committed_changes(self):
+        group, (a, b) = await sync_to_async(make_group)('stream', 2)
+        response = await self.async_client.get(f'/api/groups/{group.id}/balances/stream/')
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        events = aiter(response.streaming_content)
+        first = (await anext(events)).decode()
+        self.assertIn('event: balances\n', first)
+        self.assertIn('data: {"balances":[]}', first)
+
+        def write():
+            with self.captureOnCommitCallbacks(execute=True):
+                add_equal_expense(group, a, '10.00', [a, b])
+
+        await sync_to_async(write)()
+        second = (await asyncio.wait_for(anext(events), 5)).decode()
+        self.assertIn('stream-u1 owes stream-u0', second)
+        # On disconnect the ASGI handler cancels the task sending the response
+        waiting = asyncio.ensure_future(anext(events))
+        await asyncio.sleep(0.01)
+        waiting.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await waiting
+        self.assertEqual(balance_events.broker().subscriber_count(), 0)
+
+    @override_settings(BALANCE_STREAM_HEARTBEAT=0.01)
+    async def test_reconnect_skips_unchanged_balances(self):
+        group, _ = await sync_to_async(make_group)('resume', 2)
+        response = await self.async_client.get(f'/api/groups/{group.id}/balances/stream/')
+        events = aiter(response.streaming_content)
+        event_id = (await anext(events)).decode().split('id: ')[1].split('\n')[0]
+        await events.aclose()
+        response = await self.async_client.get(f'/api/groups/{group.id}/balances/stream/', headers={'Last-Event-ID': event_id})
+        events = aiter(response.streaming_content)
+        self.assertEqual(await anext(events), b': keepalive\n\n')
+        await events.aclose()
+        self.assertEqual((await self.async_client.get('/api/groups/999999/balances/stream/')).status_code, 404)
+
+    @override_settings(BALANCE_EVENTS_POLL_INTERVAL=0.01)
+    async def test_cache_broker_sees_other_processes(self):
+        broker = balance_events.CacheBroker()
+        await balance_cache.aget_version(balance_cache.GROUP, 7)
+        with broker.subscribe(7) as subscription:
+            self.assertFalse(await subscription.wait(0.05))
+            # Another process bumps the shared version without publishing here
+            balance_cache._bump(balance_cache.GROUP, [7])
+            self.assertTrue(await subscription.wait(1))
+        await asyncio.sleep(0.05)
+        self.assertEqual(broker._pollers, {})
+
+
+class PlatformStatsTests(BalanceTestCase):
+    def test_counters_follow_writes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            group, (a, b) = make_group('stats', 2)
+            expense = add_equal_expense(group, a, '10.00', [a, b])
+        self.assertEqual(platform_stats.totals(), {'groups': 1, 'users': 2, 'expenses': 1})
+        with self.captureOnCommitCallbacks(execute=True):
+            expense.delete()
+            b.delete()
+        self.assertEqual(platform_stats.totals(), {'groups': 1, 'users': 1, 'expenses': 0})
+        PlatformCounter.objects.all().delete()
+        self.assertEqual(platform_stats.recount(), {'groups': 1, 'users': 1, 'expenses': 0})
+        self.assertEqual(platform_stats.totals(), {'groups': 1, 'users': 1, 'expenses': 0})
+
+    def test_feed_is_newest_first_and_follows_commits(self):
+        group, (a, b) = make_group('feed', 2)
+        first = add_equal_expense(group, a, '10.00', [a, b])
+        self.assertEqual([e['id'] for e in platform_stats.recent_expenses()], [first.id])
+        with self.captureOnCommitCallbacks(execute=True):
+            second = add_equal_expense(group, b, '20.00', [a, b])
+        with self.assertNumQueries(0):
+            feed = platform_stats.recent_expenses()
+        self.assertEqual([e['id'] for e in feed], [second.id, first.id])
+        self.assertEqual(feed[0]['group'], 'feed')
+
+    def test_dashboard_served_from_fragment_cache(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            group, (a, b) = make_group('frag', 2)
+            add_equal_expense(group, a, '10.00', [a, b])
+        self.client.get('/api/dashboard/')
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/dashboard/')
+        self.assertContains(response, '<p class="text-3xl text-purple-600">1</p>', html=True)
+        with self.captureOnCommitCallbacks(execute=True):
+            add_equal_expense(group, b, '4.00', [a, b])
+        self.assertContains(self.client.get('/api/dashboard/'), '<p class="text-3xl text-purple-600">2</p>', html=True)
+
+
+class HistoryTests(BalanceTestCase):
+    def setUp(self):
+        super().setUp()
+        self.group, (self.a, self.b) = make_group('history', 2)
+        self.t0 = timezone.now() - timedelta(days=200)
+
+    def add_at(self, days, paid_by, amount):
+        with mock.patch('django.utils.timezone.now', return_value=self.t0 + timedelta(days=days)):
+            return add_equal_expense(self.group, paid_by, amount, [self.a, self.b])
+
+    def as_of(self, days):
+        moment = (self.t0 + timedelta(days=days)).isoformat()
+        return self.client.get(f'/api/groups/{self.group.id}/balances/', {'as_of': moment})
+
+    def test_point_in_time_balances(self):
+        first = self.add_at(1, self.a, '100.00')
+        self.add_at(10, self.b, '40.00')
+        first_id = first.id
+        first.delete()
+
+        self.assertEqual(self.as_of(0).json(), {'balances': []})
+        self.assertEqual(self.as_of(5).json(), {'balances': ['history-u1 owes history-u0 ₹50.00']})
+        self.assertEqual(self.as_of(15).json(), {'balances': ['history-u1 owes history-u0 ₹30.00']})
+        self.assertEqual(self.client.get(f'/api/groups/{self.group.id}/balances/').json(),
+                         {'balances': ['history-u0 owes history-u1 ₹20.00']})
+        self.assertEqual(ExpenseEvent.objects.filter(expense_id=first_id, kind='deleted').count(), 3)
+        response = self.client.get(f'/api/groups/{self.group.id}/balances/', {'as_of': 'June 1st'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_compaction_keeps_recent_history(self):
+        self.add_at(1, self.a, '100.00')
+        self.add_at(150, self.b, '40.00')
+        self.add_at(190, self.b, '20.00')
+
+        out = StringIO()
+        call_command('compact_events', '--days', '30', stdout=out)
+        self.assertIn('deleted 2 events', out.getvalue())
+        self.assertEqual(ExpenseEvent.objects.filter(group_id=self.group.id).count(), 1)
+        self.assertTrue(BalanceSnapshot.objects.filter(group=self.group, compacted=True).exists())
+
+        self.assertEqual(self.as_of(180).json(), {'balances': ['history-u1 owes history-u0 ₹30.00']})
+        self.assertEqual(self.as_of(195).json(), {'balances': ['history-u1 owes history-u0 ₹20.00']})
+        with self.assertRaises(history.HistoryUnavailable):
+            history.balances_as_of(self.group.id, self.t0 + timedelta(days=100))
+        self.assertEqual(self.as_of(100).status_code, 400)
+
+    def test_snapshots_stay_behind_uncommitted_events(self):
+        self.add_at(1, self.a, '100.00')
+        add_equal_expense(self.group, self.b, '40.00', [self.a, self.b])
+        now = timezone.now()
+        self.assertEqual(history.compact(now + timedelta(days=1)), (1, 1))
+        snapshot = BalanceSnapshot.objects.get(group=self.group)
+        self.assertLess(snapshot.taken_at, now - timedelta(seconds=59))
+        # The event stamped within the settle window is neither folded nor lost
+        self.assertEqual(ExpenseEvent.objects.filter(group_id=self.group.id).count(), 1)
+        self.assertEqual(self.client.get(f'/api/groups/{self.group.id}/balances/', {'as_of': now.isoformat()}).json(),
+                         {'balances': ['history-u1 owes history-u0 ₹30.00']})
+
+
+class SettlementRecordTests(BalanceTestCase):
+    def setUp(self):
+        super().setUp()
+        self.group, (self.a, self.b, self.c) = make_group('settle', 3)
+        add_equal_expense(self.group, self.a, '90.00', [self.a, self.b, self.c])
+        self.url = f'/api/groups/{self.group.id}/settlements/'
+
+    def test_settlement_reduces_balances(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = APIClient().post(self.url, {'payer_id': self.b.id, 'payee_id': self.a.id, 'amount': '30.00'}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(calculate_group_balances(self.group.id), {'balances': ['settle-u2 owes settle-u0 ₹30.00']})
+        summary = calculate_user_summary(self.b.id)
+        self.assertEqual((summary['total_settled'], summary['net_balance'], summary['counterparties']), (Decimal('30.00'), Decimal('0.00'), []))
+        self.assertEqual(ledger.rebuild(dry_run=True), [])
+        self.assertEqual(APIClient().get(self.url).json()['results'][0]['amount'], '30.00')
+
+        Settlement.objects.get().delete()
+        self.assertEqual(MemberBalance.objects.get(group=self.group, user=self.b).net, Decimal('-30.00'))
+
+    def test_invalid_settlements(self):
+        outsider = User.objects.create(username='outsider')
+        for payload in [
+            {'payer_id': self.b.id, 'payee_id': self.b.id, 'amount': '5.00'},
+            {'payer_id': outsider.id, 'payee_id': self.a.id, 'amount': '5.00'},
+            {'payer_id': self.b.id, 'payee_id': self.a.id, 'amount': '0'},
+        ]:
+            self.assertEqual(APIClient().post(self.url, payload, format='json').status_code, 400)
+
+    def test_settle_all_zeroes_the_group(self):
+        add_equal_expense(self.group, self.b, '30.00', [self.a, self.b, self.c])
+        with self.assertNumQueries(11):
+            response = APIClient().post(f'{self.url}settle-all/', {}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.json()), 2)
+        self.assertEqual(set(MemberBalance.objects.filter(group=self.group).values_list('net', flat=True)), {Decimal('0.00')})
+        self.assertEqual(ledger.rebuild(dry_run=True), [])
+        self.assertEqual(ExpenseEvent.objects.filter(group_id=self.group.id, kind='settlement').count(), 2)
+
+        page = self.client.post(f'/api/groups/{self.group.id}/settle-all/page/')
+        self.assertRedirects(page, f'/api/groups/{self.group.id}/balances/page/')
+        self.assertEqual(Settlement.objects.count(), 2)
+
+
+class CurrencyTests(BalanceTestCase):
+    def setUp(self):
+        super().setUp()
+        FxRate.objects.create(currency='USD', date='2024-01-01', rate='83.2')
+        self.group, self.users = make_group('fx', 3)
+
+    def post_expense(self, currency, amount='10.00', group=None):
+        payload = {
+            'group': (group or self.group).id, 'description': 'dinner', 'amount': amount, 'currency': currency,
+            'paid_by_id': self.users[0].id, 'split_type': 'equal', 'splits': [{'user_id': u.id} for u in self.users],
+        }
+        if currency is None:
+            del payload['currency']
+        with self.captureOnCommitCallbacks(execute=True):
+            return APIClient().post('/api/expenses/', payload, format='json')
+
+    def test_foreign_expense_converted_into_group_currency(self):
+        self.assertEqual(self.post_expense('usd').status_code, 201)
+        nets = dict(MemberBalance.objects.filter(group=self.group).values_list('user_id', 'net'))
+        # 3.34 / 3.33 / 3.33 USD at 83.2, converted split by split
+        self.assertEqual(sorted(nets.values()), [Decimal('-277.06'), Decimal('-277.06'), Decimal('554.12')])
+        self.assertEqual(sum(nets.values()), 0)
+        self.assertEqual(ledger.rebuild(dry_run=True), [])
+        self.assertEqual(calculate_group_balances(self.group.id)['balances'][0], 'fx-u1 owes fx-u0 ₹277.06')
+        self.assertEqual(calculate_user_summary(self.users[1].id)['counterparties'][0]['net'], Decimal('-277.06'))
+
+        Expense.objects.get().delete()
+        self.assertEqual(set(MemberBalance.objects.values_list('net', flat=True)), {Decimal('0.00')})
+
+    def test_group_base_currency_and_missing_rates(self):
+        trip = Group.objects.create(name='usd trip', base_currency='USD')
+        GroupMember.objects.bulk_create([GroupMember(group=trip, user=user) for user in self.users])
+        self.assertEqual(self.post_expense('USD', '9.00', trip).status_code, 201)
+        self.assertEqual(calculate_group_balances(trip.id)['balances'][0], 'fx-u1 owes fx-u0 $3.00')
+        self.assertEqual(calculate_user_summary(self.users[0].id)['total_paid'], Decimal('748.80'))
+        self.assertEqual(self.post_expense(None, '9.00', trip).status_code, 201)
+        self.assertEqual(Expense.objects.latest('id').currency, 'USD')
+
+        response = self.post_expense('CHF')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('No exchange rate for CHF', str(response.json()))
+        response = APIClient().post('/api/groups/', {'name': 'x', 'base_currency': 'CHF', 'member_ids': []}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_load_rates_command_clears_memo(self):
+        with self.assertRaises(fx.RateMissing):
+            fx.rate('EUR', date(2025, 3, 1))
+        out = StringIO()
+        call_command('load_fx_rates', stdout=out)
+        self.assertIn('Loaded 28 exchange rates', out.getvalue())
+        self.assertEqual(fx.rate('EUR', date(2025, 3, 1)), Decimal('88.7'))
+
+    @override_settings(FX_VERSION_CHECK_SECONDS=0)
+    def test_rates_loaded_by_another_process_retire_the_memo(self):
+        self.assertEqual(fx.rate('USD', date(2024, 2, 1)), Decimal('83.2'))
+        FxRate.objects.filter(currency='USD').update(rate='84')
+        self.assertEqual(fx.rate('USD', date(2024, 2, 1)), Decimal('83.2'))
+        # load_fx_rates in another process stamps the rows it writes
+        FxRate.objects.filter(currency='USD').update(updated_at=timezone.now())
+        self.assertEqual(fx.rate('USD', date(2024, 2, 1)), Decimal('84'))
+
+
+class JobTests(BalanceTestCase):
+    def setUp(self):
+        super().setUp()
+        self.group, self.users = make_group('jobs', 2)
+        add_equal_expense(self.group, self.users[0], '10.00', self.users)
+        export_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(export_dir.cleanup)
+        self.enterContext(override_settings(JOB_EXPORT_DIR=export_dir.name))
+
+    def work(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('run_worker', '--once', '--processes', '0', stdout=StringIO())
+
+    def test_async_batch_import(self):
+        rows = [
+            {'group': self.group.id, 'description': 'taxi', 'amount': '20.00', 'paid_by_id': self.users[1].id,
+             'split_type': 'equal', 'splits': [{'user_id': u.id} for u in self.users]},
+            {'group': self.group.id},
+        ]
+        response = APIClient().post('/api/expenses/batch/?async=1', rows, format='json')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(Expense.objects.count(), 1)
+        self.work()
+
+        job = APIClient().get(response['Location']).json()
+        self.assertEqual((job['status'], job['result']['created'], job['result']['error_count']), ('succeeded', 1, 1))
+        self.assertEqual(MemberBalance.objects.get(group=self.group, user=self.users[1]).net, Decimal('5.00'))
+
+    def test_export_and_rebuild(self):
+        client = APIClient()
+        export = client.post(f'/api/groups/{self.group.id}/expenses/export/').json()
+        rebuild = client.post(f'/api/groups/{self.group.id}/balances/rebuild/', {'verify': True}, format='json').json()
+        self.assertEqual(client.get(f"/api/jobs/{export['id']}/download/").status_code, 404)
+        self.work()
+
+        self.assertEqual(Job.objects.get(id=rebuild['id']).result, {'mismatches': 0, 'rows': []})
+        download = client.get(f"/api/jobs/{export['id']}/download/")
+        lines = b''.join(download.streaming_content).decode().splitlines()
+        self.assertEqual([json.loads(line)['amount'] for line in lines], ['10.00'])
+        download.close()
+
+        os.remove(Job.objects.get(id=export['id']).result['path'])
+        response = client.get(f"/api/jobs/{export['id']}/download/")
+        self.assertEqual((response.status_code, response.json()), (410, {'error': 'The export file is gone; run the export again.'}))
+
+    def test_claim_is_exclusive_and_failures_are_recorded(self):
+        job = jobs.enqueue('export_group_expenses', {})
+        self.assertEqual(jobs.claim(5, 'one'), [job.id])
+        self.assertEqual(jobs.claim(5, 'two'), [])
+        self.assertFalse(jobs.run(job.id, 'one'))
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertIn('KeyError', job.error)
+        with self.assertRaises(ValueError):
+            jobs.enqueue('bogus')
+
+    def test_expired_leases_are_requeued_and_fenced(self):
+        job = jobs.enqueue('rebuild_balances', {'verify': True})
+        rows = jobs.enqueue('import_expenses', {'rows': []})
+        self.assertEqual(jobs.claim(2, 'slow'), [job.id, rows.id])
+        Job.objects.update(started_at=timezone.now() - timedelta(hours=2), heartbeat_at=timezone.now() - timedelta(minutes=10))
+        # Claimed long ago, but the heartbeat kept the lease alive until recently
+        with override_settings(JOB_LEASE_SECONDS=3600):
+            self.assertEqual(jobs.claim(2, 'two'), [])
+        with override_settings(JOB_LEASE_SECONDS=300):
+            self.assertEqual(jobs.claim(2, 'two'), [job.id])
+
+        # The first worker comes back after losing its lease and cannot overwrite the new run
+        self.assertFalse(jobs.finish(job.id, 'slow', result={'stale': True}))
+        self.assertTrue(jobs.run(job.id, 'two'))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.worker, job.result), (Job.SUCCEEDED, 'two', {'mismatches': 0, 'rows': []}))
+        # Imports are not idempotent, so a lost one fails instead of running twice
+        rows.refresh_from_db()
+        self.assertEqual(rows.status, Job.FAILED)
+        self.assertIn('not idempotent', rows.error)
+
+
+@mock.patch.object(db_router, 'replica_configured', return_value=True)
+class ReplicaRoutingTests(SimpleTestCase):
+    def test_only_balance_reads_use_the_replica(self, _):
+        router = db_router.ReplicaRouter()
+        self.assertIsNone(router.db_for_read(Group))
+        with db_router.replica_reads() as alias:
+            self.assertEqual((alias, router.db_for_read(Group), router.db_for_write(Group)), ('replica', 'replica', 'default'))
+            with db_router.pinned_to_primary():
+                self.assertIsNone(router.db_for_read(Group))
+
+    def test_writers_are_pinned_to_the_primary(self, _):
+        def view(request):
+            with db_router.replica_reads() as alias:
+                return HttpResponse(alias)
+
+        middleware, factory = ReplicaStickinessMiddleware(view), RequestFactory()
+        self.assertEqual(middleware(factory.get('/')).content, b'replica')
+
+        response = middleware(factory.post('/'))
+        self.assertEqual(response.content, b'default')
+        self.assertEqual(response.cookies['pin_primary']['max-age'], settings.REPLICA_STICKY_SECONDS)
+
+        factory.cookies['pin_primary'] = '1'
+        self.assertEqual(middleware(factory.get('/')).content, b'default')
+
+    def test_replica_etags_expire(self, _):
+        with mock.patch('core.utils.time.time', return_value=1000):
+            with db_router.pinned_to_primary():
+                primary = group_balances_etag(1)
+            replica = group_balances_etag(1)
+        self.assertNotEqual(primary, replica)
+        self.assertTrue(replica.endswith(f'-{1000 // settings.REPLICA_CACHE_TIMEOUT}"'))
+
+
+class MembershipTests(BalanceTestCase):
+    def setUp(self):
+        super().setUp()
+        self.group, (self.a, self.b) = make_group('club', 2)
+        self.others = [User.objects.create(username=f'new{i}') for i in range(3)]
+        self.url = f'/api/groups/{self.group.id}/members/'
+
+    def test_create_group_is_all_or_nothing(self):
+        response = APIClient().post('/api/groups/', {'name': 'x', 'member_ids': [self.a.id, 998, 999]}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('998, 999', str(response.json()))
+        self.assertFalse(Group.objects.filter(name='x').exists())
+
+        # Flat however many members: the group, the users, existing members, one insert, the response
+        with self.assertNumQueries(10):
+            response = APIClient().post('/api/groups/', {'name': 'x', 'member_ids': [self.a.id, self.b.id]}, format='json')
+        self.assertEqual(len(response.json()['members']), 2)
+
+    def test_bulk_add_and_remove(self):
+        client = APIClient()
+        self.assertEqual(memberships.group_ids(self.others[0].id), [])
+        with self.captureOnCommitCallbacks(execute=True), self.assertNumQueries(7):
+            response = client.post(self.url, {'user_ids': [u.id for u in self.others] + [self.a.id]}, format='json')
+        self.assertEqual(response.json()['added'], [u.id for u in self.others])
+        self.assertEqual(memberships.group_ids(self.others[0].id), [self.group.id])
+        self.assertEqual(client.post(self.url, {'user_ids': [999]}, format='json').status_code, 400)
+
+        add_equal_expense(self.group, self.a, '10.00', [self.a, self.others[0]])
+        response = client.delete(self.url, {'user_ids': [self.others[0].id, self.others[1].id]}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(GroupMember.objects.filter(group=self.group).count(), 5)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = client.delete(self.url, {'user_ids': [self.others[1].id, self.others[2].id]}, format='json')
+        self.assertEqual(response.json()['member_ids'], [self.a.id, self.b.id, self.others[0].id])
+        self.assertEqual(memberships.group_ids(self.others[1].id), [])
+        self.assertEqual(calculate_user_summary(self.others[1].id)['groups'], [])
+
+
+class AnalyticsTests(BalanceTestCase):
+    def setUp(self):
+        super().setUp()
+        self.a, self.b, self.c = [User.objects.create(username=name) for name in ('ann', 'ben', 'cat')]
+        for payer, other, amount in [(self.a, self.b, '60.00'), (self.b, self.c, '40.00'),
+                                     (self.c, self.a, '20.00'), (self.b, self.a, '8.00')]:
+            group = Group.objects.create(name=f'{payer.username}-{other.username}')
+            GroupMember.objects.bulk_create([GroupMember(group=group, user=payer), GroupMember(group=group, user=other)])
+            add_equal_expense(group, payer, amount, [payer, other])
+
+    def test_report_nets_across_groups_and_cancels_cycles(self):
+        with self.assertNumQueries(2):
+            report = analytics.platform_report()
+        # ben owes ann 30 - 4, ann owes cat 10, cat owes ben 20
+        self.assertEqual((report['users'], report['edges'], report['outstanding']), (3, 3, Decimal('56.00')))
+        self.assertEqual([(row['user'], row['amount']) for row in report['top_creditors']], [('ann', Decimal('16.00'))])
+        self.assertEqual([row['user'] for row in report['top_debtors']], ['cat', 'ben'])
+        self.assertEqual(report['cycles']['count'], 1)
+        self.assertEqual((report['cycles']['cancellable'], report['cycles']['outstanding_after']), (Decimal('30.00'), Decimal('26.00')))
+        self.assertEqual(report['cycles']['largest'][0]['amount'], Decimal('10.00'))
+
+    def test_endpoint_is_admin_only(self):
+        client = APIClient()
+        self.assertEqual(client.get('/api/analytics/').status_code, 403)
+        client.force_authenticate(User.objects.create(username='ops', is_staff=True))
+        response = client.get('/api/analytics/', {'top': 1})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['top_debtors']), 1)
+
+
+@override_settings(DB_LOCK_RETRY_DELAY_MS=0)
+class LockRetryTests(SimpleTestCase):
+    def flaky(self, *errors):
+        calls = []
+
+        @retry_on_locked
+        def write():
+            calls.append(1)
+            if len(calls) <= len(errors):
+                raise errors[len(calls) - 1]
+            return 'written'
+        return write, calls
+
+    def test_lock_errors_are_retried(self):
+        write, calls = self.flaky(OperationalError('database is locked'), OperationalError('database is locked'))
+        self.assertEqual((write(), len(calls)), ('written', 3))
+
+    def test_other_errors_and_exhausted_retries_raise(self):
+        write, calls = self.flaky(OperationalError('no such table: core_expense'))
+        with self.assertRaisesMessage(OperationalError, 'no such table'):
+            write()
+        self.assertEqual(len(calls), 1)
+        with override_settings(DB_LOCK_RETRIES=2):
+            write, calls = self.flaky(*[OperationalError('database is locked')] * 3)
+            with self.assertRaises(OperationalError):
+                write()
+        self.assertEqual(len(calls), 2)
+
+
+class ExpenseWriteRetryTests(TransactionTestCase):
+    # Retries only run outside an atomic block, so this needs real commits
+    def setUp(self):
+        caches[settings.BALANCE_CACHE_ALIAS].clear()
+        fx.clear_memo()
+
+    @override_settings(DB_LOCK_RETRY_DELAY_MS=0)
+    def test_locked_expense_write_is_retried(self):
+        group, users = make_group('locked', 2)
+        bulk_create = Split.objects.bulk_create
+        calls = []
+
+        def locked_once(*args, **kwargs):
+            calls.append(1)
+            if len(calls) == 1:
+                raise OperationalError('database is locked')
+            return bulk_create(*args, **kwargs)
+
+        with mock.patch.object(Split.objects, 'bulk_create', side_effect=locked_once):
+            response = APIClient().post('/api/expenses/', {
+                'group': group.id, 'description': 'rent', 'amount': '10.00', 'paid_by_id': users[0].id,
+                'split_type': 'equal', 'splits': [{'user_id': u.id} for u in users],
+            }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((len(calls), Expense.objects.count(), Split.objects.count()), (2, 1, 2))
+        self.assertEqual(MemberBalance.objects.get(group=group, user=users[1]).net, Decimal('-5.00'))
+
+
+class RecurringExpenseTests(BalanceTestCase):
+    def setUp(self):
+        super().setUp()
+        self.group, (self.a, self.b) = make_group('flat', 2)
+
+    def template(self, **kwargs):
+        fields = dict(
+            group=self.group, description='rent', amount=Decimal('100.00'), paid_by=self.a, split_type='equal',
+            splits=[{'user_id': self.a.id}, {'user_id': self.b.id}], start_date=date(2024, 1, 31),
+        )
+        fields.update(kwargs)
+        return RecurringExpense.objects.create(next_due=fields['start_date'], **fields)
+
+    def test_api_creates_templates_for_members_only(self):
+        Group.objects.filter(id=self.group.id).update(base_currency='USD')
+        url = f'/api/groups/{self.group.id}/recurring/'
+        data = {
+            'description': 'netflix', 'amount': '10.00', 'paid_by_id': self.a.id, 'split_type': 'shares',
+            'splits': [{'user_id': self.a.id, 'shares': 2}, {'user_id': self.b.id, 'shares': 1}],
+            'frequency': 'monthly', 'start_date': '2024-03-05',
+        }
+        response = APIClient().post(url, data, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(response.json()['next_due'], '2024-03-05')
+        template = RecurringExpense.objects.get()
+        self.assertEqual((template.currency, template.splits[0]), ('USD', {'user_id': self.a.id, 'shares': '2.0000'}))
+        outsider = User.objects.create(username='outsider')
+        data['splits'].append({'user_id': outsider.id, 'shares': 1})
+        response = APIClient().post(url, data, format='json')
+        self.assertContains(response, f'User ID(s) {outsider.id} are not members', status_code=400)
+
+    def test_catches_up_once_per_period(self):
+        rent = self.template()
+        with self.captureOnCommitCallbacks(execute=True):
+            report = recurring.run(date(2024, 5, 15))
+        self.assertEqual((report['created'], report['errors']), (4, []))
+        self.assertEqual(
+            list(rent.occurrences.order_by('period').values_list('period', flat=True)),
+            [date(2024, 1, 31), date(2024, 2, 29), date(2024, 3, 31), date(2024, 4, 30)],
+        )
+        rent.refresh_from_db()
+        self.assertEqual(rent.next_due, date(2024, 5, 31))
+        self.assertEqual(calculate_group_balances(self.group.id)['balances'], ['flat-u1 owes flat-u0 ₹200.00'])
+        self.assertEqual(recurring.run(date(2024, 5, 15))['created'], 0)
+
+        # An overlapping run that read the old next_due finds the periods already there
+        RecurringExpense.objects.filter(id=rent.id).update(next_due=date(2024, 1, 31))
+        report = recurring.run(date(2024, 6, 30))
+        self.assertEqual((report['created'], report['existing']), (2, 4))
+        self.assertEqual(Expense.objects.filter(recurring=rent).count(), 6)
+
+    def test_backlog_costs_the_same_queries_per_chunk(self):
+        def queries(days):
+            self.template(frequency='daily', start_date=date(2020, 1, 1), splits=[{'user_id': self.b.id}])
+            with CaptureQueriesContext(connection) as captured:
+                report = recurring.run(date(2020, 1, 1) + timedelta(days=days - 1), chunk_size=100)
+            self.assertEqual(report['created'], days)
+            RecurringExpense.objects.all().delete()
+            return len(captured)
+
+        one_chunk = queries(3)
+        self.assertEqual(queries(100), one_chunk)
+        self.assertLessEqual(queries(1500), 15 * one_chunk)
+
+    def test_end_date_and_bad_templates(self):
+        short = self.template(frequency='weekly', start_date=date(2024, 1, 1), end_date=date(2024, 1, 20))
+        broken = self.template(split_type='exact', splits=[{'user_id': self.a.id, 'amount': '1.00'}])
+        out = StringIO()
+        call_command('run_recurring', '--date', '2024-02-10', stdout=out, stderr=StringIO())
+        self.assertIn('2 due templates: created 3 expenses', out.getvalue())
+        short.refresh_from_db()
+        broken.refresh_from_db()
+        self.assertFalse(short.active)
+        self.assertEqual((broken.active, broken.next_due), (True, date(2024, 1, 31)))
+
+
+class ApiProfileTests(SimpleTestCase):
+    def test_api_urlconf_has_no_pages(self):
+        self.assertEqual(resolve('/api/groups/1/balances/', 'splitwise_backend.api_urls').url_name, 'group-balances')
+        for path in ['/api/dashboard/', '/api/expenses/add/', '/admin/']:
+            with self.assertRaises(Resolver404):
+                resolve(path, 'splitwise_backend.api_urls')
+
+    def test_api_profile_skips_html_modules(self):
+        full = startup_profile.probe(startup_profile.PROFILES['full'])
+        api = startup_profile.probe(startup_profile.PROFILES['api'])
+        self.assertEqual((full['status'], api['status']), ('200 OK', '200 OK'))
+        self.assertIn('core.forms', full['core'])
+        self.assertNotIn('core.forms', api['core'])
+        self.assertNotIn('core.pages', api['core'])
+        self.assertLess(api['modules'], full['modules'])
+        self.assertGreater(sum(api['imports'].values()), 0)
+
+
+class SplitEngineTests(TestCase):
+    def test_equal_split_sums_exactly(self):
+        self.assertEqual(compute_amounts('equal', Decimal('100.00'), [{}] * 3),
+                         [Decimal('33.34'), Decimal('33.33'), Decimal('33.33')])
+
+    def test_largest_remainder_is_deterministic(self):
+        # 1000 paise at 1:1:1:1:1:1:1 weights leaves 6 paise for the first six
+        self.assertEqual(allocate(1000, [1] * 7), [143] * 6 + [142])
+        self.assertEqual(allocate(10, [1, 2, 2]), [2, 4, 4])
+
+    def test_split_types(self):
+        self.assertEqual(compute_paise('percentage', 1001, [{'percentage': '33.3333'}, {'percentage': '66.6667'}]), [334, 667])
+        self.assertEqual(compute_paise('shares', 1000, [{'shares': 1}, {'shares': 3}]), [250, 750])
+        self.assertEqual(compute_paise('exact', 1000, [{'amount': '2.50'}, {'amount': '7.50'}]), [250, 750])
+
+    def test_invalid_inputs(self):
+        with self.assertRaisesMessage(SplitError, "Total percentage must be 100."):
+            compute_paise('percentage', 1000, [{'percentage': 50}, {'percentage': 40}])
+        with self.assertRaisesMessage(SplitError, "not 10.00"):
+            compute_paise('exact', 1000, [{'amount': '2.50'}])
+        with self.assertRaises(SplitError):
+            compute_paise('shares', 1000, [{'shares': 0}])
+
+    def test_batch_matches_row_by_row(self):
+        rows = [
+            ('percentage', Decimal('10.01'), [{'percentage': '33.3333'}, {'percentage': '66.6667'}]),
+            ('equal', '100', [{}] * 3),
+            ('shares', Decimal('100.00'), [{'shares': 1}, {'shares': [2]}]),
+            ('exact', Decimal('10.00'), [{'amount': '2.50'}, {'amount': Decimal('7.5')}]),
+            ('equal', Decimal('100.00'), [{}] * 3),
+        ]
+        with mock.patch('core.splits.from_paise', wraps=splits.from_paise) as from_paise:
+            results = list(compute_batch(rows))
+        self.assertIsInstance(results[2], SplitError)
+        for (split_type, amount, entries), result in zip(rows, results):
+            if not isinstance(result, SplitError):
+                self.assertEqual(result, compute_amounts(split_type, amount, entries))
+        # 3334/3333, 334/667 and 250/750 paise: each distinct share converted once
+        self.assertEqual(from_paise.call_count, 6)
+
+    def test_api_split_totals_match_expense(self):
+        group, users = make_group('engine', 3)
+        response = APIClient().post('/api/expenses/', {
+            'group': group.id, 'description': 'x', 'amount': '100.00', 'paid_by_id': users[0].id,
+            'split_type': 'shares', 'splits': [{'user_id': u.id, 'shares': s} for u, s in zip(users, [1, 1, 1])],
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        expense = Expense.objects.get(id=response.json()['id'])
+        self.assertEqual(sum(split.amount for split in expense.splits.all()), expense.amount)
+
+
+def apply_payments(balances, payments):
+    remaining = {party: Decimal(amount) for party, amount in balances.items()}
+    for debtor, creditor, amount in payments:
+        remaining[debtor] += amount
+        remaining[creditor] -= amount
+    return remaining
+
+
+class SettlementTests(TestCase):
+    balances = {'a': Decimal(-4), 'b': Decimal(5), 'c': Decimal(7), 'd': Decimal(-3), 'e': Decimal(-5)}
+
+    def test_greedy_settles_everyone(self):
+        payments = greedy(self.balances)
+        self.assertTrue(all(v == 0 for v in apply_payments(self.balances, payments).values()))
+        self.assertEqual(payments[0], ('e', 'c', Decimal('5.00')))
+
+    def test_exact_uses_fewer_payments(self):
+        payments = exact(self.balances)
+        self.assertTrue(all(v == 0 for v in apply_payments(self.balances, payments).values()))
+        self.assertEqual(len(payments), 3)
+        self.assertEqual(len(greedy(self.balances)), 4)
+
+    def test_greedy_scales_to_large_groups(self):
+        balances = {i: Decimal(i % 7 - 3) for i in range(10000)}
+        balances[0] -= sum(balances.values())
+        payments = greedy(balances)
+        self.assertLess(len(payments), 10000)
+        self.assertTrue(all(v == 0 for v in apply_payments(balances, payments).values()))
@@ -1,33 +1,305 @@
 # core/utils.py
-from django.db.models import Sum
+import asyncio
+import time
+from collections import defaultdict
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db.models import Case, DateField, Q, Sum, Value, When
+from django.db.models.functions import TruncDate
+from django.utils import timezone
 from decimal import Decimal
-from .models import Group, Expense, Split
+from . import balance_cache, db_router, fx, history, memberships
+from .currency import DEFAULT_CURRENCY, format_money
+from .ledger import to_cents
+from .models import Group, GroupMember, MemberBalance, Settlement, Split
+from .settlement import DEFAULT_STRATEGY, settle
 
-def calculate_group_balances(group_id):
+
+def calculate_group_balances(group_id, strategy=DEFAULT_STRATEGY):
     try:
         group = Group.objects.get(id=group_id)
     except Group.DoesNotExist:
         return {"error": "Group not found"}
 
-    users = group.members.all()
-    balances = {}
+    members = dict(group.members.values_list('id', 'username'))
+    ledger = dict(MemberBalance.objects.filter(group=group).values_list('user_id', 'net'))
+    return _settlement(members, ledger, strategy, group.base_currency)
+
+
+def calculate_group_balances_as_of(group_id, as_of, strategy=DEFAULT_STRATEGY):
+    """Group balances as they stood at ``as_of``, replayed from the event log.
+
+    Raises :class:`core.history.HistoryUnavailable` when that part of the
+    history has been compacted away.
+    """
+    try:
+        group = Group.objects.get(id=group_id)
+    except Group.DoesNotExist:
+        return {"error": "Group not found"}
+
+    members = dict(group.members.values_list('id', 'username'))
+    ledger = {
+        user_id: paid - owed + settled
+        for user_id, (paid, owed, settled) in history.balances_as_of(group.id, as_of).items()
+    }
+    return _settlement(members, ledger, strategy, group.base_currency)
+
+
+async def acalculate_group_balances(group_id, strategy=DEFAULT_STRATEGY):
+    """Async :func:`calculate_group_balances`; the three lookups run concurrently."""
+    currency, members, ledger = await asyncio.gather(
+        Group.objects.filter(id=group_id).values_list('base_currency', flat=True).afirst(),
+        _adict(GroupMember.objects.filter(group_id=group_id).values_list('user_id', 'user__username')),
+        _adict(MemberBalance.objects.filter(group_id=group_id).values_list('user_id', 'net')),
+    )
+    if currency is None:
+        return {"error": "Group not found"}
+    return _settlement(members, ledger, strategy, currency)
+
+
+async def _adict(queryset):
+    return {key: value async for key, value in queryset}
+
+
+async def _alist(queryset):
+    return [row async for row in queryset]
 
-    for user in users:
-        paid = Expense.objects.filter(group=group, paid_by=user).aggregate(total=Sum('amount'))['total'] or Decimal(0)
-        owed = Split.objects.filter(expense__group=group, user=user).aggregate(total=Sum('amount'))['total'] or Decimal(0)
-        balances[user.username] = round(paid - owed, 2)
 
-    # Format as 'X owes Y ₹Z'
-    transactions = []
-    usernames = list(balances.keys())
-    amounts = list(balances.values())
+def _settlement(members, ledger, strategy, currency):
+    balances = {}
+
+    for user_id in members:
+        balances[user_id] = ledger.get(user_id, Decimal(0))
 
-    for i in range(len(usernames)):
-        for j in range(len(usernames)):
-            if amounts[i] < 0 and amounts[j] > 0:
-                amount_to_pay = min(abs(amounts[i]), amounts[j])
-                transactions.append(f"{usernames[i]} owes {usernames[j]} ₹{amount_to_pay:.2f}")
-                amounts[i] += amount_to_pay
-                amounts[j] -= amount_to_pay
+    # Format as 'X owes Y ₹Z' in the group's currency
+    transactions = [
+        f"{members[debtor]} owes {members[creditor]} {format_money(amount, currency)}"
+        for debtor, creditor, amount in settle(balances, strategy)
+    ]
 
     return {"balances": transactions}
+
+
+def calculate_user_summary(user_id):
+    """Totals, per-group balances and per-counterparty debts for one user.
+
+    Only groups the user is a member of count. Counterparty ``net`` is what
+    the other person owes the user (negative when the user owes them) after
+    settlements between the two, before any simplification across the
+    group. Totals and counterparties are in ``DEFAULT_CURRENCY``; amounts
+    in other currencies are summed per currency and day and converted once
+    per group. Runs in at most six queries (plus memoized rate lookups, and
+    one more when the user's groups are not in the membership index)
+    however many groups or counterparties the user has.
+    """
+    try:
+        user = User.objects.get(id=user_id)
+    except User.DoesNotExist:
+        return {"error": "User not found"}
+
+    groups, owes, owed_by, settlements = _summary_queries(user.id, memberships.group_ids(user.id))
+    groups = list(groups)
+    counterparties = _counterparties(user.id, owes, owed_by, settlements)
+    usernames = dict(_usernames(counterparties)) if counterparties else {}
+    return _summary(user, groups, counterparties, usernames)
+
+
+async def acalculate_user_summary(user_id):
+    """Async :func:`calculate_user_summary`.
+
+    The user, ledger, split and settlement queries are independent and run
+    concurrently; only the counterparty names wait for the totals.
+    """
+    groups, owes, owed_by, settlements = _summary_queries(user_id, await memberships.agroup_ids(user_id))
+    user, groups, owes, owed_by, settlements = await asyncio.gather(
+        User.objects.filter(id=user_id).afirst(), _alist(groups), _alist(owes), _alist(owed_by), _alist(settlements),
+    )
+    if user is None:
+        return {"error": "User not found"}
+    counterparties = _counterparties(user_id, owes, owed_by, settlements)
+    usernames = await _adict(_usernames(counterparties)) if counterparties else {}
+    return _summary(user, groups, counterparties, usernames)
+
+
+def _summary_queries(user_id, group_ids):
+    # group_ids comes from the membership index, saving a GroupMember join per query
+    groups = (
+        MemberBalance.objects.filter(user_id=user_id, group_id__in=group_ids)
+        .order_by('group_id')
+        .values('group_id', 'group__name', 'group__base_currency', 'paid', 'owed', 'settled', 'net')
+    )
+
+    # What the user owes each payer, and what each participant owes the user
+    member_splits = Split.objects.filter(expense__group_id__in=group_ids).order_by()
+    # Foreign-currency amounts are also grouped by the day that picks their rate
+    member_splits = member_splits.annotate(day=_rate_day('expense__currency', 'expense__created_at'))
+    owes = (
+        member_splits.filter(user_id=user_id).exclude(expense__paid_by=user_id)
+        .values('expense__paid_by', 'expense__currency', 'day').annotate(total=Sum('amount'))
+        .values_list('expense__paid_by', 'expense__currency', 'day', 'total')
+    )
+    owed_by = (
+        member_splits.filter(expense__paid_by=user_id).exclude(user_id=user_id)
+        .values('user', 'expense__currency', 'day').annotate(total=Sum('amount'))
+        .values_list('user', 'expense__currency', 'day', 'total')
+    )
+    # Settlements the user made or received, per pair (in the group's currency)
+    settlements = (
+        Settlement.objects.filter(Q(payer=user_id) | Q(payee=user_id), group_id__in=group_ids).order_by()
+        .annotate(day=_rate_day('group__base_currency', 'created_at'))
+        .values('payer', 'payee', 'group__base_currency', 'day').annotate(total=Sum('amount'))
+        .values_list('payer', 'payee', 'group__base_currency', 'day', 'total')
+    )
+    return groups, owes, owed_by, settlements
+
+
+def _rate_day(currency_field, timestamp_field):
+    return Case(
+        When(**{currency_field: DEFAULT_CURRENCY}, then=Value(None, output_field=DateField())),
+        default=TruncDate(timestamp_field),
+    )
+
+
+def _in_default_currency(amount, currency, day=None):
+    if currency == DEFAULT_CURRENCY:
+        return amount
+    return amount * fx.factor(currency, DEFAULT_CURRENCY, day or timezone.localdate())
+
+
+def _counterparties(user_id, owes, owed_by, settlements):
+    counterparties = defaultdict(Decimal)
+    for other_id, currency, day, total in owes:
+        counterparties[other_id] -= _in_default_currency(total, currency, day)
+    for other_id, currency, day, total in owed_by:
+        counterparties[other_id] += _in_default_currency(total, currency, day)
+    for payer_id, payee_id, currency, day, total in settlements:
+        total = _in_default_currency(total, currency, day)
+        if payer_id == user_id:
+            counterparties[payee_id] += total
+        else:
+            counterparties[payer_id] -= total
+    return {other_id: to_cents(net) for other_id, net in counterparties.items()}
+
+
+def _usernames(user_ids):
+    return User.objects.filter(id__in=user_ids).values_list('id', 'username')
+
+
+def _summary(user, groups, counterparties, usernames):
+    def total(column):
+        return to_cents(sum(
+            (_in_default_currency(row[column], row['group__base_currency']) for row in groups), Decimal(0)
+        ))
+
+    total_paid, total_owed, total_settled = total('paid'), total('owed'), total('settled')
+
+    return {
+        "user": user.username,
+        "currency": DEFAULT_CURRENCY,
+        "total_paid": total_paid,
+        "total_owed": total_owed,
+        "total_settled": total_settled,
+        "net_balance": round(total_paid - total_owed + total_settled, 2),
+        "groups": [
+            {"group_id": row['group_id'], "group": row['group__name'], "currency": row['group__base_currency'],
+             "paid": row['paid'], "owed": row['owed'], "settled": row['settled'], "net": row['net']}
+            for row in groups
+        ],
+        "counterparties": [
+            {"user_id": other_id, "user": usernames.get(other_id), "net": net, "amount": abs(net)}
+            for other_id, net in sorted(counterparties.items(), key=lambda item: (-abs(item[1]), item[0]))
+            if net
+        ],
+    }
+
+
+# Cached entry points used by the views; error results are never cached.
+# They read from the replica when one is configured.
+
+def _cache_entry(name, alias):
+    # Replica results may lag: keep them away from requests pinned to the
+    # primary (read-your-writes) and cache them only briefly
+    if alias == db_router.REPLICA:
+        return f"{name}@{alias}", getattr(settings, 'REPLICA_CACHE_TIMEOUT', 30)
+    return name, None
+
+
+def _replica_tag(tag, timeout):
+    # A replica answer may predate the version it was computed under, so its
+    # tag also expires with the replica cache entry
+    return f'{tag[:-1]}-{int(time.time() // timeout)}"' if timeout else tag
+
+
+def group_balances_etag(group_id, strategy=DEFAULT_STRATEGY):
+    """ETag of :func:`group_balances`, computed without computing the balances."""
+    with db_router.replica_reads() as alias:
+        name, timeout = _cache_entry(f"settlement:{strategy}", alias)
+        return _replica_tag(balance_cache.etag(balance_cache.GROUP, group_id, name), timeout)
+
+
+def user_summary_etag(user_id):
+    with db_router.replica_reads() as alias:
+        name, timeout = _cache_entry("summary", alias)
+        return _replica_tag(balance_cache.etag(balance_cache.USER, user_id, name), timeout)
+
+
+async def agroup_balances_etag(group_id, strategy=DEFAULT_STRATEGY):
+    with db_router.replica_reads() as alias:
+        name, timeout = _cache_entry(f"settlement:{strategy}", alias)
+        return _replica_tag(await balance_cache.aetag(balance_cache.GROUP, group_id, name), timeout)
+
+
+async def auser_summary_etag(user_id):
+    with db_router.replica_reads() as alias:
+        name, timeout = _cache_entry("summary", alias)
+        return _replica_tag(await balance_cache.aetag(balance_cache.USER, user_id, name), timeout)
+
+
+def _uncached_errors(compute):
+    def wrapped():
+        result = compute()
+        return None if "error" in result else result
+    return wrapped
+
+
+def group_balances(group_id, strategy=DEFAULT_STRATEGY):
+    with db_router.replica_reads() as alias:
+        name, timeout = _cache_entry(f"settlement:{strategy}", alias)
+        return balance_cache.get_or_compute(
+            balance_cache.GROUP, group_id, name,
+            _uncached_errors(lambda: calculate_group_balances(group_id, strategy)), timeout,
+        ) or {"error": "Group not found"}
+
+
+def user_summary(user_id):
+    with db_router.replica_reads() as alias:
+        name, timeout = _cache_entry("summary", alias)
+        return balance_cache.get_or_compute(
+            balance_cache.USER, user_id, name,
+            _uncached_errors(lambda: calculate_user_summary(user_id)), timeout,
+        ) or {"error": "User not found"}
+
+
+def _auncached_errors(compute):
+    async def wrapped():
+        result = await compute()
+        return None if "error" in result else result
+    return wrapped
+
+
+async def agroup_balances(group_id, strategy=DEFAULT_STRATEGY):
+    with db_router.replica_reads() as alias:
+        name, timeout = _cache_entry(f"settlement:{strategy}", alias)
+        return await balance_cache.aget_or_compute(
+            balance_cache.GROUP, group_id, name,
+            _auncached_errors(lambda: acalculate_group_balances(group_id, strategy)), timeout,
+        ) or {"error": "Group not found"}
+
+
+async def auser_summary(user_id):
+    with db_router.replica_reads() as alias:
+        name, timeout = _cache_entry("summary", alias)
+        return await balance_cache.aget_or_compute(
+            balance_cache.USER, user_id, name,
+            _auncached_errors(lambda: acalculate_user_summary(user_id)), timeout,
+        ) or {"error": "User not found"}
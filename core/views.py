@@ -1,14 +1,33 @@
-from django.shortcuts import render, redirect, get_object_or_404
+import datetime
+
+from django.conf import settings
+from django.shortcuts import get_object_or_404
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from rest_framework.decorators import api_view
-from rest_framework import generics, status
-from core.models import Group, Expense, Split, User, GroupMember
-from .serializers import GroupSerializer, ExpenseCreateSerializer
-from django.db.models import Sum
-from .forms import GroupForm, ExpenseForm
-from decimal import Decimal
-from .utils import calculate_group_balances
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework import generics, mixins, status
+from rest_framework.permissions import IsAdminUser
+from django.contrib.auth.models import User
+from core.models import Group, Expense, Split, GroupMember, Settlement, Job, RecurringExpense
+from .serializers import GroupSerializer, ExpenseCreateSerializer, ExpenseDetailSerializer, SplitSerializer, SettlementSerializer, JobSerializer, MemberIdsSerializer, RecurringExpenseSerializer
+from django.db.models import Prefetch
+from django.http import FileResponse, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.dateparse import parse_date, parse_datetime
+from django.views import View
+from rest_framework.utils.encoders import JSONEncoder
+from .utils import (
+    agroup_balances, agroup_balances_etag, auser_summary, auser_summary_etag, calculate_group_balances_as_of,
+    group_balances, group_balances_etag, user_summary, user_summary_etag,
+)
+from . import balance_cache, balance_events, db_router, jobs, memberships
+from .metrics import registry
+from .ledger import settle_all
+from .imports import import_expenses
+from .pagination import KeysetPagination
+from .settlement import DEFAULT_STRATEGY, STRATEGIES
+from .history import HistoryUnavailable
 
 
 @api_view(['GET'])
@@ -30,113 +49,347 @@ def create_group_api(request):
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+class GroupMembersView(APIView):
+    # POST adds and DELETE removes {"user_ids": [...]}, all or nothing
+    def post(self, request, group_id):
+        return self.change(request, group_id, memberships.add_members, 'added')
+
+    def delete(self, request, group_id):
+        return self.change(request, group_id, memberships.remove_members, 'removed')
+
+    def change(self, request, group_id, action, key):
+        group = get_object_or_404(Group, id=group_id)
+        serializer = MemberIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            changed = action(group, serializer.validated_data['user_ids'])
+        except memberships.MembershipError as exc:
+            return Response({"error": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({key: changed, "member_ids": sorted(group.members.values_list('id', flat=True))})
+
+
 class ExpenseCreateView(generics.CreateAPIView):
     queryset = Expense.objects.all()
     serializer_class = ExpenseCreateSerializer
 
 
+def job_accepted(job):
+    response = Response(JobSerializer(job).data, status=status.HTTP_202_ACCEPTED)
+    response['Location'] = f'/api/jobs/{job.id}/'
+    return response
+
+
+class ExpenseBatchView(APIView):
+    def post(self, request):
+        rows = request.data
+        if not isinstance(rows, list):
+            return Response({"error": "Expected a list of expenses"}, status=status.HTTP_400_BAD_REQUEST)
+        if not rows:
+            return Response({"error": "The list of expenses is empty"}, status=status.HTTP_400_BAD_REQUEST)
+
+        # ?async=1 hands the import to the job queue instead of blocking the request
+        if request.query_params.get('async') in ('1', 'true'):
+            return job_accepted(jobs.enqueue('import_expenses', {'rows': rows}))
+
+        report = import_expenses(enumerate(rows))
+        response_status = status.HTTP_201_CREATED if not report['errors'] else status.HTTP_207_MULTI_STATUS
+        if not report['created']:
+            response_status = status.HTTP_400_BAD_REQUEST
+        return Response(report, status=response_status)
+
+
+class KeysetListView(generics.ListAPIView):
+    # ?export=jsonl streams every row (from ?cursor= onwards) as JSON lines
+    # through a server-side iterator instead of returning one page
+    pagination_class = KeysetPagination
+    export_chunk_size = 2000
+
+    def list(self, request, *args, **kwargs):
+        if request.query_params.get('export') != 'jsonl':
+            return super().list(request, *args, **kwargs)
+
+        queryset = self.paginator.filter_queryset(self.get_queryset(), request, self)
+        serializer_class = self.get_serializer_class()
+        encoder = JSONEncoder()
+
+        def rows():
+            for obj in queryset.iterator(chunk_size=self.export_chunk_size):
+                yield encoder.encode(serializer_class(obj).data) + "\n"
+
+        return StreamingHttpResponse(rows(), content_type='application/x-ndjson')
+
+
+class GroupExpenseListView(KeysetListView):
+    serializer_class = ExpenseDetailSerializer
+
+    def get_queryset(self):
+        group = get_object_or_404(Group, id=self.kwargs['group_id'])
+        return (
+            Expense.objects.filter(group=group)
+            .select_related('paid_by')
+            .prefetch_related(Prefetch('splits', queryset=Split.objects.select_related('user')))
+        )
+
+
+class UserSplitListView(KeysetListView):
+    serializer_class = SplitSerializer
+    cursor_field = 'expense__created_at'
+
+    def get_queryset(self):
+        user = get_object_or_404(User, id=self.kwargs['user_id'])
+        return Split.objects.filter(user=user).select_related('user', 'expense')
+
+
+class GroupScopedListCreateView(mixins.CreateModelMixin, KeysetListView):
+    # Lists and creates rows of the group in the URL; serializers get the group in their context
+
+    def get_group(self):
+        if not hasattr(self, '_group'):
+            self._group = get_object_or_404(Group, id=self.kwargs['group_id'])
+        return self._group
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['group'] = self.get_group()
+        return context
+
+    def post(self, request, *args, **kwargs):
+        return self.create(request, *args, **kwargs)
+
+
+class GroupSettlementView(GroupScopedListCreateView):
+    # GET lists the group's settlements newest first, POST records "payer paid payee back"
+    serializer_class = SettlementSerializer
+
+    def get_queryset(self):
+        return Settlement.objects.filter(group=self.get_group())
+
+
+class GroupRecurringExpenseView(GroupScopedListCreateView):
+    # GET lists the group's recurring expenses newest first, POST adds one;
+    # `manage.py run_recurring` turns them into expenses as they fall due
+    serializer_class = RecurringExpenseSerializer
+
+    def get_queryset(self):
+        return RecurringExpense.objects.filter(group=self.get_group())
+
+
+class RecurringExpenseDetailView(generics.RetrieveDestroyAPIView):
+    # Deleting a template stops it; the expenses it already created stay
+    queryset = RecurringExpense.objects.all()
+    serializer_class = RecurringExpenseSerializer
+    lookup_url_kwarg = 'recurring_id'
+
+
+class SettleAllView(APIView):
+    # Records every payment suggested by the settlement strategy in one bulk write
+    def post(self, request, group_id):
+        group = get_object_or_404(Group, id=group_id)
+        strategy = request.data.get('strategy', DEFAULT_STRATEGY)
+        if strategy not in STRATEGIES:
+            return Response({"error": f"Unknown strategy '{strategy}'", "choices": sorted(STRATEGIES)}, status=400)
+        settlements = settle_all(group, strategy)
+        return Response(SettlementSerializer(settlements, many=True).data, status=status.HTTP_201_CREATED)
+
+
+class JobDetailView(generics.RetrieveAPIView):
+    queryset = Job.objects.all()
+    serializer_class = JobSerializer
+    lookup_url_kwarg = 'job_id'
+
+
+def job_download(request, job_id):
+    job = get_object_or_404(Job, id=job_id, kind='export_group_expenses', status=Job.SUCCEEDED)
+    try:
+        export = open(job.result['path'], 'rb')
+    except FileNotFoundError:
+        # Cleaned up, or written to another host's JOB_EXPORT_DIR
+        return JsonResponse({"error": "The export file is gone; run the export again."}, status=410)
+    return FileResponse(export, as_attachment=True,
+                        filename=f'expenses-{job_id}.jsonl', content_type='application/x-ndjson')
+
+
+class GroupRebuildView(APIView):
+    # Recomputes (or with verify=true only checks) the group's ledger in the background
+    def post(self, request, group_id):
+        group = get_object_or_404(Group, id=group_id)
+        verify = str(request.data.get('verify', '')).lower() in ('1', 'true')
+        return job_accepted(jobs.enqueue('rebuild_balances', {'groups': [group.id], 'verify': verify}))
+
+
+class GroupExportView(APIView):
+    # Writes every expense of the group to a JSON-lines file, fetched from /api/jobs/<id>/download/
+    def post(self, request, group_id):
+        group = get_object_or_404(Group, id=group_id)
+        return job_accepted(jobs.enqueue('export_group_expenses', {'group': group.id}))
+
+
+class PlatformAnalyticsView(APIView):
+    # Whole-platform debt report for staff; see core.analytics
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        strategy = request.query_params.get('strategy', DEFAULT_STRATEGY)
+        if strategy not in STRATEGIES:
+            return Response({"error": f"Unknown strategy '{strategy}'", "choices": sorted(STRATEGIES)}, status=400)
+        try:
+            top = min(int(request.query_params.get('top', 10)), 100)
+        except ValueError:
+            return Response({"error": "top must be an integer"}, status=400)
+        # Imported on first use: workers that never serve the report skip it
+        from .analytics import platform_report
+        return Response(platform_report(top, top, strategy))
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def metrics(request):
+    # Scrape with HTTP Basic credentials of a staff user
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def balance_cache_stats(request):
+    return Response(balance_cache.stats())
+
+
+def parse_as_of(value):
+    """Parse an ``as_of`` ISO datetime, or a date meaning the end of that day."""
+    moment = parse_datetime(value)
+    if moment is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(value)
+        moment = datetime.datetime.combine(day, datetime.time.max)
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+def not_modified(request, etag):
+    """A 304 response if the client's ``If-None-Match`` already names ``etag``, else ``None``."""
+    response = get_conditional_response(request, etag=etag)
+    return tagged(response, etag) if response is not None else None
+
+
+def tagged(response, etag):
+    # no-cache: clients may store the body but must revalidate it every time
+    response['ETag'] = etag
+    patch_cache_control(response, no_cache=True)
+    return response
+
+
 class GroupBalanceView(APIView):
+    # Current balances carry an ETag from the group's cache version, so a
+    # poll with If-None-Match is answered 304 without computing anything
     def get(self, request, group_id):
-        result = calculate_group_balances(group_id)
+        strategy = request.query_params.get('strategy', DEFAULT_STRATEGY)
+        if strategy not in STRATEGIES:
+            return Response({"error": f"Unknown strategy '{strategy}'", "choices": sorted(STRATEGIES)}, status=400)
+        as_of = request.query_params.get('as_of')
+        etag = None
+        if as_of:
+            try:
+                moment = parse_as_of(as_of)
+            except ValueError:
+                return Response({"error": f"Invalid as_of '{as_of}', expected an ISO date or datetime"}, status=400)
+            try:
+                result = calculate_group_balances_as_of(group_id, moment, strategy)
+            except HistoryUnavailable as exc:
+                return Response({"error": str(exc)}, status=400)
+        else:
+            etag = group_balances_etag(group_id, strategy)
+            response = not_modified(request, etag)
+            if response is not None:
+                return response
+            result = group_balances(group_id, strategy)
         if "error" in result:
             return Response(result, status=404)
-        return Response(result)
+        return tagged(Response(result), etag) if etag else Response(result)
 
 
 class UserBalanceView(APIView):
     def get(self, request, user_id):
-        try:
-            user = User.objects.get(id=user_id)
-        except User.DoesNotExist:
-            return Response({"error": "User not found"}, status=404)
-
-        groups = Group.objects.filter(members=user)
-        total_paid = Expense.objects.filter(group__in=groups, paid_by=user).aggregate(total=Sum('amount'))['total'] or 0
-        total_owed = Split.objects.filter(user=user, expense__group__in=groups).aggregate(total=Sum('amount'))['total'] or 0
-
-        return Response({
-            "user": user.username,
-            "total_paid": total_paid,
-            "total_owed": total_owed,
-            "net_balance": round(total_paid - total_owed, 2)
-        })
-
-
-@api_view(['GET', 'POST'])
-def create_group_view(request):
-    if request.method == 'POST':
-        form = GroupForm(request.POST)
-        if form.is_valid():
-            form.save()
-            return redirect('create-group')
-    else:
-        form = GroupForm()
-    return render(request, 'create_group.html', {'form': form})
-
-
-def add_expense(request):
-    if request.method == "POST":
-        form = ExpenseForm(request.POST)
-        if form.is_valid():
-            group = form.cleaned_data['group']
-            description = form.cleaned_data['description']
-            amount = form.cleaned_data['amount']
-            paid_by = form.cleaned_data['paid_by']
-            split_type = form.cleaned_data['split_type']
-            members = form.cleaned_data['members']
-            percentages = form.cleaned_data['percentages']
-
-            expense = Expense.objects.create(
-                group=group, description=description,
-                amount=amount, paid_by=paid_by, split_type=split_type
-            )
-
-            if split_type == 'equal':
-                per_head = amount / members.count()
-                for user in members:
-                    Split.objects.create(expense=expense, user=user, amount=per_head)
-            elif split_type == 'percentage':
-                perc_list = [Decimal(p.strip()) for p in percentages.split(",")]
-                for user, perc in zip(members, perc_list):
-                    amt = (amount * perc) / Decimal(100)
-                    Split.objects.create(expense=expense, user=user, amount=amt, percentage=perc)
-
-            return redirect('add-expense')
-    else:
-        form = ExpenseForm()
-
-    return render(request, 'add_expense.html', {'form': form})
+        etag = user_summary_etag(user_id)
+        response = not_modified(request, etag)
+        if response is not None:
+            return response
+        result = user_summary(user_id)
+        if "error" in result:
+            return Response(result, status=404)
+        return tagged(Response(result), etag)
 
 
-@api_view(['GET'])
-def group_balances_page(request, group_id):
-    result = calculate_group_balances(group_id)
-    if "error" in result:
-        return render(request, 'group_balances.html', {'balances': ["Group not found"]})
-    return render(request, 'group_balances.html', {'balances': result.get('balances', [])})
+# Async (ASGI) variants of the balance endpoints. They return the same
+# payloads as the DRF views above without tying up a worker thread while
+# the database answers.
+
+class AsyncGroupBalanceView(View):
+    async def get(self, request, group_id):
+        strategy = request.GET.get('strategy', DEFAULT_STRATEGY)
+        if strategy not in STRATEGIES:
+            return JsonResponse({"error": f"Unknown strategy '{strategy}'", "choices": sorted(STRATEGIES)}, status=400)
+        etag = await agroup_balances_etag(group_id, strategy)
+        response = not_modified(request, etag)
+        if response is not None:
+            return response
+        result = await agroup_balances(group_id, strategy)
+        if "error" in result:
+            return JsonResponse(result, status=404)
+        return tagged(JsonResponse(result, encoder=JSONEncoder), etag)
 
 
-def user_summary_page(request, user_id):
-    user = get_object_or_404(User, id=user_id)
+class AsyncUserBalanceView(View):
+    async def get(self, request, user_id):
+        etag = await auser_summary_etag(user_id)
+        response = not_modified(request, etag)
+        if response is not None:
+            return response
+        result = await auser_summary(user_id)
+        if "error" in result:
+            return JsonResponse(result, status=404)
+        return tagged(JsonResponse(result, encoder=JSONEncoder), etag)
 
-    total_paid = Expense.objects.filter(paid_by=user).aggregate(total=Sum('amount'))['total'] or 0
-    total_owed = Split.objects.filter(user=user).aggregate(total=Sum('amount'))['total'] or 0
-    net_balance = total_paid - total_owed
 
-    summary = {
-        "user": user.username,
-        "total_paid": total_paid,
-        "total_owed": total_owed,
-        "net_balance": net_balance
-    }
+class GroupBalanceStreamView(View):
+    """Server-sent events: the group's balances now and after every committed change.
 
-    return render(request, 'user_summary.html', {'summary': summary})
+    Each event is ``event: balances`` with the balances JSON as data and
+    the balances' ETag as its id, so a client reconnecting with
+    ``Last-Event-ID`` is only sent the balances if they changed meanwhile.
+    Changes arrive through :mod:`core.balance_events`; a comment line is
+    sent every ``BALANCE_STREAM_HEARTBEAT`` seconds to keep proxies from
+    closing an idle connection. Meant to be served over ASGI.
+    """
 
+    async def get(self, request, group_id):
+        strategy = request.GET.get('strategy', DEFAULT_STRATEGY)
+        if strategy not in STRATEGIES:
+            return JsonResponse({"error": f"Unknown strategy '{strategy}'", "choices": sorted(STRATEGIES)}, status=400)
+        if not await Group.objects.filter(id=group_id).aexists():
+            return JsonResponse({"error": "Group not found"}, status=404)
+        last_event_id = request.headers.get('Last-Event-ID')
+        response = StreamingHttpResponse(self.events(group_id, strategy, last_event_id), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'  # nginx: pass events through as they come
+        return response
 
-def dashboard(request):
-    context = {
-        'group_count': Group.objects.count(),
-        'user_count': User.objects.count(),
-        'recent_expenses': Expense.objects.order_by('-created_at')[:5],
-    }
-    return render(request, 'dashboard.html', context)
+    async def events(self, group_id, strategy, last_event_id=None):
+        heartbeat = getattr(settings, 'BALANCE_STREAM_HEARTBEAT', 15)
+        encoder = JSONEncoder(separators=(',', ':'))
+        # Subscribe before the first read so no commit slips in between
+        with balance_events.subscribe(group_id) as subscription:
+            while True:
+                # Straight after a commit a replica may not have it yet
+                with db_router.pinned_to_primary():
+                    etag = (await agroup_balances_etag(group_id, strategy)).strip('"')
+                    result = await agroup_balances(group_id, strategy) if etag != last_event_id else None
+                if result is not None:
+                    if "error" in result:
+                        yield f"event: error\ndata: {encoder.encode(result)}\n\n"
+                        return
+                    yield f"event: balances\nid: {etag}\ndata: {encoder.encode(result)}\n\n"
+                    last_event_id = etag
+                while not await subscription.wait(heartbeat):
+                    yield ": keepalive\n\n"
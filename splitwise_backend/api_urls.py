@@ -0,0 +1,6 @@
+"""URL configuration for API-only workers (``settings_api``): no admin, no HTML pages."""
+from django.urls import path, include
+
+urlpatterns = [
+    path('api/', include('core.api_urls')),
+]
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -43,6 +44,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.QueryMetricsMiddleware',
+    'core.middleware.ReplicaStickinessMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -54,6 +57,10 @@ MIDDLEWARE = [
 
 ROOT_URLCONF = 'splitwise_backend.urls'
 
+# Request instrumentation (core.middleware.QueryMetricsMiddleware)
+SLOW_REQUEST_THRESHOLD_MS = int(os.environ.get('SLOW_REQUEST_THRESHOLD_MS', 500))
+DUPLICATE_QUERY_THRESHOLD = int(os.environ.get('DUPLICATE_QUERY_THRESHOLD', 5))
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
@@ -75,12 +82,114 @@ WSGI_APPLICATION = 'splitwise_backend.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# Persistent connections: DB_CONN_MAX_AGE is in seconds (0 closes the
+# connection after every request, "none" keeps it forever) and
+# DB_CONN_HEALTH_CHECKS pings a reused connection before the request uses it.
+
+def _conn_max_age(value):
+    return None if value.lower() == 'none' else int(value)
+
+
+DB_CONN_MAX_AGE = _conn_max_age(os.environ.get('DB_CONN_MAX_AGE', '0'))
+DB_CONN_HEALTH_CHECKS = os.environ.get('DB_CONN_HEALTH_CHECKS', '').lower() in ('1', 'true', 'yes')
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+        'CONN_HEALTH_CHECKS': DB_CONN_HEALTH_CHECKS,
+    }
+}
+
+# SQLite production profile (SQLITE_PROFILE=production). WAL lets readers
+# run alongside the single writer, synchronous=NORMAL is durable enough
+# under WAL, and BEGIN IMMEDIATE takes the write lock when a transaction
+# starts, so concurrent writers queue on busy_timeout instead of failing
+# when a read lock cannot be upgraded. Lock errors that still happen are
+# retried by core.retry.retry_on_locked.
+SQLITE_PROFILE = os.environ.get('SQLITE_PROFILE', 'default')
+SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000))
+SQLITE_PRODUCTION_OPTIONS = {
+    'transaction_mode': 'IMMEDIATE',
+    'init_command': (
+        'PRAGMA journal_mode=WAL;'
+        'PRAGMA synchronous=NORMAL;'
+        f'PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS};'
+        'PRAGMA mmap_size=268435456;'
+        'PRAGMA cache_size=-20000;'
+        'PRAGMA temp_store=MEMORY;'
+    ),
+}
+if SQLITE_PROFILE == 'production':
+    DATABASES['default']['OPTIONS'] = SQLITE_PRODUCTION_OPTIONS
+
+DB_LOCK_RETRIES = int(os.environ.get('DB_LOCK_RETRIES', 5))
+DB_LOCK_RETRY_DELAY_MS = int(os.environ.get('DB_LOCK_RETRY_DELAY_MS', 20))
+
+# A running job refreshes its heartbeat every JOB_HEARTBEAT_SECONDS; one
+# with no heartbeat for JOB_LEASE_SECONDS has lost its worker (core.jobs)
+JOB_HEARTBEAT_SECONDS = int(os.environ.get('JOB_HEARTBEAT_SECONDS', 30))
+JOB_LEASE_SECONDS = int(os.environ.get('JOB_LEASE_SECONDS', 300))
+
+# Read replica for balance reads (core.db_router). Locally, point
+# DATABASE_REPLICA_NAME at a second SQLite file and refresh it from the
+# primary with `manage.py sync_replica`. Tests mirror it onto the default
+# test database.
+if os.environ.get('DATABASE_REPLICA_NAME'):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'NAME': os.environ['DATABASE_REPLICA_NAME'],
+        'TEST': {'MIRROR': 'default'},
     }
+
+DATABASE_ROUTERS = ['core.db_router.ReplicaRouter']
+
+# Clients that wrote are read from the primary for this long (read-your-writes)
+REPLICA_STICKY_COOKIE = 'pin_primary'
+REPLICA_STICKY_SECONDS = int(os.environ.get('REPLICA_STICKY_SECONDS', 10))
+# Balances computed from the replica may lag the primary, so they are cached
+# apart from primary results and only this long
+REPLICA_CACHE_TIMEOUT = int(os.environ.get('REPLICA_CACHE_TIMEOUT', 30))
+
+
+# Caches
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Computed balances live in their own alias so they can be moved to a shared
+# backend (e.g. django.core.cache.backends.redis.RedisCache) independently.
+
+BALANCE_CACHE_BACKEND = os.environ.get('BALANCE_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache')
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'balances': {
+        'BACKEND': BALANCE_CACHE_BACKEND,
+        'LOCATION': os.environ.get('BALANCE_CACHE_LOCATION', 'balances'),
+        'TIMEOUT': int(os.environ.get('BALANCE_CACHE_TIMEOUT', 300)),
+    },
 }
+if BALANCE_CACHE_BACKEND.endswith('LocMemCache'):
+    CACHES['balances']['OPTIONS'] = {'MAX_ENTRIES': 10000}
+
+BALANCE_CACHE_ALIAS = 'balances'
+BALANCE_CACHE_TIMEOUT = CACHES['balances']['TIMEOUT']
+
+# Balance change notifications for /api/groups/<id>/balances/stream/
+# (core.balance_events). The local broker only sees this process's commits;
+# with several processes use core.balance_events.CacheBroker and a shared
+# balance cache backend.
+BALANCE_EVENTS_BACKEND = os.environ.get('BALANCE_EVENTS_BACKEND', 'core.balance_events.LocalBroker')
+BALANCE_EVENTS_POLL_INTERVAL = float(os.environ.get('BALANCE_EVENTS_POLL_INTERVAL', 1.0))
+BALANCE_STREAM_HEARTBEAT = int(os.environ.get('BALANCE_STREAM_HEARTBEAT', 15))
+
+# Balance history snapshots stay this many seconds behind now, longer than
+# any write transaction, so no event commits behind one (core.history)
+HISTORY_SETTLE_SECONDS = int(os.environ.get('HISTORY_SETTLE_SECONDS', 60))
+
+# How often each process checks the database for newly loaded FX rates (core.fx)
+FX_VERSION_CHECK_SECONDS = float(os.environ.get('FX_VERSION_CHECK_SECONDS', 1))
 
 
 # Password validation
@@ -0,0 +1,44 @@
+"""
+API-only settings for workers that serve nothing but the JSON API.
+
+Everything comes from ``settings.py`` except the parts only the HTML
+pages and the admin need: the admin, sessions, messages, static files,
+``widget_tweaks`` and the template engines are dropped, the URLconf only
+routes ``/api/`` JSON endpoints, and DRF renders JSON alone (the
+browsable API is template based). Select it with
+``DJANGO_SETTINGS_MODULE=splitwise_backend.settings_api``; ``manage.py
+startup_profile`` compares its cold start with the full profile.
+"""
+
+from .settings import *  # noqa: F401,F403
+from .settings import INSTALLED_APPS, MIDDLEWARE
+
+_HTML_ONLY_APPS = {
+    'django.contrib.admin',
+    'django.contrib.sessions',
+    'django.contrib.messages',
+    'django.contrib.staticfiles',
+    'widget_tweaks',
+}
+INSTALLED_APPS = [app for app in INSTALLED_APPS if app not in _HTML_ONLY_APPS]
+
+# API views are CSRF exempt and authenticate with HTTP Basic, so the
+# session, CSRF, messages and framing middleware have nothing to do
+_HTML_ONLY_MIDDLEWARE = {
+    'django.contrib.sessions.middleware.SessionMiddleware',
+    'django.middleware.csrf.CsrfViewMiddleware',
+    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'django.contrib.messages.middleware.MessageMiddleware',
+    'django.middleware.clickjacking.XFrameOptionsMiddleware',
+}
+MIDDLEWARE = [name for name in MIDDLEWARE if name not in _HTML_ONLY_MIDDLEWARE]
+
+ROOT_URLCONF = 'splitwise_backend.api_urls'
+
+TEMPLATES = []
+
+REST_FRAMEWORK = {
+    'DEFAULT_RENDERER_CLASSES': ['rest_framework.renderers.JSONRenderer'],
+    'DEFAULT_AUTHENTICATION_CLASSES': ['rest_framework.authentication.BasicAuthentication'],
+    'UNAUTHENTICATED_USER': None,
+}